@@ -0,0 +1,380 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional
+
+from app.config import settings
+from app.guest import Guest
+from app.inventory import InventorySnapshot, inventory
+from app.proxmox import ProxmoxAPI
+
+logger = logging.getLogger(__name__)
+
+# Агент только что запущенной VM ещё не отвечает — не тревожим первые минуты
+AGENT_BOOT_GRACE = 300
+# Как долго помнить, включён ли агент в конфигурации VM, секунды
+AGENT_CONFIG_TTL = 3600.0
+# Лимиты Telegram: сообщение в чат не чаще раза в секунду, всего — 30 в секунду
+PER_CHAT_INTERVAL = 1.0
+GLOBAL_INTERVAL = 1 / 30
+# Сколько уведомлений склеивать в одно сообщение и предельная длина сообщения
+BATCH_SIZE = 20
+MESSAGE_LIMIT = 4000
+
+
+@dataclass
+class AlertState:
+    """Состояние правила для одного объекта: активна ли тревога и счётчики подряд идущих выборок."""
+
+    active: bool = False
+    hits: int = 0
+    misses: int = 0
+
+
+class AlertSender:
+    """Очередь отправки уведомлений всем чатам администраторов с учётом лимитов Telegram.
+
+    Очередь ограничена: при переполнении выбрасываются самые старые
+    уведомления, а в следующем сообщении указывается, сколько пропущено.
+    Накопившиеся уведомления склеиваются в одно сообщение.
+    """
+
+    def __init__(
+        self,
+        send: Optional[Callable[[str, str], Awaitable]] = None,
+        chats: Optional[list[str]] = None,
+        maxsize: int = 1000,
+    ):
+        self.send = send
+        self.chats = chats or []
+        self.queue: asyncio.Queue[str] = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+        self.sent = 0
+        self._next_chat: dict[str, float] = {}
+        self._next_global = 0.0
+        self._carry: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def enqueue(self, text: str):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(text)
+
+    def _drain(self, first: str) -> str:
+        """Склеить первое уведомление с уже ожидающими (не ждёт новых)."""
+        lines = [first]
+        size = len(first)
+        while len(lines) < BATCH_SIZE and (self._carry or not self.queue.empty()):
+            text = self._carry or self.queue.get_nowait()
+            self._carry = None
+            if size + len(text) + 1 > MESSAGE_LIMIT:
+                # Не влезает — уйдёт первым в следующем сообщении
+                self._carry = text
+                break
+            lines.append(text)
+            size += len(text) + 1
+        if self.dropped:
+            lines.append(f"⚠️ Пропущено уведомлений: {self.dropped}")
+            self.dropped = 0
+        return "\n".join(lines)
+
+    async def _deliver(self, chat: str, text: str):
+        loop = asyncio.get_running_loop()
+        for _ in range(3):
+            now = loop.time()
+            wait = max(self._next_chat.get(chat, 0.0), self._next_global) - now
+            if wait > 0:
+                await asyncio.sleep(wait)
+            now = loop.time()
+            self._next_global = now + GLOBAL_INTERVAL
+            self._next_chat[chat] = now + PER_CHAT_INTERVAL
+            try:
+                await self.send(chat, text)
+                self.sent += 1
+                return
+            except Exception as e:
+                # TelegramRetryAfter говорит, сколько ждать
+                retry_after = getattr(e, "retry_after", None)
+                if retry_after is None:
+                    logger.error(f"Alerts: failed to send to {chat}: {e}")
+                    return
+                self._next_chat[chat] = loop.time() + retry_after
+        logger.error(f"Alerts: giving up on {chat} after rate limiting")
+
+    async def _run(self):
+        while True:
+            first, self._carry = self._carry, None
+            text = self._drain(first or await self.queue.get())
+            if self.send is None:
+                continue
+            for chat in self.chats:
+                await self._deliver(chat, text)
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+def _title(guest: Guest) -> str:
+    return f"{'VM' if guest.type == 'qemu' else 'LXC'} <b>{guest.name}</b> ({guest.vmid})"
+
+
+def _percent(used: int, total: int) -> Optional[float]:
+    return used * 100 / total if total else None
+
+
+class AlertManager:
+    """Фоновая проверка правил по снимку инвентаря с гистерезисом и дедупликацией.
+
+    Тревога срабатывает, когда значение не ниже порога ``samples`` выборок
+    подряд, и снимается, когда оно опускается ниже ``порог - hysteresis``
+    столько же выборок подряд; между ними состояние не меняется. Об одной
+    тревоге приходит ровно два уведомления — о срабатывании и о снятии.
+    Смена статуса гостя или ноды сообщается, когда новый статус держится
+    ``samples`` выборок (короткий перезапуск не будит администраторов).
+    """
+
+    def __init__(
+        self,
+        proxmox: ProxmoxAPI,
+        sender: AlertSender,
+        interval: float = 60.0,
+        memory_percent: float = 90.0,
+        disk_percent: float = 90.0,
+        hysteresis: float = 5.0,
+        samples: int = 2,
+        agent_check: bool = True,
+        concurrency: int = 5,
+    ):
+        self.proxmox = proxmox
+        self.sender = sender
+        self.interval = interval
+        self.memory_percent = memory_percent
+        self.disk_percent = disk_percent
+        self.hysteresis = hysteresis
+        self.samples = max(1, samples)
+        self.agent_check = agent_check
+        self.concurrency = concurrency
+        self.states: dict[tuple, AlertState] = {}
+        # Последний сообщённый статус и кандидат на смену: ключ -> (статус, выборок подряд)
+        self.statuses: dict[tuple, str] = {}
+        self._status_pending: dict[tuple, tuple[str, int]] = {}
+        # vmid -> (включён ли агент в конфигурации, когда проверено)
+        self._agent_configs: dict[int, tuple[bool, float]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    # === Правила ===
+    def _observe(self, key: tuple, breached: Optional[bool]) -> Optional[bool]:
+        """Учесть выборку; True — тревога сработала, False — снята, None — без изменений.
+
+        ``breached=None`` — значение в полосе гистерезиса: счётчики сбрасываются.
+        """
+        state = self.states.setdefault(key, AlertState())
+        if breached is None:
+            state.hits = state.misses = 0
+            return None
+        if breached:
+            state.hits, state.misses = state.hits + 1, 0
+            if not state.active and state.hits >= self.samples:
+                state.active = True
+                return True
+        else:
+            state.hits, state.misses = 0, state.misses + 1
+            if state.active and state.misses >= self.samples:
+                state.active = False
+                return False
+        return None
+
+    def _threshold(self, key: tuple, value: Optional[float], limit: float) -> Optional[bool]:
+        if value is None:
+            return None
+        if value >= limit:
+            return self._observe(key, True)
+        if value < limit - self.hysteresis:
+            return self._observe(key, False)
+        return self._observe(key, None)
+
+    def _status(self, key: tuple, status: str) -> Optional[str]:
+        """Вернуть прежний статус, если смена подтвердилась ``samples`` выборками."""
+        previous = self.statuses.get(key)
+        if previous is None:
+            # Первая выборка — точка отсчёта, без уведомлений
+            self.statuses[key] = status
+            return None
+        if status == previous:
+            self._status_pending.pop(key, None)
+            return None
+        candidate, count = self._status_pending.get(key, (status, 0))
+        count = count + 1 if candidate == status else 1
+        if count < self.samples:
+            self._status_pending[key] = (status, count)
+            return None
+        self._status_pending.pop(key, None)
+        self.statuses[key] = status
+        return previous
+
+    def evaluate(self, snapshot: InventorySnapshot, agents: dict[int, bool]) -> list[str]:
+        """Проверить все правила по снимку; ``agents`` — vmid -> отвечает ли агент."""
+        messages = []
+        seen: set[tuple] = set()
+
+        for item in snapshot.nodes:
+            key = ("node", item.get("node"))
+            seen.add(key)
+            previous = self._status(key, item.get("status") or "unknown")
+            if previous is not None:
+                icon = "🟢" if self.statuses[key] == "online" else "🔴"
+                messages.append(f"{icon} Нода <b>{key[1]}</b>: {previous} → {self.statuses[key]}")
+
+        for guest in snapshot.guests():
+            if guest.template:
+                continue
+            title = _title(guest)
+            key = ("status", guest.vmid)
+            seen.add(key)
+            previous = self._status(key, guest.status)
+            if previous is not None:
+                icon = "🟢" if guest.running else "🔴"
+                messages.append(f"{icon} {title}: {previous} → {guest.status}")
+            if not guest.running:
+                continue
+
+            memory = _percent(guest.mem, guest.maxmem)
+            key = ("memory", guest.vmid)
+            seen.add(key)
+            fired = self._threshold(key, memory, self.memory_percent)
+            if fired is not None:
+                messages.append(
+                    f"🔴 {title}: память {memory:.0f}% (порог {self.memory_percent:g}%)" if fired
+                    else f"🟢 {title}: память {memory:.0f}% — в норме"
+                )
+
+            # У VM Proxmox не знает заполненность диска (disk=0), у LXC — знает
+            disk = _percent(guest.disk, guest.maxdisk) if guest.disk else None
+            key = ("disk", guest.vmid)
+            seen.add(key)
+            fired = self._threshold(key, disk, self.disk_percent)
+            if fired is not None:
+                messages.append(
+                    f"🔴 {title}: диск заполнен на {disk:.0f}% (порог {self.disk_percent:g}%)" if fired
+                    else f"🟢 {title}: диск {disk:.0f}% — в норме"
+                )
+
+            if guest.vmid in agents:
+                key = ("agent", guest.vmid)
+                seen.add(key)
+                fired = self._observe(key, not agents[guest.vmid])
+                if fired is not None:
+                    messages.append(
+                        f"🔴 {title}: qemu-guest-agent не отвечает" if fired
+                        else f"🟢 {title}: qemu-guest-agent снова отвечает"
+                    )
+
+        storages = {}
+        for item in snapshot.storages:
+            # Общее хранилище Proxmox показывает на каждой ноде — проверяем один раз
+            name = item.get("storage")
+            storages.setdefault(name if item.get("shared") else (item.get("node"), name), item)
+        for ident, item in storages.items():
+            usage = _percent(int(item.get("disk") or 0), int(item.get("maxdisk") or 0))
+            key = ("storage", ident)
+            seen.add(key)
+            fired = self._threshold(key, usage, self.disk_percent)
+            if fired is not None:
+                where = "" if item.get("shared") else f" на {item.get('node')}"
+                messages.append(
+                    f"🔴 Хранилище <b>{item.get('storage')}</b>{where}: занято {usage:.0f}%" if fired
+                    else f"🟢 Хранилище <b>{item.get('storage')}</b>{where}: {usage:.0f}% — в норме"
+                )
+
+        # Гость остановлен или удалён — его тревоги снимаются без уведомлений
+        # (об остановке уже сообщило правило статуса)
+        for key in set(self.states) - seen:
+            del self.states[key]
+        for key in set(self.statuses) - seen:
+            self.statuses.pop(key, None)
+            self._status_pending.pop(key, None)
+        return messages
+
+    # === Агент ===
+    async def _agent_enabled(self, guest: Guest, now: float) -> bool:
+        cached = self._agent_configs.get(guest.vmid)
+        if cached is not None and now - cached[1] < AGENT_CONFIG_TTL:
+            return cached[0]
+        config = await self.proxmox.get_vm_config(guest.vmid, "qemu", node=guest.node)
+        # agent: "1" или "enabled=1,fstrim_cloned_disks=1"
+        value = str(config.get("agent", "0")).split(",")[0].removeprefix("enabled=")
+        enabled = value in ("1", "true", "on", "yes")
+        self._agent_configs[guest.vmid] = (enabled, now)
+        return enabled
+
+    async def check_agents(self, snapshot: InventorySnapshot) -> dict[int, bool]:
+        """vmid -> отвечает ли агент, для работающих VM с включённым агентом."""
+        now = time.time()
+        limit = asyncio.Semaphore(self.concurrency)
+        result: dict[int, bool] = {}
+
+        async def one(guest: Guest):
+            async with limit:
+                try:
+                    if await self._agent_enabled(guest, now):
+                        result[guest.vmid] = await self.proxmox.agent_ping(guest.vmid, node=guest.node)
+                except Exception as e:
+                    logger.debug(f"Alerts: failed to check agent of {guest.vmid}: {e}")
+
+        guests = [
+            g for g in snapshot.guests("qemu")
+            if g.running and not g.template and g.uptime >= AGENT_BOOT_GRACE
+        ]
+        await asyncio.gather(*(one(g) for g in guests))
+        for vmid in set(self._agent_configs) - set(snapshot.by_vmid):
+            del self._agent_configs[vmid]
+        return result
+
+    # === Цикл ===
+    async def sample(self):
+        """Одна выборка: проверить правила и поставить уведомления в очередь."""
+        snapshot = await inventory.snapshot()
+        agents = await self.check_agents(snapshot) if self.agent_check else {}
+        for message in self.evaluate(snapshot, agents):
+            self.sender.enqueue(message)
+
+    async def _run(self):
+        while True:
+            try:
+                await self.sample()
+            except Exception as e:
+                logger.error(f"Alert sampling failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def start(self):
+        await self.sender.start()
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.sender.stop()
+
+
+alert_manager = AlertManager(
+    ProxmoxAPI(),
+    AlertSender(),
+    interval=settings.ALERTS_INTERVAL,
+    memory_percent=settings.ALERT_MEMORY_PERCENT,
+    disk_percent=settings.ALERT_DISK_PERCENT,
+    hysteresis=settings.ALERT_HYSTERESIS,
+    samples=settings.ALERT_SAMPLES,
+    agent_check=settings.ALERT_AGENT_CHECK,
+)
@@ -0,0 +1,179 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy import insert
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models import AuditEvent
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class AuditRecord:
+    """Событие журнала до записи в БД; ``time`` — момент действия, а не вставки."""
+
+    action: str
+    actor: str
+    source: str  # api, bot, idle
+    vmid: Optional[int] = None
+    type: Optional[str] = None
+    status: str = "ok"  # ok, failed
+    detail: dict = field(default_factory=dict)
+    time: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+
+    def row(self) -> dict:
+        return {
+            "time": self.time,
+            "actor": self.actor,
+            "source": self.source,
+            "action": self.action,
+            "vmid": self.vmid,
+            "type": self.type,
+            "status": self.status,
+            "detail": self.detail or None,
+        }
+
+
+class AuditLog:
+    """Журнал действий с гостями с отложенной записью.
+
+    Обработчики кладут события в очередь в памяти и не ждут БД; фоновая
+    задача забирает их пачками до ``batch_size`` (или сколько накопилось за
+    ``flush_interval``) и пишет одним многострочным INSERT. Очередь
+    ограничена: ``record`` при заполненной очереди ждёт место до
+    ``put_timeout``, ``emit`` (для синхронного кода) не ждёт — в обоих
+    случаях непоместившееся событие отбрасывается и считается в ``dropped``.
+    При остановке очередь дописывается до конца.
+    """
+
+    def __init__(
+        self,
+        queue_size: int = 10000,
+        batch_size: int = 500,
+        flush_interval: float = 1.0,
+        put_timeout: float = 1.0,
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self.written = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def _drop(self, record: AuditRecord):
+        self.dropped += 1
+        # При перегрузке не заваливаем лог: первое и каждое тысячное
+        if self.dropped == 1 or self.dropped % 1000 == 0:
+            logger.warning(f"Audit queue full, dropped {record.action} of {record.vmid} ({self.dropped} total)")
+
+    def emit(self, action: str, actor: str, source: str, vmid: Optional[int] = None,
+             type_: Optional[str] = None, status: str = "ok", **detail):
+        """Записать событие без ожидания (если очередь заполнена — отбросить)."""
+        record = AuditRecord(action, actor, source, vmid, type_, status, detail)
+        try:
+            self.queue.put_nowait(record)
+        except asyncio.QueueFull:
+            self._drop(record)
+
+    async def record(self, action: str, actor: str, source: str, vmid: Optional[int] = None,
+                     type_: Optional[str] = None, status: str = "ok", **detail):
+        """Записать событие; при заполненной очереди подождать, пока писатель её разгрузит."""
+        record = AuditRecord(action, actor, source, vmid, type_, status, detail)
+        try:
+            await asyncio.wait_for(self.queue.put(record), timeout=self.put_timeout)
+        except asyncio.TimeoutError:
+            self._drop(record)
+
+    @asynccontextmanager
+    async def track(self, action: str, actor: str, source: str, vmid: Optional[int] = None,
+                    type_: Optional[str] = None, **detail):
+        """Записать событие по завершении блока: ``ok`` или ``failed`` с текстом ошибки.
+
+        Блок получает ``AuditRecord`` и может дополнить его (например, vmid
+        созданного гостя).
+        """
+        record = AuditRecord(action, actor, source, vmid, type_, detail=detail)
+        try:
+            yield record
+        except Exception as e:
+            record.status = "failed"
+            record.detail["error"] = str(e)
+            raise
+        finally:
+            try:
+                await asyncio.wait_for(self.queue.put(record), timeout=self.put_timeout)
+            except asyncio.TimeoutError:
+                self._drop(record)
+
+    async def _write(self, batch: list[AuditRecord]):
+        async with SessionLocal() as db:
+            await db.execute(insert(AuditEvent).values([r.row() for r in batch]))
+            await db.commit()
+        self.written += len(batch)
+
+    async def _flush(self, batch: list[AuditRecord]):
+        # БД может быть недолго недоступна — несколько попыток, затем пачка теряется
+        for attempt in range(3):
+            try:
+                await self._write(batch)
+                return
+            except Exception as e:
+                logger.error(f"Failed to write {len(batch)} audit events (attempt {attempt + 1}): {e}")
+                await asyncio.sleep(2 ** attempt)
+        self.dropped += len(batch)
+
+    async def _run(self):
+        while True:
+            record = await self.queue.get()
+            if record is None:
+                return
+            # Дать событиям накопиться, чтобы писать пачкой, а не по одному
+            if self.queue.qsize() < self.batch_size:
+                await asyncio.sleep(self.flush_interval)
+            batch = [record]
+            closing = False
+            while len(batch) < self.batch_size and not self.queue.empty():
+                record = self.queue.get_nowait()
+                if record is None:
+                    closing = True
+                    break
+                batch.append(record)
+            await self._flush(batch)
+            if closing:
+                return
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 10.0):
+        """Дописать накопившиеся события и остановить писателя."""
+        if self._task is None:
+            return
+
+        async def drain():
+            # Метка конца встаёт в очередь за всеми событиями
+            await self.queue.put(None)
+            await self._task
+
+        try:
+            await asyncio.wait_for(drain(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"Audit writer did not finish in {timeout:.0f}s, {self.queue.qsize()} events lost")
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+
+audit = AuditLog(
+    queue_size=settings.AUDIT_QUEUE_SIZE,
+    batch_size=settings.AUDIT_BATCH_SIZE,
+    flush_interval=settings.AUDIT_FLUSH_INTERVAL,
+)
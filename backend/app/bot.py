@@ -1,16 +1,30 @@
 import asyncio
 import logging
+import time
+from typing import Optional
 from aiogram import Bot, Dispatcher, F
-from aiogram.types import Message, CallbackQuery
-from aiogram.filters import Command
+from aiogram.types import Message, CallbackQuery, InlineQuery
+from aiogram.types import InlineQueryResultArticle, InputTextMessageContent
+from aiogram.filters import Command, CommandObject
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
-from sqlalchemy import select
 from app.config import settings
-from app.proxmox import ProxmoxAPI
-from app.database import SessionLocal
-from app.models import VM
+from app.proxmox import ProxmoxAPI, ProxmoxUnavailable, close_clients
+from app.inventory import inventory
+from app.inventory_store import InventoryStore, cache_path
+from app.capacity import capacity_report
+from app.idle import IdleVerdict, idle_scheduler
+from app.alerts import alert_manager
+from app.progress import ProgressMessage
+from app.locks import GuestBusy, guest_locks
+from app.audit import audit
+from app.guest_records import guest_records
+from app.guest import Guest
+from app.provisioning import start_batch
+from app.schemas import VMBatchCreate
+from app.search import GuestSearchIndex
 
 # Настройка логирования
 logging.basicConfig(
@@ -27,6 +41,7 @@ proxmox = ProxmoxAPI()
 
 # === Машина состояний для создания VM ===
 class VMCreate(StatesGroup):
+    waiting_for_count = State()
     waiting_for_name = State()
     waiting_for_iso = State()
     waiting_for_cpu = State()
@@ -36,6 +51,7 @@ class VMCreate(StatesGroup):
 
 # === Машина состояний для создания LXC ===
 class LXCCreate(StatesGroup):
+    waiting_for_count = State()
     waiting_for_name = State()
     waiting_for_template = State()
     waiting_for_cpu = State()
@@ -47,6 +63,21 @@ class LXCCreate(StatesGroup):
 vm_data = {}
 # Хранилище шаблонов для LXC (временное)
 lxc_templates_cache = {}
+# Снимки списков гостей по чатам: chat_id -> {"qemu": [...], "lxc": [...]}
+# Листание страниц работает по снимку и не ходит в Proxmox
+list_snapshots: dict[int, dict[str, list]] = {}
+LIST_PAGE_SIZE = 10
+# Индекс inline-поиска и фоновое обновление IP в нём
+search_index = GuestSearchIndex()
+search_ip_task: Optional[asyncio.Task] = None
+# Снимок инвентаря между перезапусками бота (конфигурации бот не кэширует)
+inventory_store = InventoryStore(
+    inventory, None, None, cache_path("bot"), max_age=settings.INVENTORY_CACHE_MAX_AGE
+)
+# Telegram ждёт ответ на inline-запрос недолго — обновление снимка ограничиваем
+INLINE_REFRESH_TIMEOUT = 2.0
+# Сводка ёмкости в главном меню не должна задерживать ответ, если Proxmox тормозит
+MENU_CAPACITY_TIMEOUT = 2.0
 
 
 # === Клавиатуры ===
@@ -61,6 +92,10 @@ def get_main_keyboard() -> InlineKeyboardMarkup:
                 InlineKeyboardButton(text="📦 Список LXC", callback_data="list_lxc"),
                 InlineKeyboardButton(text="🐳 Создать LXC", callback_data="create_lxc_start"),
             ],
+            [
+                InlineKeyboardButton(text="⚡ VM ×N", callback_data="create_vm_batch"),
+                InlineKeyboardButton(text="🐳 LXC ×N", callback_data="create_lxc_batch"),
+            ],
             [
                 InlineKeyboardButton(text="🔄 Обновить", callback_data="refresh"),
             ],
@@ -68,19 +103,32 @@ def get_main_keyboard() -> InlineKeyboardMarkup:
     )
 
 
-async def get_iso_keyboard() -> InlineKeyboardMarkup:
-    """Клавиатура с ISO образами."""
-    isos = await proxmox.get_iso_images("local")
+async def get_iso_keyboard(templates_only: bool = False) -> InlineKeyboardMarkup:
+    """Клавиатура источника VM: cloud-init шаблоны (быстро) и ISO образы."""
+    try:
+        templates = await proxmox.get_vm_templates()
+    except Exception as e:
+        logger.error(f"Failed to get VM templates: {e}")
+        templates = []
+    # Массовое создание — только из шаблонов: ISO требует ручной установки ОС
+    isos = [] if templates_only else await proxmox.get_iso_images("local")
     
-    if not isos:
+    if not templates and not isos:
         return InlineKeyboardMarkup(
             inline_keyboard=[
-                [InlineKeyboardButton(text="❌ Нет ISO образов", callback_data="no_iso")],
+                [InlineKeyboardButton(
+                    text="❌ Нет шаблонов VM" if templates_only else "❌ Нет ISO образов",
+                    callback_data="no_iso"
+                )],
                 [InlineKeyboardButton(text="❌ Отмена", callback_data="cancel_create")],
             ]
         )
     
     keyboard = []
+    for tmpl in templates:
+        keyboard.append([InlineKeyboardButton(
+            text=f"⚡ {tmpl.name[:30]} (шаблон)", callback_data=f"vm_tmpl_{tmpl.vmid}"
+        )])
     for iso in isos:
         name = iso["name"][:30]  # Обрезаем длинные имена
         keyboard.append([InlineKeyboardButton(text=f"💿 {name}", callback_data=f"iso_{iso['volid']}")])
@@ -169,36 +217,48 @@ def get_lxc_keyboard(vmid: int) -> InlineKeyboardMarkup:
     )
 
 
-def get_vm_list_keyboard(vms: list) -> InlineKeyboardMarkup:
-    """Клавиатура со списком VM для выбора."""
+def get_guest_list_keyboard(guests: list, type_: str, page: int) -> InlineKeyboardMarkup:
+    """Клавиатура с одной страницей списка гостей и навигацией по страницам."""
+    prefix = "vm" if type_ == "qemu" else "lxc"
+    pages = max(1, -(-len(guests) // LIST_PAGE_SIZE))
     keyboard = []
-    for vm in vms[:10]:  # Максимум 10 VM
-        vmid = vm.get("vmid", 0)
-        name = vm.get("name", f"vm-{vmid}")
-        status = vm.get("status", "unknown")
-        status_icon = "🟢" if status == "running" else "🔴"
+    for guest in guests[page * LIST_PAGE_SIZE:(page + 1) * LIST_PAGE_SIZE]:
+        status_icon = "🟢" if guest.running else "🔴"
         keyboard.append([
-            InlineKeyboardButton(text=f"{status_icon} {vmid} | {name}", callback_data=f"vm_info_{vmid}")
+            InlineKeyboardButton(
+                text=f"{status_icon} {guest.vmid} | {guest.name}", callback_data=f"{prefix}_info_{guest.vmid}"
+            )
         ])
-    keyboard.append([InlineKeyboardButton(text="🔙 Назад", callback_data="refresh")])
-    return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
+    if pages > 1:
+        def nav(text: str, target: int) -> InlineKeyboardButton:
+            return InlineKeyboardButton(text=text, callback_data=f"list_page_{type_}_{target}")
 
-def get_lxc_list_keyboard(lxc_list: list) -> InlineKeyboardMarkup:
-    """Клавиатура со списком LXC для выбора."""
-    keyboard = []
-    for lxc in lxc_list[:10]:  # Максимум 10 LXC
-        vmid = lxc.get("vmid", 0)
-        name = lxc.get("name", f"lxc-{vmid}")
-        status = lxc.get("status", "unknown")
-        status_icon = "🟢" if status == "running" else "🔴"
         keyboard.append([
-            InlineKeyboardButton(text=f"{status_icon} {vmid} | {name}", callback_data=f"lxc_info_{vmid}")
+            nav("⏮", 0),
+            nav("◀️", max(page - 1, 0)),
+            InlineKeyboardButton(text=f"{page + 1}/{pages}", callback_data="noop"),
+            nav("▶️", min(page + 1, pages - 1)),
+            nav("⏭", pages - 1),
         ])
-    keyboard.append([InlineKeyboardButton(text="🔙 Назад", callback_data="refresh")])
+
+    keyboard.append([
+        InlineKeyboardButton(text="🔄 Обновить", callback_data=f"list_reload_{type_}"),
+        InlineKeyboardButton(text="🔙 Назад", callback_data="refresh"),
+    ])
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
 
+def get_vm_list_keyboard(vms: list, page: int = 0) -> InlineKeyboardMarkup:
+    """Клавиатура со списком VM для выбора."""
+    return get_guest_list_keyboard(vms, "qemu", page)
+
+
+def get_lxc_list_keyboard(lxc_list: list, page: int = 0) -> InlineKeyboardMarkup:
+    """Клавиатура со списком LXC для выбора."""
+    return get_guest_list_keyboard(lxc_list, "lxc", page)
+
+
 def get_cancel_keyboard() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(
         inline_keyboard=[
@@ -208,9 +268,17 @@ def get_cancel_keyboard() -> InlineKeyboardMarkup:
 
 
 # === Проверка админа ===
+def get_admin_ids() -> list[str]:
+    return [x.strip() for x in str(settings.ADMIN_TELEGRAM_ID).split(",") if x.strip()]
+
+
 async def is_admin(user_id: int) -> bool:
-    admin_ids = [x.strip() for x in str(settings.ADMIN_TELEGRAM_ID).split(",")]
-    return str(user_id) in admin_ids
+    return str(user_id) in get_admin_ids()
+
+
+def audit_actor(user) -> str:
+    """Кто действует — для журнала действий."""
+    return f"tg:{user.id}"
 
 
 async def show_access_denied(target):
@@ -220,6 +288,142 @@ async def show_access_denied(target):
         await target.answer("⛔️ Access denied", show_alert=True)
 
 
+# === Недоступность Proxmox ===
+def stale_badge(always: bool = False) -> str:
+    """Пометка экрана, собранного из устаревшего снимка инвентаря; пусто, если данные свежие.
+
+    ``always`` — экран точно из снимка (живые данные получить не удалось).
+    """
+    snapshot = inventory.current
+    if snapshot is None or not (always or inventory.staleness() is not None):
+        return ""
+    fetched = time.localtime(time.time() - (time.monotonic() - snapshot.fetched_at))
+    return f"⚠️ Proxmox не отвечает, данные на {time.strftime('%H:%M:%S', fetched)}\n\n"
+
+
+# === Сводка ёмкости ===
+async def capacity_summary() -> str:
+    """Несколько строк о загрузке кластера для главного меню; пусто, если данных нет."""
+    try:
+        async with asyncio.timeout(MENU_CAPACITY_TIMEOUT):
+            snapshot = await inventory.snapshot()
+    except Exception as e:
+        logger.warning(f"Capacity summary unavailable: {e}")
+        return ""
+
+    report = capacity_report(snapshot)
+    cpu, memory, disk = (report["totals"][key] for key in ("cpu", "memory", "disk"))
+    gb = 1024 ** 3
+
+    def ratio(part, whole) -> str:
+        return f"{part / whole:.0%}" if part is not None and whole else "—"
+
+    lines = [f"📊 Гости: {report['running']} из {report['guests']} запущены"]
+    if cpu["capacity"]:
+        lines.append(
+            f"🖥 CPU: {cpu['allocated']} vCPU на {cpu['capacity']} ядер "
+            f"(×{cpu['overcommit'] or 0:.1f}), загрузка {ratio(cpu['used'], cpu['capacity'])}"
+        )
+    if memory["capacity"]:
+        lines.append(
+            f"🧠 RAM: выделено {memory['allocated'] / gb:.0f} из {memory['capacity'] / gb:.0f} ГБ, "
+            f"свободно {memory['headroom'] / gb:.0f} ГБ"
+        )
+    if disk["capacity"]:
+        lines.append(
+            f"💿 Диск: выделено {disk['allocated'] / gb:.0f} из {disk['capacity'] / gb:.0f} ГБ, "
+            f"занято {ratio(disk['used'], disk['capacity'])}"
+        )
+    return stale_badge() + "\n".join(lines) + "\n\n"
+
+
+# === Автовыключение простаивающих гостей ===
+def get_idle_keyboard(vmid: int) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [InlineKeyboardButton(text="⏸ Отложить", callback_data=f"idle_snooze_{vmid}")],
+            [InlineKeyboardButton(text="🚫 Никогда не выключать", callback_data=f"idle_keep_{vmid}")],
+            [InlineKeyboardButton(text="⏹ Выключить сейчас", callback_data=f"idle_off_{vmid}")],
+        ]
+    )
+
+
+def format_idle_load(verdict: IdleVerdict) -> str:
+    parts = []
+    if verdict.cpu is not None:
+        parts.append(f"CPU {verdict.cpu:.1%}")
+    if verdict.net is not None:
+        parts.append(f"сеть {verdict.net / 1024:.1f} КБ/с")
+    if verdict.disk is not None:
+        parts.append(f"диск {verdict.disk / 1024:.1f} КБ/с")
+    return ", ".join(parts) or "нет данных"
+
+
+async def notify_idle(event: str, guest: Guest, verdict: IdleVerdict):
+    """Уведомление администраторов о простаивающем или выключенном госте."""
+    kind = "VM" if guest.type == "qemu" else "LXC"
+    title = f"{kind} <b>{guest.name}</b> ({guest.vmid})"
+    hours = idle_scheduler.window / 3600
+    markup = None
+    if event == "idle":
+        text = (
+            f"💤 {title} простаивает {hours:g} ч\n"
+            f"📉 p95: {format_idle_load(verdict)}\n\n"
+            f"Будет выключена через {idle_scheduler.grace / 60:.0f} мин, если нагрузка не появится."
+        )
+        markup = get_idle_keyboard(guest.vmid)
+    elif event == "shutdown":
+        text = f"🌙 {title} выключена после {hours:g} ч простоя."
+    elif event == "stopped":
+        text = f"⏹️ {title} не ответила на штатное выключение и остановлена."
+    else:
+        text = f"❌ Не удалось выключить простаивающую {title}."
+    for admin_id in get_admin_ids():
+        await bot.send_message(admin_id, text, parse_mode="HTML", reply_markup=markup)
+
+
+@dp.callback_query(F.data.startswith("idle_"))
+async def cb_idle_action(callback: CallbackQuery):
+    if not await is_admin(callback.from_user.id):
+        return await show_access_denied(callback)
+
+    action, vmid = callback.data.removeprefix("idle_").rsplit("_", 1)
+    vmid = int(vmid)
+    try:
+        actor = audit_actor(callback.from_user)
+        if action == "snooze":
+            idle_scheduler.snooze(vmid)
+            await audit.record("idle-snooze", actor, "bot", vmid)
+            text = f"⏸ Выключение {vmid} отложено на {idle_scheduler.window / 3600:g} ч."
+        else:
+            guest = (await inventory.snapshot()).get(vmid)
+            if guest is None:
+                await callback.answer("Гость не найден", show_alert=True)
+                return
+            if action == "keep":
+                async with audit.track("idle-opt-out", actor, "bot", vmid, guest.type):
+                    await idle_scheduler.opt_out(guest)
+                text = f"🚫 {guest.name} ({vmid}) больше не будет выключаться автоматически."
+            else:
+                await callback.answer("⏳ Выключаю...")
+                idle_scheduler.pending.pop(vmid, None)
+                async with audit.track("shutdown", actor, "bot", vmid, guest.type) as event:
+                    result = await idle_scheduler.power_off(guest)
+                    event.detail["result"] = result
+                inventory.invalidate()
+                text = f"{'🌙' if result == 'shutdown' else '⏹️'} {guest.name} ({vmid}) выключена."
+        await callback.message.edit_reply_markup(reply_markup=None)
+        await callback.message.answer(text)
+    except Exception as e:
+        await callback.message.answer(f"❌ Ошибка: {e}")
+    await callback.answer()
+
+
+# === Оповещения ===
+async def send_alert(chat_id: str, text: str):
+    await bot.send_message(chat_id, text, parse_mode="HTML")
+
+
 # === Команды ===
 @dp.message(Command("start"))
 async def cmd_start(message: Message):
@@ -229,6 +433,7 @@ async def cmd_start(message: Message):
     await message.answer(
         f"👋 Привет, {message.from_user.first_name}!\n"
         "Я Proxmox Cloud Bot для управления VM.\n\n"
+        f"{await capacity_summary()}"
         "Выберите действие:",
         reply_markup=get_main_keyboard()
     )
@@ -244,12 +449,49 @@ async def cb_refresh(callback: CallbackQuery):
     await callback.message.answer(
         f"👋 Привет, {callback.from_user.first_name}!\n"
         "Я Proxmox Cloud Bot для управления VM.\n\n"
+        f"{await capacity_summary()}"
         "Выберите действие:",
         reply_markup=get_main_keyboard()
     )
     await callback.answer()
 
 
+# === Списки гостей ===
+async def load_list_snapshot(chat_id: int, type_: str) -> list:
+    """Снять список гостей из инвентаря и запомнить его для чата."""
+    snapshot = await inventory.snapshot()
+    guests = snapshot.guests(type_)
+    list_snapshots.setdefault(chat_id, {})[type_] = guests
+    return guests
+
+
+def render_list_page(type_: str, guests: list, page: int) -> tuple[str, InlineKeyboardMarkup]:
+    """Текст и клавиатура одной страницы списка."""
+    pages = max(1, -(-len(guests) // LIST_PAGE_SIZE))
+    page = min(max(page, 0), pages - 1)
+    if type_ == "qemu":
+        title, hint = "📋 <b>Список VM", "Нажмите на VM для подробной информации:"
+    else:
+        title, hint = "📦 <b>Список LXC", "Нажмите на контейнер для подробной информации:"
+
+    text = stale_badge() + f"{title}</b> (всего {len(guests)}, стр. {page + 1}/{pages}):\n\n"
+    for guest in guests[page * LIST_PAGE_SIZE:(page + 1) * LIST_PAGE_SIZE]:
+        status_icon = "🟢" if guest.running else "🔴"
+        text += f"{status_icon} <code>{guest.vmid}</code> - {guest.name} ({guest.status})\n"
+    text += f"\n<b>{hint}</b>"
+    return text, get_guest_list_keyboard(guests, type_, page)
+
+
+async def show_list_page(callback: CallbackQuery, type_: str, page: int, guests: list):
+    """Отредактировать сообщение со списком на месте."""
+    text, keyboard = render_list_page(type_, guests, page)
+    try:
+        await callback.message.edit_text(text, parse_mode="HTML", reply_markup=keyboard)
+    except TelegramBadRequest:
+        # Страница не изменилась (например, повторное нажатие ⏮ на первой)
+        pass
+
+
 # === Список VM ===
 @dp.callback_query(F.data == "list_vms")
 async def cb_list_vms(callback: CallbackQuery):
@@ -257,25 +499,14 @@ async def cb_list_vms(callback: CallbackQuery):
         return await show_access_denied(callback)
 
     try:
-        vms = await proxmox.list_vms("qemu")
+        vms = await load_list_snapshot(callback.message.chat.id, "qemu")
         if not vms:
             await callback.message.answer("📭 Нет активных VM.")
             await callback.answer()
             return
 
-        # Формируем текст списка
-        text = "📋 <b>Список VM:</b>\n\n"
-        for vm in vms:
-            vmid = vm.get("vmid", "?")
-            name = vm.get("name", f"vm-{vmid}")
-            status = vm.get("status", "unknown")
-            status_icon = "🟢" if status == "running" else "🔴"
-            text += f"{status_icon} <code>{vmid}</code> - {name} ({status})\n"
-
-        text += "\n<b>Нажмите на VM для подробной информации:</b>"
-
-        # Клавиатура со списком VM
-        await callback.message.answer(text, parse_mode="HTML", reply_markup=get_vm_list_keyboard(vms))
+        text, keyboard = render_list_page("qemu", vms, 0)
+        await callback.message.answer(text, parse_mode="HTML", reply_markup=keyboard)
     except Exception as e:
         logger.error(f"Failed to list VMs: {e}")
         await callback.message.answer(f"❌ Ошибка: {e}")
@@ -283,24 +514,116 @@ async def cb_list_vms(callback: CallbackQuery):
         await callback.answer()
 
 
-# === Информация о VM ===
-@dp.callback_query(F.data.startswith("vm_info_"))
-async def cb_vm_info(callback: CallbackQuery):
+# === Листание списков ===
+@dp.callback_query(F.data.startswith("list_page_"))
+async def cb_list_page(callback: CallbackQuery):
     if not await is_admin(callback.from_user.id):
         return await show_access_denied(callback)
 
-    vmid = int(callback.data.replace("vm_info_", ""))
-    
+    type_, page = callback.data.replace("list_page_", "").split("_")
+    chat_id = callback.message.chat.id
     try:
-        info = await proxmox.get_vm_full_info(vmid, "qemu")
-        
+        guests = list_snapshots.get(chat_id, {}).get(type_)
+        if guests is None:
+            # Снимок потерян (например, после перезапуска бота)
+            guests = await load_list_snapshot(chat_id, type_)
+        await show_list_page(callback, type_, int(page), guests)
+    except Exception as e:
+        logger.error(f"Failed to show list page: {e}")
+        await callback.message.answer(f"❌ Ошибка: {e}")
+    await callback.answer()
+
+
+@dp.callback_query(F.data.startswith("list_reload_"))
+async def cb_list_reload(callback: CallbackQuery):
+    if not await is_admin(callback.from_user.id):
+        return await show_access_denied(callback)
+
+    type_ = callback.data.replace("list_reload_", "")
+    try:
+        inventory.invalidate()
+        guests = await load_list_snapshot(callback.message.chat.id, type_)
+        await show_list_page(callback, type_, 0, guests)
+        await callback.answer("🔄 Список обновлён")
+    except Exception as e:
+        logger.error(f"Failed to reload list: {e}")
+        await callback.message.answer(f"❌ Ошибка: {e}")
+        await callback.answer()
+
+
+@dp.callback_query(F.data == "noop")
+async def cb_noop(callback: CallbackQuery):
+    await callback.answer()
+
+
+# === Информация о VM ===
+# Поля карточки гостя: хватает статуса и IP (параллельно), конфигурация не нужна
+CARD_FIELDS = ("name", "status", "uptime", "cpus", "mem", "maxmem", "disk", "maxdisk", "ip")
+
+
+async def load_card(vmid: int, type_: str) -> tuple[Optional[Guest], str]:
+    """Данные карточки гостя и пометка о них.
+
+    Если Proxmox недоступен или не отдал статус за ``inventory.refresh_timeout``,
+    гость берётся из последнего снимка инвентаря (без IP) с пометкой. Молчащий
+    агент к этому не приводит: IP просто не показывается.
+    """
+    if not inventory.degraded:
+        try:
+            info = await proxmox.fetch_guest(
+                vmid, type_, fields=CARD_FIELDS, timeout=inventory.refresh_timeout, ip_timeout=1
+            )
+            return info, ""
+        except (ProxmoxUnavailable, asyncio.TimeoutError):
+            pass
+        except Exception as e:
+            # Гостя нет или ошибка Proxmox — снимок тут не поможет
+            logger.error(f"Failed to get VM full info: {e}")
+            return None, ""
+    snapshot = inventory.current
+    guest = snapshot.get(vmid) if snapshot is not None else None
+    if guest is None or guest.type != type_:
+        return None, ""
+    return guest, stale_badge(always=True)
+
+
+async def guest_name(vmid: int, type_: str, record=None) -> str:
+    """Имя гостя без запроса к Proxmox.
+
+    Берётся из снимка инвентаря, затем из записи в БД (``record``, если уже
+    загружена); если нет ни того, ни другого — ``vm-<vmid>``/``lxc-<vmid>``.
+    """
+    snapshot = inventory.current
+    guest = snapshot.get(vmid) if snapshot is not None else None
+    if guest is not None and guest.name:
+        return guest.name
+    if record is None:
+        try:
+            record = await guest_records.get(vmid)
+        except Exception:
+            record = None
+    if record is not None and record.name:
+        return record.name
+    return f"{'vm' if type_ == 'qemu' else 'lxc'}-{vmid}"
+
+
+async def send_vm_info(message: Message, vmid: int):
+    """Отправить карточку VM."""
+    try:
+        info, badge = await load_card(vmid, "qemu")
+
         if not info:
-            await callback.message.answer("❌ Не удалось получить информацию о VM")
-            await callback.answer()
+            await message.answer("❌ Не удалось получить информацию о VM")
             return
 
+        # Пароль cloud-init, если VM создана через нас
+        try:
+            record = await guest_records.get(vmid)
+        except Exception:
+            record = None
+
         # Форматируем uptime
-        uptime_seconds = int(info.get("uptime", 0))
+        uptime_seconds = info.uptime
         uptime_str = ""
         if uptime_seconds > 0:
             days = uptime_seconds // 86400
@@ -311,54 +634,73 @@ async def cb_vm_info(callback: CallbackQuery):
             else:
                 uptime_str = f"{hours}ч {mins}м"
 
-        # Форматируем использование ресурсов
-        # Proxmox возвращает память в байтах, диск в байтах
-        mem_used = float(info.get("mem_used", 0)) / (1024 * 1024)  # MB
-        mem_total = float(info.get("maxmem", 0)) / (1024 * 1024)  # MB
-        
-        # Если maxmem = 0, берем из config
-        if mem_total == 0:
-            mem_total = float(info.get("memory", 512))
-        
-        disk_used = float(info.get("disk_used", 0)) / (1024 * 1024 * 1024)  # GB
-        disk_total = float(info.get("maxdisk", 0)) / (1024 * 1024 * 1024)  # GB
-        
-        # Если maxdisk = 0, берем из config
-        if disk_total == 0:
-            disk_total = float(info.get("disk", 10))
+        # Proxmox возвращает память и диск в байтах
+        mem_used = info.mem / (1024 * 1024)  # MB
+        mem_total = info.maxmem / (1024 * 1024)  # MB
+        disk_used = info.disk / (1024 * 1024 * 1024)  # GB
+        disk_total = info.maxdisk / (1024 * 1024 * 1024)  # GB
 
-        status_icon = "🟢" if info.get("status") == "running" else "🔴"
+        status_icon = "🟢" if info.running else "🔴"
 
-        report = (
+        report = badge + (
             f"📊 <b>Информация о VM</b>\n\n"
             f"🆔 VMID: <code>{vmid}</code>\n"
-            f"📛 Имя: {info.get('name', 'N/A')}\n"
-            f"{status_icon} Статус: <b>{info.get('status', 'unknown').upper()}</b>\n\n"
+            f"📛 Имя: {info.name}\n"
+            f"{status_icon} Статус: <b>{info.status.upper()}</b>\n\n"
             f"🖥️ <b>Ресурсы:</b>\n"
-            f"   CPU: {info.get('cpu', 1)} яд(ер)\n"
+            f"   CPU: {info.cpus} яд(ер)\n"
             f"   RAM: {mem_used:.0f} / {mem_total:.0f} MB\n"
             f"   Диск: {disk_used:.1f} / {disk_total:.1f} GB\n\n"
         )
+        if record and record.password:
+            report += (
+                f"🔑 <b>Доступ:</b>\n"
+                f"   Пользователь: <code>root</code>\n"
+                f"   Пароль: <code>{record.password}</code>\n\n"
+            )
 
-        if info.get("status") == "running":
+        if info.running:
             report += (
                 f"🌐 <b>Сеть:</b>\n"
-                f"   IP: {info.get('ip') or 'Не получен'}\n\n"
+                f"   IP: {info.ip or 'Не получен'}\n\n"
                 f"⏱️ <b>Uptime:</b> {uptime_str or 'VM выключена'}\n\n"
                 f"🔑 <b>SSH доступ:</b>\n"
-                f"<code>ssh root@{info.get('ip') or 'VM_IP'}</code>\n"
+                f"<code>ssh root@{info.ip or 'VM_IP'}</code>\n"
             )
         else:
             report += "⏹️ VM выключена\n\n"
             report += "▶️ Запустите VM для получения IP и SSH доступа\n"
 
-        await callback.message.answer(report, parse_mode="HTML", reply_markup=get_vm_keyboard(vmid))
+        await message.answer(report, parse_mode="HTML", reply_markup=get_vm_keyboard(vmid))
     except Exception as e:
         logger.error(f"Failed to get VM info: {e}")
-        await callback.message.answer(f"❌ Ошибка: {e}")
+        await message.answer(f"❌ Ошибка: {e}")
+
+
+@dp.callback_query(F.data.startswith("vm_info_"))
+async def cb_vm_info(callback: CallbackQuery):
+    if not await is_admin(callback.from_user.id):
+        return await show_access_denied(callback)
+
+    vmid = int(callback.data.replace("vm_info_", ""))
+
+    await send_vm_info(callback.message, vmid)
     await callback.answer()
 
 
+@dp.message(Command("vm"))
+async def cmd_vm_info(message: Message, command: CommandObject):
+    """Открыть карточку VM по vmid: /vm 101."""
+    if not await is_admin(message.from_user.id):
+        return await show_access_denied(message)
+
+    args = (command.args or "").strip()
+    if not args.isdigit():
+        await message.answer("Использование: /vm &lt;vmid&gt;", parse_mode="HTML")
+        return
+    await send_vm_info(message, int(args))
+
+
 # === Начало создания VM ===
 @dp.callback_query(F.data == "create_vm_start")
 async def cb_create_vm_start(callback: CallbackQuery, state: FSMContext):
@@ -392,9 +734,9 @@ async def vm_name_input(message: Message, state: FSMContext):
     await state.set_state(VMCreate.waiting_for_iso)
     
     # Загружаем ISO образы
-    iso_keyboard = await get_iso_keyboard()
+    iso_keyboard = await get_iso_keyboard(templates_only="count" in vm_data[message.from_user.id])
     await message.answer(
-        "💿 Выберите <b>ISO образ</b> для установки:",
+        "💿 Выберите <b>шаблон</b> (VM готова через секунды) или <b>ISO образ</b> для установки:",
         parse_mode="HTML",
         reply_markup=iso_keyboard
     )
@@ -421,6 +763,25 @@ async def vm_iso_select(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
 
 
+@dp.callback_query(VMCreate.waiting_for_iso, F.data.startswith("vm_tmpl_"))
+async def vm_template_select(callback: CallbackQuery, state: FSMContext):
+    if not await is_admin(callback.from_user.id):
+        return await show_access_denied(callback)
+
+    template_vmid = int(callback.data.replace("vm_tmpl_", ""))
+    vm_data[callback.from_user.id]["template"] = template_vmid
+    
+    await state.set_state(VMCreate.waiting_for_cpu)
+    await callback.message.answer(
+        f"✅ Шаблон: {template_vmid}\n\n"
+        "🖥️ Введите количество <b>CPU ядер</b>:\n"
+        "(например: 1, 2, 4)",
+        parse_mode="HTML",
+        reply_markup=get_cancel_keyboard()
+    )
+    await callback.answer()
+
+
 @dp.callback_query(VMCreate.waiting_for_iso, F.data == "no_iso")
 async def vm_iso_no_iso(callback: CallbackQuery, state: FSMContext):
     await callback.message.answer(
@@ -508,25 +869,39 @@ async def vm_disk_input(message: Message, state: FSMContext):
 
         # Создаём VM
         data = vm_data[message.from_user.id]
-        await message.answer(f"⏳ Создаю VM '{data['name']}'...")
+        if "count" in data:
+            await create_batch(message, "qemu", data)
+            await state.clear()
+            vm_data.pop(message.from_user.id, None)
+            return
+        if "template" in data:
+            await create_vm_from_template(message, data)
+            await state.clear()
+            vm_data.pop(message.from_user.id, None)
+            return
 
-        vmid, password = await proxmox.create_vm_with_iso(
-            name=data["name"],
-            iso_volid=data["iso"],
-            cpu=data["cpu"],
-            memory=data["memory"],
-            disk=data["disk"]
-        )
+        progress = await ProgressMessage.send(message, f"⏳ Создаю VM '{data['name']}'...")
+
+        async with audit.track("create", audit_actor(message.from_user), "bot", type_="qemu",
+                               name=data["name"]) as event:
+            vmid, password = await proxmox.create_vm_with_iso(
+                name=data["name"],
+                iso_volid=data["iso"],
+                cpu=data["cpu"],
+                memory=data["memory"],
+                disk=data["disk"],
+                wait=True
+            )
+            event.vmid = vmid
+        await guest_records.save(vmid, name=data["name"], type="qemu", os=data["iso"], password=password)
 
         # Автозапуск
-        await message.answer(f"✅ VM создана! VMID: <code>{vmid}</code>\n⏳ Запускаю...")
-        await proxmox.start_vm(vmid, "qemu")
+        await progress.update(f"✅ VM создана! VMID: <code>{vmid}</code>\n⏳ Запускаю...")
+        await proxmox.wait_task(await proxmox.start_vm(vmid, "qemu"))
+        inventory.invalidate()
 
-        # Ждём запуска
-        await asyncio.sleep(5)
-
-        # Получаем информацию
-        ip = await proxmox.get_vm_ip(vmid, "qemu")
+        # ОС с ISO ещё не установлена — агент вряд ли ответит, ждём недолго
+        ip = await proxmox.get_vm_ip(vmid, "qemu", timeout=2)
 
         # Формируем отчет
         report = (
@@ -550,7 +925,7 @@ async def vm_disk_input(message: Message, state: FSMContext):
             f"🔐 <b>Сохраните пароль!</b> Он показывается только один раз."
         )
 
-        await message.answer(report, parse_mode="HTML", reply_markup=get_vm_keyboard(vmid))
+        await progress.finish(report, reply_markup=get_vm_keyboard(vmid))
 
         await state.clear()
         vm_data.pop(message.from_user.id, None)
@@ -564,6 +939,139 @@ async def vm_disk_input(message: Message, state: FSMContext):
         vm_data.pop(message.from_user.id, None)
 
 
+async def create_vm_from_template(message: Message, data: dict):
+    """Создать VM клонированием cloud-init шаблона и дождаться IP."""
+    progress = await ProgressMessage.send(message, f"⏳ Клонирую шаблон {data['template']} в VM '{data['name']}'...")
+
+    async with audit.track("create", audit_actor(message.from_user), "bot", type_="qemu",
+                           name=data["name"], template=data["template"]) as event:
+        vmid, password = await proxmox.create_vm_from_template(
+            name=data["name"],
+            template_vmid=data["template"],
+            cpu=data["cpu"],
+            memory=data["memory"],
+            disk=data["disk"],
+            full=settings.QEMU_CLONE_FULL,
+            storage=settings.QEMU_CLONE_STORAGE
+        )
+        event.vmid = vmid
+    await guest_records.save(vmid, name=data["name"], type="qemu", os=str(data["template"]), password=password)
+    inventory.invalidate()
+
+    # ОС уже установлена — ждём, пока guest agent сообщит адрес
+    await progress.update(f"✅ VM создана и запущена! VMID: <code>{vmid}</code>\n⏳ Жду IP...")
+    ip = await proxmox.get_vm_ip(vmid, "qemu", timeout=60, interval=2)
+
+    report = (
+        f"✅ <b>VM готова!</b>\n\n"
+        f"🆔 VMID: <code>{vmid}</code>\n"
+        f"📛 Имя: {data['name']}\n"
+        f"⚡ Шаблон: {data['template']}\n"
+        f"🖥️ CPU: {data['cpu']} яд(ер)\n"
+        f"💾 RAM: {data['memory']} MB\n"
+        f"💽 Диск: {data['disk']} GB\n"
+        f"🌐 IP: {ip or 'Ожидание...'}\n\n"
+        f"☁️ <b>Cloud-Init:</b>\n"
+        f"   Пользователь: <code>root</code>\n"
+        f"   🔑 Пароль: <code>{password}</code>\n\n"
+        f"🔑 <b>SSH доступ:</b>\n"
+        f"<code>ssh root@{ip or 'VM_IP'}</code>\n\n"
+        f"🔐 <b>Сохраните пароль!</b> Он показывается только один раз."
+    )
+    await progress.finish(report, reply_markup=get_vm_keyboard(vmid))
+
+
+# === Массовое создание (×N) ===
+BATCH_MAX_COUNT = 50
+# Как часто обновлять сообщение с прогрессом, секунды
+BATCH_PROGRESS_INTERVAL = 2.0
+
+
+@dp.callback_query(F.data.in_({"create_vm_batch", "create_lxc_batch"}))
+async def cb_create_batch_start(callback: CallbackQuery, state: FSMContext):
+    if not await is_admin(callback.from_user.id):
+        return await show_access_denied(callback)
+
+    vm_data[callback.from_user.id] = {}
+    is_vm = callback.data == "create_vm_batch"
+    await state.set_state(VMCreate.waiting_for_count if is_vm else LXCCreate.waiting_for_count)
+    await callback.message.answer(
+        f"🔢 Сколько {'VM' if is_vm else 'LXC контейнеров'} создать?\n"
+        f"(от 2 до {BATCH_MAX_COUNT})",
+        reply_markup=get_cancel_keyboard()
+    )
+    await callback.answer()
+
+
+@dp.message(VMCreate.waiting_for_count)
+@dp.message(LXCCreate.waiting_for_count)
+async def batch_count_input(message: Message, state: FSMContext):
+    if not await is_admin(message.from_user.id):
+        return await show_access_denied(message)
+
+    try:
+        count = int(message.text)
+        if count < 2 or count > BATCH_MAX_COUNT:
+            raise ValueError()
+    except (TypeError, ValueError):
+        await message.answer(f"❌ Введите число от 2 до {BATCH_MAX_COUNT}")
+        return
+
+    vm_data[message.from_user.id]["count"] = count
+    is_vm = await state.get_state() == VMCreate.waiting_for_count.state
+    await state.set_state(VMCreate.waiting_for_name if is_vm else LXCCreate.waiting_for_name)
+    await message.answer(
+        f"✅ Количество: {count}\n\n"
+        "📝 Введите <b>шаблон имени</b>, <code>{n}</code> — номер:\n"
+        "(например: <code>worker-{n}</code> или <code>web-{n:02d}</code>)",
+        parse_mode="HTML",
+        reply_markup=get_cancel_keyboard()
+    )
+
+
+async def create_batch(message: Message, type_: str, data: dict):
+    """Создать ``count`` одинаковых гостей, показывая прогресс в одном сообщении."""
+    kind = "VM" if type_ == "qemu" else "LXC"
+    spec = VMBatchCreate(
+        count=data["count"],
+        name_pattern=data["name"],
+        os=data["template"] if type_ == "lxc" else "ubuntu-22.04",
+        cpu=data["cpu"],
+        memory=data["memory"],
+        disk=data["disk"],
+        template=data.get("template") if type_ == "qemu" else None,
+    )
+    try:
+        events = start_batch(proxmox, type_, spec, actor=audit_actor(message.from_user), source="bot")
+    except ValueError as e:
+        await message.answer(f"❌ {e}")
+        return
+
+    progress = await ProgressMessage.send(
+        message, f"⏳ Создаю {spec.count} {kind}...", min_interval=BATCH_PROGRESS_INTERVAL
+    )
+    ready, failed = [], []
+    async for event in events:
+        if event["event"] == "ready":
+            ready.append(event)
+        elif event["event"] in ("failed", "error"):
+            failed.append(event)
+        if event["event"] != "done":
+            await progress.update(f"⏳ Создаю {spec.count} {kind}: готово {len(ready)}, ошибок {len(failed)}")
+    inventory.invalidate()
+
+    lines = [f"✅ <b>Создано {kind}: {len(ready)} из {spec.count}</b>\n"]
+    for event in sorted(ready, key=lambda e: e["vmid"]):
+        password = f" 🔑 <code>{event['password']}</code>" if event["password"] else ""
+        lines.append(f"🟢 <code>{event['vmid']}</code> {event['name']}{password}")
+    for event in failed:
+        left = f" (<code>{event['vmid']}</code> не удалён)" if event.get("removed") is False else ""
+        lines.append(f"🔴 {event.get('name', '')} {event.get('error', '')}{left}")
+    if ready:
+        lines.append("\n🔐 <b>Сохраните пароли!</b> Пользователь: <code>root</code>")
+    await progress.finish("\n".join(lines), reply_markup=get_main_keyboard())
+
+
 # === Отмена создания ===
 @dp.callback_query(F.data == "cancel_create")
 async def cb_cancel(callback: CallbackQuery, state: FSMContext):
@@ -573,39 +1081,122 @@ async def cb_cancel(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
 
 
-# === Управление VM ===
-@dp.callback_query(F.data.startswith("vm_start_"))
-async def cb_vm_start(callback: CallbackQuery):
-    if not await is_admin(callback.from_user.id):
-        return await show_access_denied(callback)
-
-    vmid = int(callback.data.replace("vm_start_", ""))
+# === Питание гостей ===
+# Действие: (что делаем, итог для VM, итог для LXC)
+POWER_ACTIONS = {
+    "start": ("▶️ Запускаю", "✅ VM {vmid} запущена!", "✅ LXC {vmid} запущен!"),
+    "stop": ("⏹️ Останавливаю", "⏹️ VM {vmid} остановлена!", "⏹️ LXC {vmid} остановлен!"),
+    "restart": ("🔄 Перезапускаю", "🔄 VM {vmid} перезапущена!", "🔄 LXC {vmid} перезапущен!"),
+    "delete": ("🗑️ Удаляю", "🗑️ VM {vmid} удалена!", "🗑️ LXC {vmid} удален!"),
+}
+# Сколько ждать IP после запуска, секунды
+START_IP_TIMEOUT = 20
+# Повторное нажатие той же кнопки в течение этого времени после завершения
+# не запускает действие заново, а получает его итог
+POWER_DEBOUNCE = 5.0
+# Сколько повторное нажатие ждёт итога: Telegram отвергает ответ на старый callback
+POWER_ATTACH_TIMEOUT = 10.0
+# Действия в работе и только что завершённые: (vmid, action) -> задача с итогом
+power_operations: dict[tuple[int, str], asyncio.Task] = {}
+
+
+async def run_power_action(message: Message, vmid: int, type_: str, action: str, actor: str) -> str:
+    """Выполнить действие, обновляя одно сообщение о ходе. Возвращает краткий итог."""
+    kind = "VM" if type_ == "qemu" else "LXC"
+    running, done_vm, done_lxc = POWER_ACTIONS[action]
+    done = (done_vm if type_ == "qemu" else done_lxc).format(vmid=vmid)
+    method = {
+        "start": proxmox.start_vm,
+        "stop": proxmox.stop_vm,
+        "restart": proxmox.restart_vm,
+        "delete": proxmox.delete_vm,
+    }[action]
+
+    progress = await ProgressMessage.send(message, f"{running} {kind} {vmid}...")
     try:
-        await callback.answer("⏳ Запускаю...")
-        await proxmox.start_vm(vmid, "qemu")
-        
-        # Ждём получения IP
-        await callback.answer("🌐 Получаю IP...")
-        await asyncio.sleep(3)
-        ip = await proxmox.get_vm_ip(vmid, "qemu", timeout=10)
-        
+        async with audit.track(action, actor, "bot", vmid, type_), guest_locks.hold(vmid, action):
+            await proxmox.wait_task(await method(vmid, type_))
+        if action == "delete":
+            await guest_records.delete(vmid)
+        inventory.invalidate()
+        if action != "start":
+            await progress.finish(done)
+            return done
+
+        await progress.update(f"{done}\n\n🌐 Получаю IP...")
+        ip = await proxmox.get_vm_ip(vmid, type_, timeout=START_IP_TIMEOUT, interval=2)
         if ip:
-            await callback.message.answer(
-                f"✅ VM {vmid} запущена!\n\n"
+            await progress.finish(
+                f"{done}\n\n"
                 f"🌐 <b>IP адрес:</b>\n"
                 f"<code>{ip}</code>\n\n"
                 f"🔑 <b>SSH доступ:</b>\n"
                 f"<code>ssh root@{ip}</code>"
             )
-        else:
-            await callback.message.answer(
-                f"✅ VM {vmid} запущена!\n\n"
-                f"⏳ <b>Ожидание IP адреса...</b>\n\n"
-                f"💡 Нажмите '🔄 Обновить IP' через несколько секунд"
-            )
+            return f"{done} IP: {ip}"
+        await progress.finish(
+            f"{done}\n\n"
+            f"⏳ <b>Ожидание IP адреса...</b>\n\n"
+            f"💡 Нажмите '🔄 Обновить IP' через несколько секунд"
+        )
+        return done
+    except GuestBusy as e:
+        busy = f"⏳ {kind} {vmid} занят: {e.operation or 'идёт другая операция'}, попробуйте позже"
+        await progress.finish(busy)
+        return busy
     except Exception as e:
-        await callback.message.answer(f"❌ Ошибка: {e}")
+        inventory.invalidate()
+        await progress.finish(f"❌ Ошибка: {e}")
+        return f"❌ Ошибка: {e}"
+
+
+def _forget_power_operation(key: tuple[int, str], task: asyncio.Task):
+    if power_operations.get(key) is task:
+        del power_operations[key]
+
+
+async def power_action(callback: CallbackQuery, vmid: int, type_: str, action: str):
+    """Действие с питанием гостя по кнопке.
+
+    Одно действие над гостем выполняется один раз: повторное нажатие (двойной
+    тап, нажатие в другом чате) пока оно идёт или в течение ``POWER_DEBOUNCE``
+    секунд после него не вызывает Proxmox, а получает итог всплывающим ответом.
+    """
+    key = (vmid, action)
+    task = power_operations.get(key)
+    if task is not None:
+        logger.info(f"Duplicate {action} press for {vmid} from {callback.from_user.id}, attaching")
+        try:
+            result = await asyncio.wait_for(asyncio.shield(task), timeout=POWER_ATTACH_TIMEOUT)
+        except asyncio.TimeoutError:
+            result = f"⏳ {POWER_ACTIONS[action][0]} {vmid}, уже выполняется..."
+        try:
+            await callback.answer(result[:200])
+        except TelegramBadRequest:
+            pass  # Ответ на callback опоздал — итог и так виден в сообщении о ходе
+        return
+
+    # Задача не отменяется вместе с обработчиком и держит итог для повторных нажатий.
+    # Регистрируется до первого await: иначе второе нажатие успеет пройти проверку выше
+    task = asyncio.create_task(
+        run_power_action(callback.message, vmid, type_, action, audit_actor(callback.from_user))
+    )
+    power_operations[key] = task
+    task.add_done_callback(
+        lambda t: asyncio.get_running_loop().call_later(POWER_DEBOUNCE, _forget_power_operation, key, t)
+    )
     await callback.answer()
+    await asyncio.shield(task)
+
+
+# === Управление VM ===
+@dp.callback_query(F.data.startswith("vm_start_"))
+async def cb_vm_start(callback: CallbackQuery):
+    if not await is_admin(callback.from_user.id):
+        return await show_access_denied(callback)
+
+    vmid = int(callback.data.replace("vm_start_", ""))
+    await power_action(callback, vmid, "qemu", "start")
 
 
 @dp.callback_query(F.data.startswith("vm_stop_"))
@@ -614,12 +1205,7 @@ async def cb_vm_stop(callback: CallbackQuery):
         return await show_access_denied(callback)
 
     vmid = int(callback.data.replace("vm_stop_", ""))
-    try:
-        await proxmox.stop_vm(vmid, "qemu")
-        await callback.message.answer(f"⏹️ VM {vmid} остановлена!")
-    except Exception as e:
-        await callback.message.answer(f"❌ Ошибка: {e}")
-    await callback.answer()
+    await power_action(callback, vmid, "qemu", "stop")
 
 
 @dp.callback_query(F.data.startswith("vm_restart_"))
@@ -628,12 +1214,7 @@ async def cb_vm_restart(callback: CallbackQuery):
         return await show_access_denied(callback)
 
     vmid = int(callback.data.replace("vm_restart_", ""))
-    try:
-        await proxmox.restart_vm(vmid, "qemu")
-        await callback.message.answer(f"🔄 VM {vmid} перезапущена!")
-    except Exception as e:
-        await callback.message.answer(f"❌ Ошибка: {e}")
-    await callback.answer()
+    await power_action(callback, vmid, "qemu", "restart")
 
 
 @dp.callback_query(F.data.startswith("vm_delete_"))
@@ -642,12 +1223,7 @@ async def cb_vm_delete(callback: CallbackQuery):
         return await show_access_denied(callback)
 
     vmid = int(callback.data.replace("vm_delete_", ""))
-    try:
-        await proxmox.delete_vm(vmid, "qemu")
-        await callback.message.answer(f"🗑️ VM {vmid} удалена!")
-    except Exception as e:
-        await callback.message.answer(f"❌ Ошибка: {e}")
-    await callback.answer()
+    await power_action(callback, vmid, "qemu", "delete")
 
 
 @dp.callback_query(F.data.startswith("vm_cloudinit_"))
@@ -701,7 +1277,7 @@ async def cb_vm_refresh_ip(callback: CallbackQuery):
             report = (
                 f"🌐 <b>IP адрес обновлён!</b>\n\n"
                 f"🆔 VMID: <code>{vmid}</code>\n"
-                f"📛 Имя: {(await proxmox.get_vm_config(vmid, 'qemu')).get('name', f'vm-{vmid}')}\n"
+                f"📛 Имя: {await guest_name(vmid, 'qemu')}\n"
                 f"🔑 <b>SSH доступ:</b>\n"
                 f"<code>ssh root@{ip}</code>\n\n"
                 f"✅ IP: {ip}"
@@ -748,7 +1324,7 @@ async def cb_lxc_refresh_ip(callback: CallbackQuery):
             report = (
                 f"🌐 <b>IP адрес обновлён!</b>\n\n"
                 f"🆔 VMID: <code>{vmid}</code>\n"
-                f"📛 Имя: {(await proxmox.get_vm_config(vmid, 'lxc')).get('hostname', f'lxc-{vmid}')}\n"
+                f"📛 Имя: {await guest_name(vmid, 'lxc')}\n"
                 f"🔑 <b>SSH доступ:</b>\n"
                 f"<code>ssh root@{ip}</code>\n\n"
                 f"✅ IP: {ip}"
@@ -787,15 +1363,12 @@ async def cb_lxc_password(callback: CallbackQuery):
     try:
         # Пробуем получить пароль из БД
         try:
-            async with SessionLocal() as db:
-                result = await db.execute(select(VM).where(VM.vmid == vmid))
-                vm = result.scalar_one_or_none()
-            password = vm.password if vm and vm.password else None
+            record = await guest_records.get(vmid)
+            password = record.password if record else None
         except Exception:
-            password = None
+            record, password = None, None
         
-        config = await proxmox.get_vm_config(vmid, 'lxc')
-        name = config.get('hostname', f'lxc-{vmid}')
+        name = await guest_name(vmid, 'lxc', record)
         
         if password:
             report = (
@@ -840,23 +1413,14 @@ async def cb_list_lxc(callback: CallbackQuery):
         return await show_access_denied(callback)
 
     try:
-        lxc_list = await proxmox.list_vms("lxc")
+        lxc_list = await load_list_snapshot(callback.message.chat.id, "lxc")
         if not lxc_list:
             await callback.message.answer("📭 Нет активных LXC контейнеров.")
             await callback.answer()
             return
 
-        text = "📦 <b>Список LXC:</b>\n\n"
-        for lxc in lxc_list:
-            vmid = lxc.get("vmid", "?")
-            name = lxc.get("name", f"lxc-{vmid}")
-            status = lxc.get("status", "unknown")
-            status_icon = "🟢" if status == "running" else "🔴"
-            text += f"{status_icon} <code>{vmid}</code> - {name} ({status})\n"
-
-        text += "\n<b>Нажмите на контейнер для подробной информации:</b>"
-
-        await callback.message.answer(text, parse_mode="HTML", reply_markup=get_lxc_list_keyboard(lxc_list))
+        text, keyboard = render_list_page("lxc", lxc_list, 0)
+        await callback.message.answer(text, parse_mode="HTML", reply_markup=keyboard)
     except Exception as e:
         logger.error(f"Failed to list LXC: {e}")
         await callback.message.answer(f"❌ Ошибка: {e}")
@@ -865,33 +1429,25 @@ async def cb_list_lxc(callback: CallbackQuery):
 
 
 # === Информация о LXC ===
-@dp.callback_query(F.data.startswith("lxc_info_"))
-async def cb_lxc_info(callback: CallbackQuery):
-    if not await is_admin(callback.from_user.id):
-        return await show_access_denied(callback)
-
-    vmid = int(callback.data.replace("lxc_info_", ""))
-
+async def send_lxc_info(message: Message, vmid: int):
+    """Отправить карточку LXC."""
     try:
-        info = await proxmox.get_vm_full_info(vmid, "lxc")
-        
+        info, badge = await load_card(vmid, "lxc")
+
         # Пробуем получить пароль из БД
         password = "Не найден"
         try:
-            async with SessionLocal() as db:
-                result = await db.execute(select(VM).where(VM.vmid == vmid))
-                vm = result.scalar_one_or_none()
-            if vm and vm.password:
-                password = vm.password
+            record = await guest_records.get(vmid)
+            if record and record.password:
+                password = record.password
         except Exception:
             password = "БД недоступна"
 
         if not info:
-            await callback.message.answer("❌ Не удалось получить информацию о LXC")
-            await callback.answer()
+            await message.answer("❌ Не удалось получить информацию о LXC")
             return
 
-        uptime_seconds = int(info.get("uptime", 0))
+        uptime_seconds = info.uptime
         uptime_str = ""
         if uptime_seconds > 0:
             days = uptime_seconds // 86400
@@ -902,25 +1458,21 @@ async def cb_lxc_info(callback: CallbackQuery):
             else:
                 uptime_str = f"{hours}ч {mins}м"
 
-        mem_used = float(info.get("mem_used", 0)) / (1024 * 1024)
-        mem_total = float(info.get("maxmem", 0)) / (1024 * 1024)
-        if mem_total == 0:
-            mem_total = float(info.get("memory", 512))
-
-        disk_used = float(info.get("disk_used", 0)) / (1024 * 1024 * 1024)
-        disk_total = float(info.get("maxdisk", 0)) / (1024 * 1024 * 1024)
-        if disk_total == 0:
-            disk_total = float(info.get("disk", 10))
+        # Proxmox возвращает память и диск в байтах
+        mem_used = info.mem / (1024 * 1024)  # MB
+        mem_total = info.maxmem / (1024 * 1024)  # MB
+        disk_used = info.disk / (1024 * 1024 * 1024)  # GB
+        disk_total = info.maxdisk / (1024 * 1024 * 1024)  # GB
 
-        status_icon = "🟢" if info.get("status") == "running" else "🔴"
+        status_icon = "🟢" if info.running else "🔴"
 
-        report = (
+        report = badge + (
             f"📊 <b>Информация о LXC</b>\n\n"
             f"🆔 VMID: <code>{vmid}</code>\n"
-            f"📛 Имя: {info.get('name', 'N/A')}\n"
-            f"{status_icon} Статус: <b>{info.get('status', 'unknown').upper()}</b>\n\n"
+            f"📛 Имя: {info.name}\n"
+            f"{status_icon} Статус: <b>{info.status.upper()}</b>\n\n"
             f"🖥️ <b>Ресурсы:</b>\n"
-            f"   CPU: {info.get('cpu', 1)} яд(ер)\n"
+            f"   CPU: {info.cpus} яд(ер)\n"
             f"   RAM: {mem_used:.0f} / {mem_total:.0f} MB\n"
             f"   Диск: {disk_used:.1f} / {disk_total:.1f} GB\n\n"
             f"🔑 <b>Доступ:</b>\n"
@@ -928,25 +1480,48 @@ async def cb_lxc_info(callback: CallbackQuery):
             f"   Пароль: <code>{password}</code>\n\n"
         )
 
-        if info.get("status") == "running":
+        if info.running:
             report += (
                 f"🌐 <b>Сеть:</b>\n"
-                f"   IP: {info.get('ip') or 'Не получен'}\n\n"
+                f"   IP: {info.ip or 'Не получен'}\n\n"
                 f"⏱️ <b>Uptime:</b> {uptime_str or 'Контейнер выключен'}\n\n"
                 f"🔑 <b>SSH доступ:</b>\n"
-                f"<code>ssh root@{info.get('ip') or 'LXC_IP'}</code>\n"
+                f"<code>ssh root@{info.ip or 'LXC_IP'}</code>\n"
             )
         else:
             report += "⏹️ Контейнер выключен\n\n"
             report += "▶️ Запустите контейнер для получения IP и SSH доступа\n"
 
-        await callback.message.answer(report, parse_mode="HTML", reply_markup=get_lxc_keyboard(vmid))
+        await message.answer(report, parse_mode="HTML", reply_markup=get_lxc_keyboard(vmid))
     except Exception as e:
         logger.error(f"Failed to get LXC info: {e}")
-        await callback.message.answer(f"❌ Ошибка: {e}")
+        await message.answer(f"❌ Ошибка: {e}")
+
+
+@dp.callback_query(F.data.startswith("lxc_info_"))
+async def cb_lxc_info(callback: CallbackQuery):
+    if not await is_admin(callback.from_user.id):
+        return await show_access_denied(callback)
+
+    vmid = int(callback.data.replace("lxc_info_", ""))
+
+    await send_lxc_info(callback.message, vmid)
     await callback.answer()
 
 
+@dp.message(Command("lxc"))
+async def cmd_lxc_info(message: Message, command: CommandObject):
+    """Открыть карточку LXC по vmid: /lxc 101."""
+    if not await is_admin(message.from_user.id):
+        return await show_access_denied(message)
+
+    args = (command.args or "").strip()
+    if not args.isdigit():
+        await message.answer("Использование: /lxc &lt;vmid&gt;", parse_mode="HTML")
+        return
+    await send_lxc_info(message, int(args))
+
+
 # === Начало создания LXC ===
 @dp.callback_query(F.data == "create_lxc_start")
 async def cb_create_lxc_start(callback: CallbackQuery, state: FSMContext):
@@ -1088,27 +1663,34 @@ async def lxc_disk_input(message: Message, state: FSMContext):
         vm_data[message.from_user.id]["disk"] = disk
 
         data = vm_data[message.from_user.id]
-        await message.answer(f"⏳ Создаю LXC '{data['name']}'...")
+        if "count" in data:
+            await create_batch(message, "lxc", data)
+            await state.clear()
+            vm_data.pop(message.from_user.id, None)
+            return
 
-        vmid, password = await proxmox.create_lxc(
-            hostname=data["name"],
-            ostemplate=data["template"],
-            cpu=data["cpu"],
-            memory=data["memory"],
-            disk=data["disk"]
-        )
+        progress = await ProgressMessage.send(message, f"⏳ Создаю LXC '{data['name']}'...")
+
+        async with audit.track("create", audit_actor(message.from_user), "bot", type_="lxc",
+                               name=data["name"]) as event:
+            vmid, password = await proxmox.create_lxc(
+                hostname=data["name"],
+                ostemplate=data["template"],
+                cpu=data["cpu"],
+                memory=data["memory"],
+                disk=data["disk"],
+                wait=True
+            )
+            event.vmid = vmid
 
         # Сохраняем пароль в БД
-        async with SessionLocal() as db:
-            vm = VM(vmid=vmid, name=data["name"], type="lxc", password=password)
-            db.add(vm)
-            await db.commit()
+        await guest_records.save(vmid, name=data["name"], type="lxc", os=data["template"], password=password)
 
-        await message.answer(f"✅ LXC создан! VMID: <code>{vmid}</code>\n⏳ Запускаю...")
-        await proxmox.start_vm(vmid, "lxc")
-        await asyncio.sleep(3)
+        await progress.update(f"✅ LXC создан! VMID: <code>{vmid}</code>\n⏳ Запускаю...")
+        await proxmox.wait_task(await proxmox.start_vm(vmid, "lxc"))
+        inventory.invalidate()
 
-        ip = await proxmox.get_vm_ip(vmid, "lxc")
+        ip = await proxmox.get_vm_ip(vmid, "lxc", timeout=10)
 
         report = (
             f"✅ <b>LXC создан и запущен!</b>\n\n"
@@ -1127,7 +1709,7 @@ async def lxc_disk_input(message: Message, state: FSMContext):
             f"🔐 Пароль можно посмотреть в информации о LXC"
         )
 
-        await message.answer(report, parse_mode="HTML", reply_markup=get_lxc_keyboard(vmid))
+        await progress.finish(report, reply_markup=get_lxc_keyboard(vmid))
 
         await state.clear()
         vm_data.pop(message.from_user.id, None)
@@ -1148,32 +1730,7 @@ async def cb_lxc_start(callback: CallbackQuery):
         return await show_access_denied(callback)
 
     vmid = int(callback.data.replace("lxc_start_", ""))
-    try:
-        await callback.answer("⏳ Запускаю...")
-        await proxmox.start_vm(vmid, "lxc")
-        
-        # Ждём получения IP
-        await callback.answer("🌐 Получаю IP...")
-        await asyncio.sleep(3)
-        ip = await proxmox.get_vm_ip(vmid, "lxc", timeout=10)
-        
-        if ip:
-            await callback.message.answer(
-                f"✅ LXC {vmid} запущен!\n\n"
-                f"🌐 <b>IP адрес:</b>\n"
-                f"<code>{ip}</code>\n\n"
-                f"🔑 <b>SSH доступ:</b>\n"
-                f"<code>ssh root@{ip}</code>"
-            )
-        else:
-            await callback.message.answer(
-                f"✅ LXC {vmid} запущен!\n\n"
-                f"⏳ <b>Ожидание IP адреса...</b>\n\n"
-                f"💡 Нажмите '🔄 Обновить IP' через несколько секунд"
-            )
-    except Exception as e:
-        await callback.message.answer(f"❌ Ошибка: {e}")
-    await callback.answer()
+    await power_action(callback, vmid, "lxc", "start")
 
 
 @dp.callback_query(F.data.startswith("lxc_stop_"))
@@ -1182,12 +1739,7 @@ async def cb_lxc_stop(callback: CallbackQuery):
         return await show_access_denied(callback)
 
     vmid = int(callback.data.replace("lxc_stop_", ""))
-    try:
-        await proxmox.stop_vm(vmid, "lxc")
-        await callback.message.answer(f"⏹️ LXC {vmid} остановлен!")
-    except Exception as e:
-        await callback.message.answer(f"❌ Ошибка: {e}")
-    await callback.answer()
+    await power_action(callback, vmid, "lxc", "stop")
 
 
 @dp.callback_query(F.data.startswith("lxc_restart_"))
@@ -1196,12 +1748,7 @@ async def cb_lxc_restart(callback: CallbackQuery):
         return await show_access_denied(callback)
 
     vmid = int(callback.data.replace("lxc_restart_", ""))
-    try:
-        await proxmox.restart_vm(vmid, "lxc")
-        await callback.message.answer(f"🔄 LXC {vmid} перезапущен!")
-    except Exception as e:
-        await callback.message.answer(f"❌ Ошибка: {e}")
-    await callback.answer()
+    await power_action(callback, vmid, "lxc", "restart")
 
 
 @dp.callback_query(F.data.startswith("lxc_delete_"))
@@ -1210,24 +1757,94 @@ async def cb_lxc_delete(callback: CallbackQuery):
         return await show_access_denied(callback)
 
     vmid = int(callback.data.replace("lxc_delete_", ""))
+    await power_action(callback, vmid, "lxc", "delete")
+
+
+# ==================== INLINE-ПОИСК ====================
+
+async def refresh_search_ips(vmids: list[int]):
+    """Дочитать IP запущенных гостей в индекс поиска (в фоне, с ограничением параллелизма)."""
+    semaphore = asyncio.Semaphore(8)
+
+    async def fetch(vmid: int):
+        doc = search_index.get(vmid)
+        if doc is None:
+            return
+        async with semaphore:
+            ip = await proxmox.get_vm_ip(vmid, doc.type, timeout=1, node=doc.node)
+        search_index.set_ip(vmid, ip)
+
+    await asyncio.gather(*(fetch(vmid) for vmid in vmids), return_exceptions=True)
+
+
+async def sync_search_index():
+    """Применить к индексу свежий снимок инвентаря, не задерживая ответ."""
+    global search_ip_task
     try:
-        await proxmox.delete_vm(vmid, "lxc")
-        await callback.message.answer(f"🗑️ LXC {vmid} удален!")
+        snapshot = await asyncio.wait_for(inventory.snapshot(), INLINE_REFRESH_TIMEOUT)
     except Exception as e:
-        await callback.message.answer(f"❌ Ошибка: {e}")
-    await callback.answer()
+        # Отвечаем по тому, что уже есть в индексе
+        logger.warning(f"Inventory refresh for inline search failed: {e}")
+        return
+
+    stale = search_index.sync(snapshot)
+    if stale and (search_ip_task is None or search_ip_task.done()):
+        search_ip_task = asyncio.create_task(refresh_search_ips(stale))
+
+
+@dp.inline_query()
+async def inline_search(inline_query: InlineQuery):
+    """Поиск гостей по имени, vmid, IP и тегам: @bot web-0."""
+    if not await is_admin(inline_query.from_user.id):
+        return await inline_query.answer([], cache_time=60, is_personal=True)
+
+    await sync_search_index()
+
+    results = []
+    for doc in search_index.search(inline_query.query, limit=20):
+        prefix = "vm" if doc.type == "qemu" else "lxc"
+        status_icon = "🟢" if doc.status == "running" else "🔴"
+        details = [doc.type.upper(), doc.status]
+        if doc.ip:
+            details.append(doc.ip)
+        if doc.tags:
+            details.append("🏷 " + ", ".join(doc.tags))
+        results.append(InlineQueryResultArticle(
+            id=f"{prefix}-{doc.vmid}",
+            title=f"{status_icon} {doc.vmid} | {doc.name}",
+            description=" · ".join(details),
+            # Выбор результата отправляет команду, которая открывает карточку
+            input_message_content=InputTextMessageContent(message_text=f"/{prefix} {doc.vmid}"),
+        ))
+
+    await inline_query.answer(results, cache_time=5, is_personal=True)
 
 
 # === Запуск ===
 async def main():
     logger.info("Starting bot...")
+    inventory_store.load()
     try:
         await bot.delete_webhook(drop_pending_updates=True)
+        await audit.start()
+        if settings.IDLE_SHUTDOWN_ENABLED:
+            idle_scheduler.notify = notify_idle
+            await idle_scheduler.start()
+        if settings.ALERTS_ENABLED:
+            alert_manager.sender.chats = get_admin_ids()
+            alert_manager.sender.send = send_alert
+            await alert_manager.start()
         await dp.start_polling(bot)
     except Exception as e:
         logger.error(f"Bot error: {e}")
         raise
     finally:
+        await alert_manager.stop()
+        await idle_scheduler.stop()
+        await audit.stop()
+        await guest_locks.close()
+        inventory_store.save()
+        await close_clients()
         await bot.session.close()
         logger.info("Bot stopped.")
 
@@ -0,0 +1,199 @@
+import math
+import weakref
+from typing import Union
+
+import numpy as np
+
+from app.guest import Guest
+from app.inventory import InventorySnapshot
+
+# Сколько крупнейших потребителей показывать по умолчанию
+TOP_CONSUMERS = 5
+# Хранилища с таким содержимым держат диски гостей и входят в ёмкость
+GUEST_CONTENT = {"images", "rootdir"}
+
+# Отчёт считается один раз на снимок инвентаря: snapshot -> {top: report}
+_reports: "weakref.WeakKeyDictionary[InventorySnapshot, dict[int, dict]]" = weakref.WeakKeyDictionary()
+
+
+# Строка числовых полей гостя для np.fromiter — без промежуточного списка кортежей
+_ROW = np.dtype([
+    ("cpus", "f8"), ("maxmem", "f8"), ("maxdisk", "f8"), ("mem", "f8"),
+    ("cpu", "f8"), ("running", "?"), ("template", "?"),
+])
+
+
+def _columns(guests: list[Guest], nodes: dict[str, int]) -> dict[str, np.ndarray]:
+    """Числовые столбцы гостей; ``node`` — индекс ноды в ``nodes`` (дополняется на лету)."""
+    count = len(guests)
+    data = np.fromiter(
+        ((g.cpus, g.maxmem, g.maxdisk, g.mem, g.cpu, g.status == "running", g.template) for g in guests),
+        _ROW, count,
+    )
+    return {
+        "node": np.fromiter((nodes.setdefault(g.node or "", len(nodes)) for g in guests), np.intp, count),
+        "cpus": data["cpus"],
+        "maxmem": data["maxmem"],
+        "maxdisk": data["maxdisk"],
+        "mem": data["mem"],
+        "cpu": data["cpu"] * data["cpus"],  # Занятые ядра
+        "running": data["running"],
+        "active": ~data["template"],  # Шаблоны ресурсы не потребляют
+    }
+
+
+def _ratio(numerator: np.ndarray, denominator: np.ndarray) -> np.ndarray:
+    out = np.full(np.shape(numerator), np.nan)
+    return np.divide(numerator, denominator, out=out, where=np.asarray(denominator) > 0)
+
+
+def _value(value) -> Union[int, float, None]:
+    """numpy → JSON: NaN → None, целые байты/ядра — int."""
+    value = float(value)
+    if math.isnan(value):
+        return None
+    return int(value) if value.is_integer() else round(value, 3)
+
+
+def _resource(capacity, allocated, allocated_running, used) -> dict:
+    return {
+        "capacity": _value(capacity),
+        "allocated": _value(allocated),
+        "allocated_running": _value(allocated_running),
+        "used": _value(used),
+        "overcommit": _value(_ratio(np.float64(allocated), np.float64(capacity))),
+        "headroom": _value(capacity - used),
+    }
+
+
+def _top(guests: list[Guest], values: np.ndarray, mask: np.ndarray, limit: int) -> list[dict]:
+    """Крупнейшие по ``values`` гости без полной сортировки."""
+    candidates = np.flatnonzero(mask & (values > 0))
+    if len(candidates) > limit:
+        candidates = candidates[np.argpartition(values[candidates], -limit)[-limit:]]
+    candidates = candidates[np.argsort(values[candidates])[::-1]]
+    return [
+        {
+            "vmid": guests[i].vmid,
+            "type": guests[i].type,
+            "name": guests[i].name,
+            "node": guests[i].node,
+            "value": _value(values[i]),
+        }
+        for i in candidates
+    ]
+
+
+def _storages(items: list[dict]) -> list[dict]:
+    """Хранилища кластера; общие (shared) Proxmox отдаёт на каждой ноде — берём одно."""
+    result = {}
+    for item in items:
+        shared = bool(item.get("shared"))
+        key = item.get("storage") if shared else item.get("id") or f"{item.get('node')}/{item.get('storage')}"
+        if key in result:
+            continue
+        total = int(item.get("maxdisk") or 0)
+        used = int(item.get("disk") or 0)
+        content = set(filter(None, str(item.get("content") or "").split(",")))
+        result[key] = {
+            "storage": item.get("storage"),
+            "node": None if shared else item.get("node"),
+            "shared": shared,
+            "status": item.get("status"),
+            "content": sorted(content),
+            "guests": not content or bool(content & GUEST_CONTENT),
+            "total": total,
+            "used": used,
+            "available": max(0, total - used),
+            "usage": round(used / total, 3) if total else None,
+        }
+    return list(result.values())
+
+
+def build_report(snapshot: InventorySnapshot, top: int = TOP_CONSUMERS) -> dict:
+    """Выделено против доступного по CPU, памяти и диску — по нодам, хранилищам и кластеру.
+
+    ``overcommit`` — выделено гостям (кроме шаблонов) / физическая ёмкость,
+    ``headroom`` — ёмкость минус фактически занятое. Агрегаты считаются
+    векторно (``bincount`` по индексу ноды), поэтому стоимость почти не
+    зависит от числа гостей.
+    """
+    guests = snapshot.guests()
+    nodes = {item["node"]: i for i, item in enumerate(snapshot.nodes)}
+    columns = _columns(guests, nodes)
+    size = len(nodes)
+    codes, active, running = columns["node"], columns["active"], columns["running"]
+
+    def per_node(values: np.ndarray, mask: np.ndarray) -> np.ndarray:
+        return np.bincount(codes[mask], weights=values[mask], minlength=size)
+
+    # Ёмкость и занятость нод — из ресурсов нод; для нод без записи — по гостям
+    known = np.zeros(size, dtype=bool)
+    node_cpu = np.zeros((4, size))  # maxcpu, занятые ядра, maxmem, mem
+    for i, item in enumerate(snapshot.nodes):
+        known[i] = True
+        maxcpu = float(item.get("maxcpu") or 0)
+        node_cpu[:, i] = (maxcpu, float(item.get("cpu") or 0) * maxcpu,
+                          float(item.get("maxmem") or 0), float(item.get("mem") or 0))
+    cap_cpu, cap_mem = node_cpu[0], node_cpu[2]
+    used_cpu = np.where(known, node_cpu[1], per_node(columns["cpu"], running))
+    used_mem = np.where(known, node_cpu[3], per_node(columns["mem"], running))
+
+    alloc_cpu = per_node(columns["cpus"], active)
+    alloc_cpu_run = per_node(columns["cpus"], running & active)
+    alloc_mem = per_node(columns["maxmem"], active)
+    alloc_mem_run = per_node(columns["maxmem"], running & active)
+    alloc_disk = per_node(columns["maxdisk"], active)
+    alloc_disk_run = per_node(columns["maxdisk"], running & active)
+    guest_count = np.bincount(codes[active], minlength=size)
+    running_count = np.bincount(codes[running & active], minlength=size)
+
+    storages = _storages(snapshot.storages)
+    guest_storages = [s for s in storages if s["guests"]]
+    names = list(nodes)
+    local = {name: [s for s in guest_storages if s["node"] == name] for name in names}
+    cap_disk = np.array([sum(s["total"] for s in local[name]) for name in names], dtype=np.float64)
+    used_disk = np.array([sum(s["used"] for s in local[name]) for name in names], dtype=np.float64)
+    status = {item["node"]: item.get("status") for item in snapshot.nodes}
+
+    node_reports = [
+        {
+            "node": name or None,
+            "status": status.get(name),
+            "guests": int(guest_count[i]),
+            "running": int(running_count[i]),
+            "cpu": _resource(cap_cpu[i], alloc_cpu[i], alloc_cpu_run[i], used_cpu[i]),
+            "memory": _resource(cap_mem[i], alloc_mem[i], alloc_mem_run[i], used_mem[i]),
+            "disk": _resource(cap_disk[i], alloc_disk[i], alloc_disk_run[i], used_disk[i]),
+        }
+        for i, name in enumerate(names)
+    ]
+
+    disk_capacity = sum(s["total"] for s in guest_storages)
+    disk_used = sum(s["used"] for s in guest_storages)
+    return {
+        "version": snapshot.version,
+        "guests": int(guest_count.sum()),
+        "running": int(running_count.sum()),
+        "totals": {
+            "cpu": _resource(cap_cpu.sum(), alloc_cpu.sum(), alloc_cpu_run.sum(), used_cpu.sum()),
+            "memory": _resource(cap_mem.sum(), alloc_mem.sum(), alloc_mem_run.sum(), used_mem.sum()),
+            "disk": _resource(np.float64(disk_capacity), alloc_disk.sum(), alloc_disk_run.sum(),
+                              np.float64(disk_used)),
+        },
+        "nodes": node_reports,
+        "storages": storages,
+        "top": {
+            "cpu": _top(guests, columns["cpu"], running & active, top),
+            "memory": _top(guests, columns["mem"], running & active, top),
+            "disk": _top(guests, columns["maxdisk"], active, top),
+        },
+    }
+
+
+def capacity_report(snapshot: InventorySnapshot, top: int = TOP_CONSUMERS) -> dict:
+    """Отчёт о ёмкости для снимка; повторные запросы к тому же снимку берутся из кэша."""
+    reports = _reports.setdefault(snapshot, {})
+    if top not in reports:
+        reports[top] = build_report(snapshot, top)
+    return reports[top]
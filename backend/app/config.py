@@ -1,3 +1,4 @@
+from typing import Optional
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -16,5 +17,100 @@ class Settings(BaseSettings):
     TELEGRAM_TOKEN: str
     ADMIN_TELEGRAM_ID: str
 
+    # Время жизни снимка инвентаря кластера, секунды
+    INVENTORY_TTL: float = 10.0
+    # Сколько живёт закэшированный ответ со списком или гостем, секунды: IP и ОС
+    # не входят в версию инвентаря, их изменения видны не позже этого срока
+    RESPONSE_CACHE_TTL: float = 60.0
+    # Инкрементальная синхронизация конфигураций гостей (app/inventory_sync.py):
+    # период прохода, сколько закэшированных конфигураций сверять по digest за проход
+    # и сколько запрашивать одновременно
+    INVENTORY_SYNC_ENABLED: bool = True
+    INVENTORY_SYNC_INTERVAL: float = 10.0
+    INVENTORY_SYNC_SWEEP: int = 20
+    INVENTORY_SYNC_CONCURRENCY: int = 8
+    # Несколько воркеров API (WEB_CONCURRENCY): опрос Proxmox, метрики и тёплый пул
+    # работают в одном ведущем воркере, остальные берут снимок инвентаря из Redis
+    INVENTORY_SHARED: bool = False
+    # Аренда ведущего, секунды: столько воркеры ждут замены упавшего ведущего
+    LEADER_LEASE: float = 15.0
+    # Каталог, куда при остановке сохраняются снимок инвентаря и кэши (app/inventory_store.py),
+    # чтобы после перезапуска сразу отдавать тёплые данные; пусто — не сохранять.
+    # Сохранение старше INVENTORY_CACHE_MAX_AGE секунд при запуске не используется
+    INVENTORY_CACHE_DIR: Optional[str] = None
+    INVENTORY_CACHE_MAX_AGE: float = 3600.0
+    # Сколько чтения ждут обновления снимка инвентаря, прежде чем отдать последний
+    # известный (устаревший) снимок, пока обновление продолжается в фоне, секунды
+    INVENTORY_REFRESH_TIMEOUT: float = 2.0
+    # После стольких неудачных соединений подряд Proxmox считается недоступным:
+    # запросы к нему сразу отклоняются, пробный — раз в PROXMOX_RETRY_INTERVAL секунд
+    PROXMOX_FAILURE_THRESHOLD: int = 3
+    PROXMOX_RETRY_INTERVAL: float = 10.0
+    # Сколько гостей одновременно запрашивает потоковая выгрузка инвентаря
+    EXPORT_CONCURRENCY: int = 16
+
+    # Cloud-init шаблон VM для быстрого создания клонированием (vmid)
+    QEMU_TEMPLATE_VMID: Optional[int] = None
+    # Полный клон вместо связанного и хранилище для его диска
+    QEMU_CLONE_FULL: bool = False
+    QEMU_CLONE_STORAGE: Optional[str] = None
+
+    # Тёплый пул заранее созданных гостей (JSON-список профилей, см. app/warm_pool.py)
+    WARM_POOL_PROFILES: list[dict] = []
+    # Сколько гостей пул создаёт одновременно и как часто проверяет профили, секунды
+    WARM_POOL_CONCURRENCY: int = 2
+    WARM_POOL_INTERVAL: float = 30.0
+
+    # Сколько гостей массовое создание (POST /vms/batch, /lxc/batch) создаёт одновременно
+    BATCH_CONCURRENCY: int = 4
+
+    # Сбор RRD-метрик гостей и нод: период опроса и число параллельных запросов
+    METRICS_ENABLED: bool = True
+    METRICS_INTERVAL: float = 60.0
+    METRICS_CONCURRENCY: int = 10
+
+    # Автовыключение простаивающих гостей (работает в процессе бота).
+    # По умолчанию участвуют только гости с тегом idle-shutdown; при
+    # IDLE_SHUTDOWN_DEFAULT=true — все, кроме помеченных no-idle-shutdown
+    IDLE_SHUTDOWN_ENABLED: bool = False
+    IDLE_SHUTDOWN_DEFAULT: bool = False
+    # Окно простоя, отсрочка после уведомления и период проверки, секунды
+    IDLE_WINDOW: float = 86400.0
+    IDLE_GRACE: float = 1800.0
+    IDLE_CHECK_INTERVAL: float = 900.0
+    # Пороги простоя (p95 за окно): доля CPU, сеть и диск в байтах/с
+    IDLE_CPU_THRESHOLD: float = 0.05
+    IDLE_NET_THRESHOLD: float = 10240.0
+    IDLE_DISK_THRESHOLD: float = 102400.0
+    # Сколько ждать штатного выключения перед принудительной остановкой, секунды
+    IDLE_SHUTDOWN_TIMEOUT: float = 180.0
+
+    # Оповещения администраторам в Telegram (работают в процессе бота)
+    ALERTS_ENABLED: bool = True
+    ALERTS_INTERVAL: float = 60.0
+    # Пороги памяти гостя и заполнения диска/хранилища, %; тревога снимается ниже порога на ALERT_HYSTERESIS
+    ALERT_MEMORY_PERCENT: float = 90.0
+    ALERT_DISK_PERCENT: float = 90.0
+    ALERT_HYSTERESIS: float = 5.0
+    # Сколько выборок подряд нужно, чтобы тревога сработала или снялась
+    ALERT_SAMPLES: int = 2
+    # Проверять, отвечает ли qemu-guest-agent у VM, где он включён
+    ALERT_AGENT_CHECK: bool = True
+
+    # Redis для блокировок операций над гостями между API и ботом
+    # (без него блокировки действуют только внутри одного процесса)
+    REDIS_URL: Optional[str] = None
+    # Аренда блокировки (продлевается, пока операция идёт) и сколько ждать чужую операцию, секунды
+    GUEST_LOCK_LEASE: float = 30.0
+    GUEST_LOCK_WAIT: float = 60.0
+    # Сколько живёт резерв vmid массового создания, если процесс упал, не сняв его, секунды
+    VMID_RESERVATION_TTL: float = 3600.0
+
+    # Журнал действий (таблица audit_events): размер очереди в памяти,
+    # сколько событий пишется одним INSERT и как долго они копятся, секунды
+    AUDIT_QUEUE_SIZE: int = 10000
+    AUDIT_BATCH_SIZE: int = 500
+    AUDIT_FLUSH_INTERVAL: float = 1.0
+
 
 settings = Settings()
@@ -0,0 +1,162 @@
+import re
+from dataclasses import dataclass
+from typing import Optional
+
+# Диски в конфигурации гостя, по которым считается размер (первый найденный)
+QEMU_DISK_KEYS = tuple(
+    f"{bus}{i}" for bus in ("scsi", "virtio", "sata", "ide") for i in range(4)
+)
+_SIZE_RE = re.compile(r"(?:^|,)size=(\d+(?:\.\d+)?)([KMGT]?)", re.IGNORECASE)
+_UNITS = {"": 1 << 30, "K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+MB = 1 << 20
+GB = 1 << 30
+
+
+def _int(value, default: int = 0) -> int:
+    if value is None or value == "":
+        return default
+    try:
+        return int(float(value))
+    except (ValueError, TypeError):
+        return default
+
+
+def _float(value, default: float = 0.0) -> float:
+    if value is None or value == "":
+        return default
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return default
+
+
+def parse_tags(value) -> tuple[str, ...]:
+    """Proxmox хранит теги строкой через ';' (иногда через ',' или пробел)."""
+    if not value:
+        return ()
+    if isinstance(value, (list, tuple)):
+        return tuple(value)
+    return tuple(t for t in str(value).replace(",", ";").replace(" ", ";").split(";") if t)
+
+
+def parse_disk_size(volume) -> int:
+    """Размер диска в байтах из строки вида ``local-lvm:vm-100-disk-0,size=32G``.
+
+    Старый формат при создании (``local-lvm:10``) означает размер в ГБ.
+    """
+    if volume is None:
+        return 0
+    volume = str(volume)
+    if "media=cdrom" in volume or "cloudinit" in volume:
+        return 0
+    m = _SIZE_RE.search(volume)
+    if m:
+        return int(float(m.group(1)) * _UNITS[m.group(2).upper()])
+    tail = volume.split(",", 1)[0].rsplit(":", 1)[-1]
+    return int(float(tail) * GB) if tail.replace(".", "", 1).isdigit() else 0
+
+
+@dataclass(slots=True)
+class Guest:
+    """Типизированная запись о госте (VM или LXC).
+
+    Единицы — как в Proxmox API: память и диск в байтах, ``cpu`` — доля
+    загрузки. Все потребители (роутеры, бот, инвентарь) читают одни и те
+    же поля вместо ``dict.get`` с разными значениями по умолчанию.
+    """
+
+    vmid: int
+    type: str = "qemu"
+    name: str = ""
+    status: str = "unknown"
+    node: Optional[str] = None
+    tags: tuple[str, ...] = ()
+    template: bool = False
+    cpus: int = 1
+    maxmem: int = 0
+    maxdisk: int = 0
+    mem: int = 0
+    disk: int = 0
+    cpu: float = 0.0
+    uptime: int = 0
+    os: Optional[str] = None
+    ip: Optional[str] = None
+
+    @classmethod
+    def from_resource(cls, item: dict, type_: Optional[str] = None) -> "Guest":
+        """Разобрать элемент ``/cluster/resources`` или ``/nodes/{node}/{type}``."""
+        vmid = _int(item.get("vmid"))
+        type_ = type_ or item.get("type") or "qemu"
+        return cls(
+            vmid=vmid,
+            type=type_,
+            name=item.get("name") or f"{'vm' if type_ == 'qemu' else 'lxc'}-{vmid}",
+            status=item.get("status") or "unknown",
+            node=item.get("node"),
+            tags=parse_tags(item.get("tags")),
+            template=bool(_int(item.get("template"))),
+            cpus=_int(item.get("maxcpu", item.get("cpus")), 1),
+            maxmem=_int(item.get("maxmem")),
+            maxdisk=_int(item.get("maxdisk")),
+            mem=_int(item.get("mem")),
+            disk=_int(item.get("disk")),
+            cpu=_float(item.get("cpu")),
+            uptime=_int(item.get("uptime")),
+            ip=item.get("ip"),
+        )
+
+    def apply_config(self, config: dict) -> "Guest":
+        """Дополнить запись данными из ``/config`` (имя, ядра, память, диск, ОС)."""
+        if not config:
+            return self
+        if self.type == "lxc":
+            self.name = config.get("hostname") or self.name
+            template = config.get("ostemplate")
+            if template:
+                self.os = template.split("/")[-1].split(".tar")[0]
+            else:
+                self.os = config.get("ostype") or self.os
+            disk = parse_disk_size(config.get("rootfs"))
+        else:
+            self.name = config.get("name") or self.name
+            self.os = config.get("ostype") or self.os
+            disk = next(
+                (size for size in map(parse_disk_size, (config.get(k) for k in QEMU_DISK_KEYS)) if size),
+                0,
+            )
+        self.cpus = _int(config.get("cores"), self.cpus) * _int(config.get("sockets"), 1)
+        memory = _int(config.get("memory"))
+        if memory:
+            self.maxmem = memory * MB
+        if disk:
+            self.maxdisk = disk
+        if "tags" in config:
+            self.tags = parse_tags(config.get("tags"))
+        return self
+
+    def apply_status(self, status: dict) -> "Guest":
+        """Дополнить запись данными из ``/status/current``."""
+        if not status:
+            return self
+        self.status = status.get("status") or self.status
+        self.uptime = _int(status.get("uptime"))
+        self.cpu = _float(status.get("cpu"))
+        self.mem = _int(status.get("mem"))
+        self.disk = _int(status.get("disk"))
+        self.cpus = _int(status.get("cpus"), self.cpus)
+        self.maxmem = _int(status.get("maxmem"), self.maxmem)
+        self.maxdisk = _int(status.get("maxdisk"), self.maxdisk)
+        return self
+
+    @property
+    def running(self) -> bool:
+        return self.status == "running"
+
+    @property
+    def memory_mb(self) -> int:
+        return self.maxmem // MB
+
+    @property
+    def disk_gb(self) -> int:
+        return round(self.maxdisk / GB)
+
@@ -0,0 +1,178 @@
+import logging
+import time
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.dialects.postgresql import insert
+
+from app.database import SessionLocal
+from app.models import VM
+
+logger = logging.getLogger(__name__)
+
+# Поля записи, которые можно обновлять (vmid — ключ)
+FIELDS = ("name", "type", "os", "ip", "status", "password")
+
+
+@dataclass(frozen=True)
+class GuestRecord:
+    """Запись о созданном госте: то, чего нет в Proxmox (прежде всего пароль)."""
+
+    vmid: int
+    name: Optional[str] = None
+    type: Optional[str] = None
+    os: Optional[str] = None
+    ip: Optional[str] = None
+    status: Optional[str] = None
+    password: Optional[str] = None
+
+    @classmethod
+    def from_row(cls, row: VM) -> "GuestRecord":
+        return cls(vmid=row.vmid, **{f: getattr(row, f) for f in FIELDS})
+
+
+class GuestRecords:
+    """Таблица ``vms`` с кэшем чтения.
+
+    ``save`` — upsert по vmid (``INSERT ... ON CONFLICT``): переданные поля
+    обновляются, ``None`` не затирает сохранённое. ``get_many`` берёт из кэша
+    что есть, остальное — одним запросом по уникальному индексу vmid; кэш
+    помнит и отсутствие записи (на ``missing_ttl``), чтобы карточки гостей,
+    созданных не через нас, не ходили в БД при каждом открытии. Запись через
+    этот процесс сразу обновляет кэш; чужие изменения видны через ``ttl``.
+    """
+
+    def __init__(self, ttl: float = 300.0, missing_ttl: float = 30.0, max_size: int = 10000):
+        self.ttl = ttl
+        self.missing_ttl = missing_ttl
+        self.max_size = max_size
+        # vmid -> (до какого момента верно, запись или None — записи нет)
+        self._cache: dict[int, tuple[float, Optional[GuestRecord]]] = {}
+        self.queries = 0
+
+    def _remember(self, vmid: int, record: Optional[GuestRecord]):
+        if len(self._cache) >= self.max_size:
+            # Самые старые записи первыми (dict хранит порядок вставки)
+            for key in list(self._cache)[: self.max_size // 10]:
+                del self._cache[key]
+        self._cache.pop(vmid, None)
+        ttl = self.ttl if record is not None else self.missing_ttl
+        self._cache[vmid] = (time.monotonic() + ttl, record)
+
+    def invalidate(self, vmid: Optional[int] = None):
+        if vmid is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(vmid, None)
+
+    async def get_many(self, vmids: Iterable[int]) -> dict[int, GuestRecord]:
+        """Записи по vmid (у кого записи нет — того нет в результате)."""
+        now = time.monotonic()
+        result: dict[int, GuestRecord] = {}
+        missing = []
+        for vmid in dict.fromkeys(vmids):
+            cached = self._cache.get(vmid)
+            if cached is not None and cached[0] > now:
+                if cached[1] is not None:
+                    result[vmid] = cached[1]
+            else:
+                missing.append(vmid)
+        if not missing:
+            return result
+
+        self.queries += 1
+        async with SessionLocal() as db:
+            rows = await db.scalars(select(VM).where(VM.vmid.in_(missing)))
+            found = {row.vmid: GuestRecord.from_row(row) for row in rows}
+        for vmid in missing:
+            self._remember(vmid, found.get(vmid))
+        result.update(found)
+        return result
+
+    async def get(self, vmid: int) -> Optional[GuestRecord]:
+        return (await self.get_many([vmid])).get(vmid)
+
+    async def save_many(self, records: list[dict]):
+        """Upsert записей (словари с ``vmid`` и любыми полями из ``FIELDS``).
+
+        Raises:
+            Exception: ошибка БД.
+        """
+        if not records:
+            return
+        # Один vmid дважды в одном INSERT ... ON CONFLICT нельзя — последняя запись побеждает
+        rows = list({r["vmid"]: {"vmid": r["vmid"], **{f: r.get(f) for f in FIELDS}} for r in records}.values())
+        stmt = insert(VM).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[VM.vmid],
+            set_={f: func.coalesce(stmt.excluded[f], getattr(VM, f)) for f in FIELDS},
+        ).returning(VM)
+        async with SessionLocal() as db:
+            saved = (await db.scalars(stmt)).all()
+            await db.commit()
+        for row in saved:
+            self._remember(row.vmid, GuestRecord.from_row(row))
+
+    async def save(self, vmid: int, **fields) -> bool:
+        """Сохранить гостя; ошибку БД только логируем — гость уже создан. False — не сохранилось."""
+        try:
+            await self.save_many([{"vmid": vmid, **fields}])
+            return True
+        except Exception as e:
+            logger.error(f"Failed to save guest record {vmid}: {e}")
+            return False
+
+    async def delete(self, vmid: int, status: Optional[str] = None):
+        """Удалить запись (например, вместе с гостем — vmid может достаться новому).
+
+        ``status`` — удалить, только если у записи такой статус.
+        """
+        query = delete(VM).where(VM.vmid == vmid)
+        if status is not None:
+            query = query.where(VM.status == status)
+        try:
+            async with SessionLocal() as db:
+                await db.execute(query)
+                await db.commit()
+        except Exception as e:
+            logger.error(f"Failed to delete guest record {vmid}: {e}")
+        self.invalidate(vmid)
+
+    async def take(self, vmid: int, status: str, new_status: str) -> Optional[GuestRecord]:
+        """Сменить статус записи с ``status`` на ``new_status`` одним UPDATE.
+
+        None — у записи уже другой статус (например, гостя забрал другой
+        воркер) или записи нет.
+
+        Raises:
+            Exception: ошибка БД.
+        """
+        stmt = (
+            update(VM)
+            .where(VM.vmid == vmid, VM.status == status)
+            .values(status=new_status)
+            .returning(VM)
+        )
+        async with SessionLocal() as db:
+            row = (await db.scalars(stmt)).first()
+            await db.commit()
+        if row is None:
+            self.invalidate(vmid)
+            return None
+        record = GuestRecord.from_row(row)
+        self._remember(vmid, record)
+        return record
+
+    async def with_status(self, status: str) -> dict[int, GuestRecord]:
+        """Все записи с данным статусом (в обход кэша)."""
+        self.queries += 1
+        async with SessionLocal() as db:
+            rows = await db.scalars(select(VM).where(VM.status == status))
+            records = {row.vmid: GuestRecord.from_row(row) for row in rows}
+        for vmid, record in records.items():
+            self._remember(vmid, record)
+        return records
+
+
+guest_records = GuestRecords()
@@ -0,0 +1,209 @@
+import asyncio
+import logging
+from dataclasses import replace
+from typing import Optional
+
+from fastapi import Request, Response
+
+from app.audit import audit
+from app.guest import Guest
+from app.guest_records import guest_records
+from app.http_cache import (
+    body_etag, cache_key, is_not_modified, json_response, not_modified, request_key, response_cache
+)
+from app.inventory import Inventory, inventory
+from app.inventory_sync import InventorySync, inventory_sync
+from app.locks import guest_locks
+from app.proxmox import ProxmoxAPI, ProxmoxUnavailable, proxmox_health
+from app.schemas import VMPage, VMResponse, guest_fields, parse_fields
+
+logger = logging.getLogger(__name__)
+
+# Действие -> (метод ProxmoxAPI, статус в ответе)
+POWER_ACTIONS = {
+    "start": ("start_vm", "started"),
+    "stop": ("stop_vm", "stopped"),
+    "shutdown": ("shutdown_vm", "shutting_down"),
+    "delete": ("delete_vm", "deleted"),
+}
+
+
+class GuestService:
+    """Чтение и операции над гостями, общие для ``/guests``, ``/vms`` и ``/lxc``.
+
+    Списки строятся по одному снимку инвентаря (qemu и lxc приходят одним
+    запросом ``/cluster/resources``), гости страницы дополняются
+    конфигурацией и IP параллельно, независимо от типа. Ответы кэшируются
+    по версии инвентаря одинаково для всех роутеров; ``type_=None`` — гости
+    обоих типов.
+    """
+
+    def __init__(self, inventory: Inventory, sync: InventorySync, proxmox: ProxmoxAPI):
+        self.inventory = inventory
+        self.sync = sync
+        self.proxmox = proxmox
+
+    async def hydrate(self, guest: Guest, cached_only: bool = False) -> tuple[VMResponse, bool]:
+        """Дополнить запись инвентаря конфигурацией и IP (только для гостей страницы).
+
+        Возвращает ответ и признак полноты: False, если конфигурацию получить
+        не удалось или гость запущен, а IP ещё неизвестен (агент не ответил).
+        ``cached_only`` — Proxmox недоступен: только закэшированная конфигурация, без IP.
+        """
+        # Снимок общий для всех запросов — дополняем копию
+        guest = replace(guest)
+        if cached_only:
+            config = self.sync.configs.get(guest.vmid)
+            if config is not None:
+                guest.apply_config(config)
+            return VMResponse.from_guest(guest), False
+
+        async def ip() -> Optional[str]:
+            if not guest.running:
+                return None
+            return await self.proxmox.get_vm_ip(guest.vmid, guest.type, timeout=1, node=guest.node)
+
+        config, guest.ip = await asyncio.gather(self.sync.config(guest), ip(), return_exceptions=True)
+        if isinstance(guest.ip, BaseException):
+            guest.ip = None
+        if not isinstance(config, BaseException):
+            guest.apply_config(config)
+        complete = not isinstance(config, BaseException) and (guest.ip is not None or not guest.running)
+        return VMResponse.from_guest(guest), complete
+
+    async def resolve(self, vmid: int, type_: Optional[str] = None) -> str:
+        """Тип гостя по снимку инвентаря.
+
+        Raises:
+            LookupError: гостя (такого типа) нет в кластере.
+        """
+        guest = (await self.inventory.snapshot()).get(vmid)
+        if guest is None or (type_ is not None and guest.type != type_):
+            raise LookupError(f"Guest {vmid} not found")
+        return guest.type
+
+    async def page(
+        self,
+        request: Request,
+        type_: Optional[str] = None,
+        status: Optional[str] = None,
+        name: Optional[str] = None,
+        node: Optional[str] = None,
+        tag: Optional[str] = None,
+        sort: str = "vmid",
+        limit: int = 50,
+        cursor: Optional[str] = None,
+    ) -> Response:
+        """Страница гостей, закэшированная по версии инвентаря, с ETag по содержимому.
+
+        Raises:
+            ValueError: неверная сортировка или курсор.
+        """
+        snapshot = await self.inventory.snapshot()
+        stale = self.inventory.staleness()
+        # Пока версия инвентаря та же, ответ берётся из кэша без обращения к Proxmox
+        key = cache_key(snapshot.version, request_key(request))
+        etag = response_cache.etag(key)
+        if etag is not None and is_not_modified(request, etag):
+            return not_modified(etag, stale)
+        body = response_cache.get(key)
+        if body is None:
+            page = snapshot.query(
+                type_=type_, status=status, node=node, tag=tag, name=name,
+                sort=sort, limit=limit, cursor=cursor
+            )
+            degraded = self.inventory.degraded
+            try:
+                hydrated = await asyncio.wait_for(
+                    asyncio.gather(*(self.hydrate(guest, cached_only=degraded) for guest in page.items)),
+                    self.inventory.refresh_timeout,
+                )
+            except asyncio.TimeoutError:
+                degraded = True
+                hydrated = await asyncio.gather(*(self.hydrate(guest, cached_only=True) for guest in page.items))
+            # Во время дополнения Proxmox признан недоступным: часть гостей без конфигурации и IP.
+            # Единичный сбой ниже порога сюда не относится — такой ответ просто неполный
+            degraded = degraded or proxmox_health.down
+            items = [item for item, _ in hydrated]
+            body = VMPage(items=items, total=page.total, next_cursor=page.next_cursor).model_dump_json().encode()
+            if degraded:
+                # Неполный ответ (без IP) не кэшируем и не отдаём с ETag
+                return json_response(body, stale=stale or 0)
+            # Ответ без IP части гостей перечитывается, когда их агенты ответят
+            complete = all(done for _, done in hydrated)
+            etag = response_cache.put(key, body, ttl=None if complete else self.inventory.ttl)
+            if is_not_modified(request, etag):
+                return not_modified(etag, stale)
+        return json_response(body, etag, stale)
+
+    async def detail(
+        self, request: Request, vmid: int, type_: Optional[str] = None, fields: Optional[str] = None
+    ) -> Response:
+        """Гость, закэшированный по его отпечатку, с ETag по содержимому.
+
+        ``fields`` — см. ``ProxmoxAPI.fetch_guest``; ``type_=None`` — тип
+        берётся из снимка инвентаря.
+
+        Raises:
+            ValueError: неизвестное поле.
+            LookupError: тип не указан, а гостя нет в снимке.
+        """
+        selected = parse_fields(fields)
+        snapshot = await self.inventory.snapshot()
+        stale = self.inventory.staleness()
+        key = None
+        body = None
+        if vmid in snapshot.fingerprints:
+            # Ключ по отпечатку самого гостя: изменения других гостей его не сбрасывают
+            key = cache_key(snapshot.fingerprints[vmid], request_key(request))
+            etag = response_cache.etag(key)
+            if etag is not None and is_not_modified(request, etag):
+                return not_modified(etag, stale)
+            body = response_cache.get(key)
+        if body is None:
+            if type_ is None:
+                type_ = await self.resolve(vmid)
+
+            known = snapshot.get(vmid)
+            if known is not None and known.type == type_:
+                try:
+                    if self.inventory.degraded:
+                        raise ProxmoxUnavailable("Proxmox is unavailable")
+                    guest = await self.proxmox.fetch_guest(
+                        vmid, type_, fields=guest_fields(selected),
+                        timeout=self.inventory.refresh_timeout, ip_timeout=1,
+                    )
+                except (ProxmoxUnavailable, asyncio.TimeoutError):
+                    # Статус или конфигурация не получены вовремя — гость из последнего снимка
+                    item, _ = await self.hydrate(known, cached_only=True)
+                    body = item.model_dump_json(include=selected).encode()
+                    return json_response(body, stale=self.inventory.staleness() or 0)
+            else:
+                guest = await self.proxmox.fetch_guest(vmid, type_, fields=guest_fields(selected))
+            body = VMResponse.from_guest(guest).model_dump_json(include=selected).encode()
+            if key is None:
+                etag = body_etag(body)
+            else:
+                # IP запрошен, а агент ещё не ответил — ответ перечитается раньше
+                pending = guest.running and guest.ip is None and (selected is None or "ip" in selected)
+                etag = response_cache.put(key, body, ttl=self.inventory.ttl if pending else None)
+            if is_not_modified(request, etag):
+                return not_modified(etag, stale)
+        return json_response(body, etag, stale)
+
+    async def power(self, vmid: int, type_: str, action: str, actor: str) -> dict:
+        """Выполнить действие (``POWER_ACTIONS``) под блокировкой гостя и дождаться задачи.
+
+        Raises:
+            GuestBusy: над гостем идёт другая операция.
+        """
+        method, result = POWER_ACTIONS[action]
+        async with audit.track(action, actor, "api", vmid, type_), guest_locks.hold(vmid, action):
+            await self.proxmox.wait_task(await getattr(self.proxmox, method)(vmid, type_))
+        if action == "delete":
+            await guest_records.delete(vmid)
+        self.inventory.invalidate()
+        return {"status": result, "vmid": vmid}
+
+
+guest_service = GuestService(inventory, inventory_sync, ProxmoxAPI())
@@ -0,0 +1,138 @@
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import AsyncIterator, Optional
+
+from fastapi import Request, Response
+
+from app.config import settings
+
+
+def cache_key(*parts) -> str:
+    """Ключ кэша ответов из версии данных и ключа запроса."""
+    raw = "|".join(str(p) for p in parts).encode()
+    return hashlib.blake2b(raw, digest_size=12).hexdigest()
+
+
+def body_etag(body: bytes) -> str:
+    """Сильный ETag по содержимому ответа.
+
+    Ответ включает поля, которых нет в версии инвентаря (IP, ОС из
+    конфигурации), поэтому ETag считается по самим байтам, а не по версии.
+    """
+    return f'"{hashlib.blake2b(body, digest_size=12).hexdigest()}"'
+
+
+def request_key(request: Request) -> str:
+    """Путь и параметры запроса в каноническом порядке."""
+    params = "&".join(f"{k}={v}" for k, v in sorted(request.query_params.multi_items()))
+    return f"{request.url.path}?{params}"
+
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    """Проверить If-None-Match (список ETag, слабые W/ и '*')."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+class ResponseCache:
+    """LRU сериализованных JSON-ответов и их ETag по ключу ``cache_key``.
+
+    Пока версия инвентаря не изменилась, повторный запрос отдаёт готовые
+    байты без обращения к Proxmox и без сериализации Pydantic-моделей.
+    Ключ не учитывает IP и ОС из конфигурации, поэтому запись живёт не
+    дольше ``ttl`` секунд (ответ, где ещё не всё дополнено, — меньше, см.
+    ``put``). ETag хранятся дольше тел (до ``maxsize * etags_ratio``
+    записей): условный запрос получает 304, даже если тело уже вытеснено.
+    """
+
+    def __init__(self, maxsize: int = 256, ttl: float = 60.0, etags_ratio: int = 16):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.etags_ratio = etags_ratio
+        self._items: OrderedDict[str, bytes] = OrderedDict()
+        # key -> (ETag, time.monotonic(), после которого запись недействительна)
+        self._etags: OrderedDict[str, tuple[str, float]] = OrderedDict()
+
+    def _live(self, key: str) -> Optional[str]:
+        entry = self._etags.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() >= entry[1]:
+            del self._etags[key]
+            self._items.pop(key, None)
+            return None
+        self._etags.move_to_end(key)
+        return entry[0]
+
+    def etag(self, key: str) -> Optional[str]:
+        """ETag действующей записи (тело могло быть уже вытеснено)."""
+        return self._live(key)
+
+    def get(self, key: str) -> Optional[bytes]:
+        if self._live(key) is None:
+            return None
+        body = self._items.get(key)
+        if body is not None:
+            self._items.move_to_end(key)
+        return body
+
+    def put(self, key: str, body: bytes, ttl: Optional[float] = None) -> str:
+        """Сохранить ответ на ``ttl`` секунд (по умолчанию ``self.ttl``); вернуть его ETag."""
+        etag = body_etag(body)
+        self._items[key] = body
+        self._items.move_to_end(key)
+        self._etags[key] = (etag, time.monotonic() + (self.ttl if ttl is None else ttl))
+        self._etags.move_to_end(key)
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+        while len(self._etags) > self.maxsize * self.etags_ratio:
+            self._etags.popitem(last=False)
+        return etag
+
+    def items(self) -> list[tuple[str, bytes, float]]:
+        """Записи с телами и оставшимся временем жизни, от давних к свежим (для сохранения)."""
+        now = time.monotonic()
+        return [
+            (key, body, self._etags[key][1] - now)
+            for key, body in self._items.items()
+            if key in self._etags and self._etags[key][1] > now
+        ]
+
+
+# Заголовок ответа, собранного из устаревшего снимка: возраст данных в секундах
+STALE_HEADER = "X-Inventory-Stale"
+
+
+def not_modified(etag: str, stale: Optional[float] = None) -> Response:
+    response = Response(status_code=304, headers={"ETag": etag})
+    if stale is not None:
+        response.headers[STALE_HEADER] = str(int(stale))
+    return response
+
+
+def json_response(body: bytes, etag: Optional[str] = None, stale: Optional[float] = None) -> Response:
+    """JSON-ответ из готовых байт; ``stale`` — возраст данных, если они устарели."""
+    response = Response(content=body, media_type="application/json", headers={"ETag": etag} if etag else None)
+    if stale is not None:
+        response.headers[STALE_HEADER] = str(int(stale))
+    return response
+
+
+async def ndjson_stream(records: AsyncIterator[dict]) -> AsyncIterator[bytes]:
+    """Кодировать записи в NDJSON по одной строке, закрывая источник при обрыве."""
+    try:
+        async for record in records:
+            yield json.dumps(record, ensure_ascii=False, default=str).encode() + b"\n"
+    finally:
+        await records.aclose()
+
+
+response_cache = ResponseCache(ttl=settings.RESPONSE_CACHE_TTL)
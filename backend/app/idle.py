@@ -0,0 +1,276 @@
+import asyncio
+import logging
+import time
+import warnings
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional
+
+import numpy as np
+
+from app.audit import audit
+from app.config import settings
+from app.guest import Guest
+from app.inventory import inventory
+from app.locks import guest_locks
+from app.proxmox import ProxmoxAPI
+from app.warm_pool import TAG_PREFIX as POOL_TAG_PREFIX
+
+logger = logging.getLogger(__name__)
+
+# Теги Proxmox: явно включить автовыключение гостя / никогда его не выключать
+OPT_IN_TAG = "idle-shutdown"
+OPT_OUT_TAG = "no-idle-shutdown"
+# Наименьший timeframe RRD, покрывающий окно простоя (шаг: 1 мин, 30 мин, 3 ч, 12 ч)
+TIMEFRAMES = (("hour", 3600), ("day", 86400), ("week", 604800), ("month", 2592000))
+# Доля окна, которая должна быть покрыта точками RRD, иначе решение не принимаем
+MIN_COVERAGE = 0.8
+
+
+@dataclass
+class IdleVerdict:
+    """Результат проверки гостя: p95 нагрузки за окно и вывод о простое."""
+
+    idle: bool
+    cpu: Optional[float] = None  # Доля выделенных ядер
+    net: Optional[float] = None  # Байт/с, вход + выход
+    disk: Optional[float] = None  # Байт/с, чтение + запись
+    reason: str = ""
+
+
+def opted_in(guest: Guest, default: bool) -> bool:
+    """Участвует ли гость в автовыключении: тег важнее настройки по умолчанию.
+
+    Гости тёплого пула простаивают намеренно и не участвуют никогда: пул
+    считает их запущенными и выдаёт как готовые.
+    """
+    if OPT_OUT_TAG in guest.tags or any(t.startswith(POOL_TAG_PREFIX) for t in guest.tags):
+        return False
+    return default or OPT_IN_TAG in guest.tags
+
+
+def timeframe_for(window: float) -> str:
+    return next((name for name, span in TIMEFRAMES if span >= window), TIMEFRAMES[-1][0])
+
+
+def evaluate(
+    rows: list[dict],
+    window: float,
+    cpu_threshold: float,
+    net_threshold: float,
+    disk_threshold: float,
+    now: Optional[float] = None,
+) -> IdleVerdict:
+    """Простаивает ли гость: p95 CPU, сети и диска за окно ниже порогов.
+
+    p95, а не максимум, — чтобы редкий всплеск (cron, обновление пакетов)
+    не сбрасывал простой; но если данных за окно мало, гость считается занятым.
+    """
+    since = (now or time.time()) - window
+    points = [r for r in rows if (r.get("time") or 0) >= since]
+    if len(points) < 2:
+        return IdleVerdict(idle=False, reason="no samples")
+
+    def column(*names: str) -> np.ndarray:
+        values = np.array(
+            [[float(r[n]) if r.get(n) is not None else np.nan for n in names] for r in points],
+            dtype=np.float64,
+        )
+        # Сумма по полям; строка без единого значения остаётся NaN
+        return np.where(np.isnan(values).all(axis=1), np.nan, np.nansum(values, axis=1))
+
+    cpu, net, disk = column("cpu"), column("netin", "netout"), column("diskread", "diskwrite")
+    step = float(np.median(np.diff([r["time"] for r in points])))
+    coverage = np.count_nonzero(~np.isnan(cpu)) * step / window
+    if coverage < MIN_COVERAGE:
+        return IdleVerdict(idle=False, reason=f"coverage {coverage:.0%}")
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        p95 = [float(np.nanpercentile(c, 95)) for c in (cpu, net, disk)]
+    p95 = [None if np.isnan(v) else v for v in p95]
+    busy = [
+        name for name, value, limit in zip(
+            ("cpu", "net", "disk"), p95, (cpu_threshold, net_threshold, disk_threshold)
+        )
+        if value is not None and value > limit
+    ]
+    return IdleVerdict(
+        idle=not busy, cpu=p95[0], net=p95[1], disk=p95[2],
+        reason=f"busy: {', '.join(busy)}" if busy else "idle",
+    )
+
+
+# notify(event, guest, verdict): события idle → shutdown / stopped / failed
+Notifier = Callable[[str, Guest, IdleVerdict], Awaitable[None]]
+
+
+class IdleScheduler:
+    """Находит простаивающих гостей и выключает их после предупреждения.
+
+    Раз в ``interval`` проверяются работающие гости, участвующие в политике
+    (см. ``opted_in``) и проработавшие не меньше окна. Простаивающему гостю
+    отправляется уведомление; если через ``grace`` секунд он всё ещё
+    простаивает — штатное выключение (``shutdown_vm``), а если гость не
+    выключился за ``shutdown_timeout`` — принудительная остановка (``stop_vm``).
+    """
+
+    def __init__(
+        self,
+        proxmox: ProxmoxAPI,
+        notify: Optional[Notifier] = None,
+        window: float = 86400.0,
+        grace: float = 1800.0,
+        interval: float = 900.0,
+        default: bool = False,
+        cpu_threshold: float = 0.05,
+        net_threshold: float = 10240.0,
+        disk_threshold: float = 102400.0,
+        shutdown_timeout: float = 180.0,
+        concurrency: int = 5,
+    ):
+        self.proxmox = proxmox
+        self.notify = notify
+        self.window = window
+        self.grace = grace
+        self.interval = interval
+        self.default = default
+        self.thresholds = (cpu_threshold, net_threshold, disk_threshold)
+        self.shutdown_timeout = shutdown_timeout
+        self.concurrency = concurrency
+        # vmid -> момент выключения (после предупреждения)
+        self.pending: dict[int, float] = {}
+        # vmid -> до какого момента гостя не трогать
+        self.snoozed: dict[int, float] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def candidates(self, guests: list[Guest], now: float) -> list[Guest]:
+        return [
+            g for g in guests
+            if g.running and not g.template and opted_in(g, self.default)
+            and g.uptime >= self.window and self.snoozed.get(g.vmid, 0) <= now
+        ]
+
+    def snooze(self, vmid: int, seconds: Optional[float] = None):
+        """Не трогать гостя ``seconds`` секунд (по умолчанию — одно окно)."""
+        self.pending.pop(vmid, None)
+        self.snoozed[vmid] = time.time() + (seconds or self.window)
+
+    async def opt_out(self, guest: Guest):
+        """Исключить гостя из политики насовсем — тегом, который переживёт перезапуск."""
+        self.pending.pop(guest.vmid, None)
+        tags = [t for t in guest.tags if t != OPT_IN_TAG] + [OPT_OUT_TAG]
+        await self.proxmox.update_config(guest.vmid, guest.type, {"tags": ";".join(tags)}, node=guest.node)
+        inventory.invalidate()
+
+    async def inspect(self, guest: Guest) -> IdleVerdict:
+        rows = await self.proxmox.get_rrddata(
+            guest.vmid, guest.type, timeframe=timeframe_for(self.window), node=guest.node
+        )
+        return evaluate(rows, self.window, *self.thresholds)
+
+    async def power_off(self, guest: Guest) -> str:
+        """Штатно выключить гостя, при неудаче — остановить. Возвращает shutdown или stopped."""
+        async with guest_locks.hold(guest.vmid, "idle-shutdown"):
+            try:
+                await self.proxmox.wait_task(
+                    await self.proxmox.shutdown_vm(guest.vmid, guest.type), timeout=self.shutdown_timeout
+                )
+                return "shutdown"
+            except Exception as e:
+                logger.warning(f"Idle: shutdown of {guest.type} {guest.vmid} failed ({e}), stopping")
+            await self.proxmox.wait_task(await self.proxmox.stop_vm(guest.vmid, guest.type))
+            return "stopped"
+
+    async def _notify(self, event: str, guest: Guest, verdict: IdleVerdict):
+        if self.notify is None:
+            return
+        try:
+            await self.notify(event, guest, verdict)
+        except Exception as e:
+            logger.error(f"Idle: failed to send {event} notification for {guest.vmid}: {e}")
+
+    async def _handle(self, guest: Guest, verdict: IdleVerdict, now: float):
+        if not verdict.idle:
+            if self.pending.pop(guest.vmid, None) is not None:
+                logger.info(f"Idle: {guest.type} {guest.vmid} is active again ({verdict.reason})")
+            return
+
+        deadline = self.pending.get(guest.vmid)
+        if deadline is None:
+            self.pending[guest.vmid] = now + self.grace
+            logger.info(f"Idle: {guest.type} {guest.vmid} ({guest.name}) idle, shutting down in {self.grace:.0f}s")
+            await self._notify("idle", guest, verdict)
+            return
+        if now < deadline:
+            return
+
+        del self.pending[guest.vmid]
+        try:
+            async with audit.track("shutdown", "idle", "idle", guest.vmid, guest.type) as record:
+                event = await self.power_off(guest)
+                record.detail["result"] = event
+            logger.info(f"Idle: {guest.type} {guest.vmid} ({guest.name}) powered off ({event})")
+        except Exception as e:
+            logger.error(f"Idle: failed to power off {guest.type} {guest.vmid}: {e}")
+            event = "failed"
+        inventory.invalidate()
+        await self._notify(event, guest, verdict)
+
+    async def check(self):
+        """Один проход по кластеру."""
+        now = time.time()
+        snapshot = await inventory.snapshot()
+        guests = self.candidates(snapshot.guests(), now)
+        # Гость выключен вручную, исключён тегом или отложен — предупреждение снимается
+        for vmid in set(self.pending) - {g.vmid for g in guests}:
+            del self.pending[vmid]
+        for vmid in [v for v, until in self.snoozed.items() if until <= now]:
+            del self.snoozed[vmid]
+
+        limit = asyncio.Semaphore(self.concurrency)
+
+        async def one(guest: Guest):
+            async with limit:
+                try:
+                    verdict = await self.inspect(guest)
+                except Exception as e:
+                    logger.debug(f"Idle: failed to inspect {guest.vmid}: {e}")
+                    return
+            await self._handle(guest, verdict, now)
+
+        await asyncio.gather(*(one(g) for g in guests))
+
+    async def _run(self):
+        while True:
+            try:
+                await self.check()
+            except Exception as e:
+                logger.error(f"Idle check failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def start(self):
+        if self._task is None:
+            logger.info(
+                f"Starting idle shutdown: window {self.window:.0f}s, grace {self.grace:.0f}s, "
+                f"{'opt-out' if self.default else 'opt-in'} by tag"
+            )
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+idle_scheduler = IdleScheduler(
+    ProxmoxAPI(),
+    window=settings.IDLE_WINDOW,
+    grace=settings.IDLE_GRACE,
+    interval=settings.IDLE_CHECK_INTERVAL,
+    default=settings.IDLE_SHUTDOWN_DEFAULT,
+    cpu_threshold=settings.IDLE_CPU_THRESHOLD,
+    net_threshold=settings.IDLE_NET_THRESHOLD,
+    disk_threshold=settings.IDLE_DISK_THRESHOLD,
+    shutdown_timeout=settings.IDLE_SHUTDOWN_TIMEOUT,
+)
@@ -0,0 +1,345 @@
+import asyncio
+import base64
+import binascii
+import hashlib
+import json
+import logging
+import time
+from bisect import bisect_left, bisect_right
+from typing import NamedTuple, Optional
+
+from app.config import settings
+from app.guest import Guest
+from app.proxmox import ProxmoxAPI, proxmox_health
+
+logger = logging.getLogger(__name__)
+
+# Поля, по которым можно сортировать список гостей
+SORT_FIELDS = {
+    "vmid": lambda g: g.vmid,
+    "name": lambda g: g.name.lower(),
+    "status": lambda g: g.status,
+    "node": lambda g: g.node or "",
+    "cpu": lambda g: g.cpus,
+    "memory": lambda g: g.maxmem,
+    "disk": lambda g: g.maxdisk,
+    "uptime": lambda g: g.uptime,
+}
+
+# Поля, изменение которых меняет версию инвентаря (и ETag ответов).
+# Быстро меняющиеся метрики (uptime, cpu, mem) сюда не входят.
+TRACKED_FIELDS = ("type", "name", "status", "node", "tags", "template", "cpus", "maxmem", "maxdisk")
+
+
+def fingerprint(guest: Guest) -> str:
+    """Стабильный между процессами отпечаток отслеживаемых полей гостя."""
+    raw = repr(tuple(getattr(guest, f) for f in TRACKED_FIELDS)).encode()
+    return hashlib.blake2b(raw, digest_size=8).hexdigest()
+
+
+class Page(NamedTuple):
+    items: list
+    total: int
+    next_cursor: Optional[str]
+
+
+def encode_cursor(sort: str, key, vmid: int) -> str:
+    raw = json.dumps([sort, key, vmid], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[str, object, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        sort, key, vmid = json.loads(raw)
+        return sort, key, int(vmid)
+    except (binascii.Error, ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+
+
+class InventorySnapshot:
+    """Неизменяемый снимок гостей кластера с индексами для выборки страниц.
+
+    Индексы по статусу, ноде, типу и тегу — множества vmid; упорядочивания по
+    полям сортировки строятся лениво один раз на снимок. Стоимость страницы
+    зависит от её размера и селективности фильтра, а не от размера кластера.
+    """
+
+    def __init__(
+        self,
+        guests: list[Guest],
+        version: int,
+        fetched_at: float,
+        nodes: Optional[list[dict]] = None,
+        storages: Optional[list[dict]] = None,
+        resources: Optional[list[dict]] = None,
+    ):
+        self.version = version
+        self.fetched_at = fetched_at
+        # Исходный ответ /cluster/resources (для публикации и сохранения на диск)
+        self.resources: list[dict] = resources or []
+        # Ноды и хранилища из того же ответа /cluster/resources (для отчёта о ёмкости)
+        self.nodes: list[dict] = nodes or []
+        self.storages: list[dict] = storages or []
+        self.by_vmid: dict[int, Guest] = {}
+        self._index: dict[str, dict[str, set[int]]] = {
+            "status": {}, "node": {}, "type": {}, "tag": {},
+        }
+        self._orders: dict[str, list[tuple]] = {}
+        self._totals: dict[tuple, int] = {}
+        self.fingerprints: dict[int, str] = {}
+
+        for guest in guests:
+            vmid = guest.vmid
+            self.by_vmid[vmid] = guest
+            for field in ("status", "node", "type"):
+                self._index[field].setdefault(getattr(guest, field) or "", set()).add(vmid)
+            for tag in guest.tags:
+                self._index["tag"].setdefault(tag, set()).add(vmid)
+            self.fingerprints[vmid] = fingerprint(guest)
+
+        content = hashlib.blake2b(digest_size=16)
+        for vmid in sorted(self.fingerprints):
+            content.update(f"{vmid}:{self.fingerprints[vmid]};".encode())
+        self.content_hash = content.hexdigest()
+
+    def __len__(self) -> int:
+        return len(self.by_vmid)
+
+    def get(self, vmid: int) -> Optional[Guest]:
+        return self.by_vmid.get(vmid)
+
+    def guests(self, type_: Optional[str] = None) -> list[Guest]:
+        """Все гости (опционально одного типа), упорядоченные по vmid."""
+        vmids = self.by_vmid.keys() if type_ is None else self._index["type"].get(type_, ())
+        return [self.by_vmid[vmid] for vmid in sorted(vmids)]
+
+    def _order(self, field: str) -> list[tuple]:
+        order = self._orders.get(field)
+        if order is None:
+            key = SORT_FIELDS[field]
+            order = sorted((key(g), vmid) for vmid, g in self.by_vmid.items())
+            self._orders[field] = order
+        return order
+
+    def _candidates(self, filters: dict) -> Optional[set[int]]:
+        """Пересечение индексных множеств; None — без ограничений."""
+        result = None
+        sets = []
+        for field, value in filters.items():
+            if value is None:
+                continue
+            sets.append(self._index[field].get(value, set()))
+        for s in sorted(sets, key=len):
+            result = set(s) if result is None else result & s
+            if not result:
+                break
+        return result
+
+    def query(
+        self,
+        type_: Optional[str] = None,
+        status: Optional[str] = None,
+        node: Optional[str] = None,
+        tag: Optional[str] = None,
+        name: Optional[str] = None,
+        sort: str = "vmid",
+        limit: int = 50,
+        cursor: Optional[str] = None,
+    ) -> Page:
+        """Выбрать страницу гостей.
+
+        ``sort`` — имя поля, с префиксом ``-`` для сортировки по убыванию.
+        ``cursor`` — значение ``next_cursor`` предыдущей страницы.
+        """
+        desc = sort.startswith("-")
+        field = sort.lstrip("-")
+        if field not in SORT_FIELDS:
+            raise ValueError(f"Unsupported sort field: {field}")
+
+        candidates = self._candidates({"type": type_, "status": status, "node": node, "tag": tag})
+        needle = name.lower() if name else None
+
+        def matches(vmid: int) -> bool:
+            if candidates is not None and vmid not in candidates:
+                return False
+            if needle is not None and needle not in self.by_vmid[vmid].name.lower():
+                return False
+            return True
+
+        order = self._order(field)
+        if cursor:
+            cursor_sort, key, vmid = decode_cursor(cursor)
+            if cursor_sort != sort:
+                raise ValueError("Cursor does not match sort order")
+            try:
+                if desc:
+                    indexes = range(bisect_left(order, (key, vmid)) - 1, -1, -1)
+                else:
+                    indexes = range(bisect_right(order, (key, vmid)), len(order))
+            except TypeError:
+                raise ValueError("Invalid cursor")
+        else:
+            indexes = range(len(order) - 1, -1, -1) if desc else range(len(order))
+
+        items = []
+        last = None
+        more = False
+        for i in indexes:
+            key, vmid = order[i]
+            if not matches(vmid):
+                continue
+            if len(items) == limit:
+                more = True
+                break
+            items.append(self.by_vmid[vmid])
+            last = (key, vmid)
+
+        total_key = (type_, status, node, tag, needle)
+        total = self._totals.get(total_key)
+        if total is None:
+            if needle is None:
+                total = len(self.by_vmid) if candidates is None else len(candidates)
+            else:
+                pool = self.by_vmid if candidates is None else candidates
+                total = sum(1 for vmid in pool if matches(vmid))
+            self._totals[total_key] = total
+
+        next_cursor = encode_cursor(sort, *last) if more and last else None
+        return Page(items=items, total=total, next_cursor=next_cursor)
+
+
+class Inventory:
+    """Кэш инвентаря кластера поверх ``/cluster/resources``.
+
+    Снимок обновляется не чаще раза в ``ttl`` секунд, параллельные запросы
+    ждут одно общее обновление. После изменяющих операций вызывайте
+    ``invalidate()``.
+
+    Обновление ждут не дольше ``refresh_timeout`` секунд: если Proxmox не
+    ответил (или уже известно, что он недоступен — ``degraded``), отдаётся
+    последний снимок, а обновление продолжается в фоне. Насколько отданный
+    снимок устарел, говорит ``staleness()``. Без единого снимка ждать
+    приходится до конца обновления.
+
+    ``version`` монотонно растёт только когда меняется содержимое
+    отслеживаемых полей (``TRACKED_FIELDS``) — на нём строятся ETag.
+
+    Если подключён общий снимок (``shared``, см. app/inventory_share.py),
+    устаревший снимок сначала берётся у ведущего воркера, а версия — общая
+    для всех воркеров.
+    """
+
+    def __init__(self, proxmox: ProxmoxAPI, ttl: float = 10.0, refresh_timeout: float = 2.0):
+        self.proxmox = proxmox
+        self.ttl = ttl
+        self.refresh_timeout = refresh_timeout
+        self.version = 0
+        self._snapshot: Optional[InventorySnapshot] = None
+        # Идущее обновление (одно на всех ждущих) и ошибка последнего неудачного
+        self._updating: Optional[asyncio.Task] = None
+        self.error: Optional[Exception] = None
+        # SharedInventory, если снимок общий для нескольких воркеров
+        self.shared = None
+        # После invalidate() снимок перечитывается из Proxmox, а не у ведущего
+        self._forced = False
+
+    def _is_fresh(self) -> bool:
+        return (
+            self._snapshot is not None and not self._forced
+            and time.monotonic() - self._snapshot.fetched_at < self.ttl
+        )
+
+    @property
+    def degraded(self) -> bool:
+        """Proxmox недоступен или последнее обновление не удалось — чтения идут из снимка."""
+        return self.error is not None or proxmox_health.down
+
+    @property
+    def invalidated(self) -> bool:
+        return self._forced
+
+    def staleness(self) -> Optional[float]:
+        """Возраст снимка в секундах, если он устарел и не обновлён; иначе None."""
+        if self._snapshot is None or self._is_fresh():
+            return None
+        return time.monotonic() - self._snapshot.fetched_at
+
+    async def _update(self):
+        try:
+            if self.shared is None or self._forced or not await self.shared.pull():
+                await self.refresh()
+        except Exception as e:
+            if self.error is None:
+                logger.warning(f"Inventory refresh failed, serving the last snapshot: {e}")
+            self.error = e
+        else:
+            if self.error is not None:
+                logger.info("Inventory refresh recovered")
+            self.error = None
+
+    async def snapshot(self) -> InventorySnapshot:
+        """Получить актуальный снимок, а если обновить его не удаётся — последний.
+
+        Raises:
+            Exception: снимка ещё нет, а обновление не удалось.
+        """
+        if self._is_fresh():
+            return self._snapshot
+        if self._updating is None or self._updating.done():
+            self._updating = asyncio.create_task(self._update())
+        update = self._updating
+        if self._snapshot is None:
+            await asyncio.shield(update)
+            if self._snapshot is None:
+                raise self.error
+        elif not self.degraded:
+            try:
+                await asyncio.wait_for(asyncio.shield(update), self.refresh_timeout)
+            except asyncio.TimeoutError:
+                logger.debug(f"Inventory refresh takes longer than {self.refresh_timeout:g}s, serving the last snapshot")
+        return self._snapshot
+
+    @property
+    def current(self) -> Optional[InventorySnapshot]:
+        """Последний снимок без проверки свежести."""
+        return self._snapshot
+
+    def build(self, resources: list, fetched_at: float) -> InventorySnapshot:
+        """Снимок из ответа ``/cluster/resources`` (ещё не установленный)."""
+        guests = [Guest.from_resource(item) for item in resources if item.get("vmid") is not None]
+        nodes = [item for item in resources if item.get("type") == "node"]
+        storages = [item for item in resources if item.get("type") == "storage"]
+        return InventorySnapshot(guests, self.version, fetched_at, nodes, storages, resources)
+
+    def install(self, snapshot: InventorySnapshot, version: Optional[int] = None):
+        """Сделать снимок текущим; ``version`` — версия, выданная общим снимком."""
+        if version is not None:
+            self.version = version
+        elif self._snapshot is None or snapshot.content_hash != self._snapshot.content_hash:
+            self.version += 1
+        snapshot.version = self.version
+        self._snapshot = snapshot
+
+    async def refresh(self) -> InventorySnapshot:
+        # Без фильтра по типу: ноды и хранилища приходят тем же запросом
+        resources = await self.proxmox.get_cluster_resources(None)
+        snapshot = self.build(resources, time.monotonic())
+        self._forced = False
+        version = await self.shared.publish(snapshot) if self.shared is not None else None
+        self.install(snapshot, version)
+        logger.debug(f"Inventory refreshed: {len(self._snapshot)} guests, version {self.version}")
+        return self._snapshot
+
+    def bump(self):
+        """Поднять версию без перечитывания: изменилось то, чего нет в снимке (конфигурации)."""
+        self.version += 1
+        if self._snapshot is not None:
+            self._snapshot.version = self.version
+
+    def invalidate(self):
+        """Пометить снимок устаревшим — следующий запрос перечитает кластер."""
+        self._forced = True
+
+
+inventory = Inventory(ProxmoxAPI(), ttl=settings.INVENTORY_TTL, refresh_timeout=settings.INVENTORY_REFRESH_TIMEOUT)
@@ -0,0 +1,186 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from typing import Optional
+
+import redis.asyncio as aioredis
+from redis.exceptions import RedisError
+
+from app.config import settings
+from app.inventory import Inventory, InventorySnapshot, inventory
+from app.inventory_sync import InventorySync, inventory_sync
+
+logger = logging.getLogger(__name__)
+
+# Опубликовать снимок, если он новее опубликованного; версия растёт, только
+# когда меняется содержимое. Возвращает версию или -1 (есть снимок новее)
+_PUBLISH = """
+local current = redis.call('hmget', KEYS[1], 'fetched', 'hash', 'version')
+if current[1] and tonumber(current[1]) >= tonumber(ARGV[1]) then return -1 end
+local version = tonumber(current[3]) or 0
+if current[2] ~= ARGV[2] then version = version + 1 end
+redis.call('set', KEYS[2], ARGV[3])
+redis.call('hset', KEYS[1], 'fetched', ARGV[1], 'hash', ARGV[2], 'version', version)
+return version
+"""
+
+
+class SharedInventory:
+    """Снимок инвентаря, общий для нескольких воркеров API, через Redis.
+
+    Ведущий воркер (см. app/leader.py) раз в ``interval`` секунд читает
+    ``/cluster/resources``, проходит журнал задач (``InventorySync``) и
+    публикует ответ Proxmox вместе с digest конфигураций. Остальные воркеры,
+    когда их снимок устарел, забирают опубликованный (один короткий запрос
+    к Redis, тело — только если снимок новее), а конфигурации перечитывают
+    лишь у гостей, чей digest у ведущего изменился. Версия инвентаря (и ETag)
+    общая: её выдаёт Redis при публикации.
+
+    Запросы к Proxmox из воркеров остаются только там, где без них нельзя:
+    после собственной изменяющей операции (``invalidate``) воркер перечитывает
+    кластер сам и публикует результат, и если ведущий не публиковал дольше
+    ``ttl`` инвентаря.
+    """
+
+    def __init__(
+        self,
+        inventory: Inventory,
+        sync: InventorySync,
+        url: Optional[str],
+        interval: float = 5.0,
+        sync_enabled: bool = True,
+        prefix: str = "proxmox-cloud:inventory:",
+    ):
+        self.inventory = inventory
+        self.sync = sync
+        self.url = url
+        self.interval = interval
+        self.sync_enabled = sync_enabled
+        self.meta_key = f"{prefix}meta"
+        self.data_key = f"{prefix}data"
+        # Время (по часам Redis-публикаций) снимка, который у нас установлен
+        self._published = 0.0
+        # Digest конфигураций у ведущего
+        self.digests: dict[int, str] = {}
+        self._redis: Optional[aioredis.Redis] = None
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"pulls": 0, "publishes": 0, "stale": 0}
+
+    def _client(self) -> aioredis.Redis:
+        if self._redis is None:
+            self._redis = aioredis.from_url(self.url)
+        return self._redis
+
+    def attach(self):
+        """Подключить к инвентарю: устаревший снимок сначала ищется в Redis."""
+        if self.url:
+            self.inventory.shared = self
+
+    @property
+    def leading(self) -> bool:
+        return self._task is not None
+
+    async def publish(self, snapshot: InventorySnapshot) -> Optional[int]:
+        """Опубликовать свежий снимок (ответ ``/cluster/resources``); вернуть общую версию.
+
+        None — Redis недоступен или уже опубликован снимок новее.
+        """
+        if self.leading and self.sync_enabled:
+            self.digests = self.sync.digests()
+        fetched = time.time()
+        content = hashlib.blake2b(digest_size=16)
+        content.update(snapshot.content_hash.encode())
+        content.update(json.dumps(sorted(self.digests.items())).encode())
+        blob = json.dumps({"fetched": fetched, "resources": snapshot.resources, "digests": self.digests})
+        try:
+            version = await self._client().eval(
+                _PUBLISH, 2, self.meta_key, self.data_key, repr(fetched), content.hexdigest(), blob
+            )
+        except RedisError as e:
+            logger.warning(f"Failed to publish inventory snapshot: {e}")
+            return None
+        if version < 0:
+            return None
+        self._published = fetched
+        self.stats["publishes"] += 1
+        return int(version)
+
+    async def pull(self) -> bool:
+        """Установить опубликованный снимок; False — его нет или он устарел."""
+        try:
+            client = self._client()
+            fetched = await client.hget(self.meta_key, "fetched")
+            if fetched is None:
+                return False
+            age = time.time() - float(fetched)
+            if age >= self.inventory.ttl:
+                # Ведущий не публикует — читаем кластер сами
+                self.stats["stale"] += 1
+                return False
+            if float(fetched) <= self._published:
+                # Этот снимок уже установлен — только продлеваем его свежесть
+                current = self.inventory.current
+                if current is None:
+                    return False
+                current.fetched_at = time.monotonic() - age
+                return True
+            async with client.pipeline(transaction=True) as pipe:
+                meta, data = await pipe.hgetall(self.meta_key).get(self.data_key).execute()
+        except RedisError as e:
+            logger.warning(f"Failed to read shared inventory: {e}")
+            return False
+
+        payload = json.loads(data)
+        snapshot = self.inventory.build(
+            payload["resources"], time.monotonic() - (time.time() - payload["fetched"])
+        )
+        self.inventory.install(snapshot, int(meta[b"version"]))
+        self._published = payload["fetched"]
+        self.digests = {int(vmid): digest for vmid, digest in payload["digests"].items()}
+        if not self.leading:
+            self.sync.follow(snapshot, self.digests)
+        self.stats["pulls"] += 1
+        return True
+
+    async def _run(self):
+        while True:
+            started = time.monotonic()
+            try:
+                await self.inventory.refresh()
+                if self.sync_enabled and await self.sync.sync():
+                    # Изменились конфигурации — опубликовать новые digest
+                    snapshot = self.inventory.current
+                    version = await self.publish(snapshot)
+                    if version is not None:
+                        self.inventory.install(snapshot, version)
+            except Exception as e:
+                logger.error(f"Shared inventory refresh failed: {e}")
+            await asyncio.sleep(max(0.0, self.interval - (time.monotonic() - started)))
+
+    async def start(self):
+        """Обязанность ведущего: опрашивать Proxmox и публиковать снимки."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def close(self):
+        await self.stop()
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+
+shared_inventory = SharedInventory(
+    inventory,
+    inventory_sync,
+    settings.REDIS_URL if settings.INVENTORY_SHARED else None,
+    interval=settings.INVENTORY_TTL / 2,
+    sync_enabled=settings.INVENTORY_SYNC_ENABLED,
+)
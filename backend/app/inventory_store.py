@@ -0,0 +1,126 @@
+import json
+import logging
+import os
+import time
+from typing import Optional
+
+from app.config import settings
+from app.http_cache import ResponseCache, response_cache
+from app.inventory import Inventory, inventory
+from app.inventory_sync import InventorySync, inventory_sync
+
+logger = logging.getLogger(__name__)
+
+FORMAT = 2
+
+
+def cache_path(name: str) -> Optional[str]:
+    """Файл сохранённого инвентаря процесса ``name`` (api, bot) или None, если выключено."""
+    if not settings.INVENTORY_CACHE_DIR:
+        return None
+    return os.path.join(settings.INVENTORY_CACHE_DIR, f"inventory-{name}.json")
+
+
+class InventoryStore:
+    """Снимок инвентаря и кэши процесса между перезапусками.
+
+    При остановке в ``path`` пишутся ответ ``/cluster/resources`` с версией
+    инвентаря, кэш конфигураций ``InventorySync`` с позицией в журнале задач
+    и кэш готовых ответов; при запуске всё это восстанавливается, и первые
+    запросы после деплоя не ждут Proxmox. Снимок, устаревший за время
+    перезапуска, перечитывается первым запросом — это один запрос
+    ``/cluster/resources``; если кластер не изменился, версия остаётся
+    прежней и сохранённые ответы (и ETag клиентов) действительны.
+    Конфигурации перепроверяет первый проход синхронизации. Файл старше
+    ``max_age`` секунд не используется.
+    """
+
+    def __init__(
+        self,
+        inventory: Inventory,
+        sync: Optional[InventorySync],
+        cache: Optional[ResponseCache],
+        path: Optional[str],
+        max_age: float = 3600.0,
+    ):
+        self.inventory = inventory
+        self.sync = sync
+        self.cache = cache
+        self.path = path
+        self.max_age = max_age
+
+    def save(self) -> bool:
+        """Записать состояние в файл (атомарно); False — нечего или некуда писать."""
+        snapshot = self.inventory.current
+        if not self.path or snapshot is None:
+            return False
+        now = time.time()
+        # Снимок, помеченный устаревшим (invalidate), восстановится устаревшим
+        age = time.monotonic() - snapshot.fetched_at
+        payload = {
+            "format": FORMAT,
+            "saved": now,
+            "fetched": 0.0 if self.inventory.invalidated else now - age,
+            "version": snapshot.version,
+            "resources": snapshot.resources,
+        }
+        if self.sync is not None:
+            payload["sync"] = self.sync.state()
+        if self.cache is not None:
+            payload["responses"] = [[key, body.decode(), ttl] for key, body, ttl in self.cache.items()]
+
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(tmp, "w") as f:
+                json.dump(payload, f, separators=(",", ":"))
+            # Несколько воркеров пишут один файл: читатель увидит целиком один из них
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logger.warning(f"Failed to save inventory cache: {e}")
+            return False
+        logger.info(f"Inventory cache saved: {len(snapshot)} guests, version {snapshot.version}")
+        return True
+
+    def load(self) -> bool:
+        """Восстановить сохранённое состояние; False — файла нет, он устарел или повреждён."""
+        if not self.path or self.inventory.current is not None:
+            return False
+        try:
+            with open(self.path) as f:
+                payload = json.load(f)
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError) as e:
+            logger.warning(f"Failed to read inventory cache: {e}")
+            return False
+        if payload.get("format") != FORMAT:
+            return False
+        now = time.time()
+        if now - payload["saved"] > self.max_age:
+            logger.info("Inventory cache is too old, starting cold")
+            return False
+
+        snapshot = self.inventory.build(payload["resources"], time.monotonic() - (now - payload["fetched"]))
+        self.inventory.install(snapshot, payload["version"])
+        if self.sync is not None and "sync" in payload:
+            self.sync.restore(payload["sync"], snapshot)
+        if self.cache is not None:
+            # Время простоя засчитывается в срок жизни ответа
+            for key, body, ttl in payload.get("responses", []):
+                if ttl > now - payload["saved"]:
+                    self.cache.put(key, body.encode(), ttl=ttl - (now - payload["saved"]))
+        logger.info(
+            f"Inventory cache loaded: {len(snapshot)} guests, version {snapshot.version}, "
+            f"{now - payload['fetched']:.0f}s old"
+        )
+        return True
+
+
+inventory_store = InventoryStore(
+    inventory,
+    inventory_sync if settings.INVENTORY_SYNC_ENABLED else None,
+    response_cache,
+    cache_path("api"),
+    max_age=settings.INVENTORY_CACHE_MAX_AGE,
+)
@@ -0,0 +1,246 @@
+import asyncio
+import logging
+from typing import Optional
+
+from app.config import settings
+from app.guest import Guest
+from app.inventory import Inventory, InventorySnapshot, inventory
+
+logger = logging.getLogger(__name__)
+
+# Задачи, которые меняют только состояние гостя, но не его конфигурацию:
+# состояние и так приходит в /cluster/resources
+STATE_ONLY_TASKS = frozenset({
+    "qmstart", "qmstop", "qmshutdown", "qmreboot", "qmreset", "qmsuspend", "qmresume",
+    "vzstart", "vzstop", "vzshutdown", "vzreboot", "vzsuspend", "vzresume",
+    "vncproxy", "vncshell", "termproxy", "spiceproxy",
+})
+
+# Поля записи /cluster/resources, изменение которых означает изменение конфигурации
+# (или её места — ноды); статус и метрики сюда не входят
+CONFIG_FIELDS = ("node", "name", "tags", "template", "cpus", "maxmem", "maxdisk")
+
+
+def _shape(guest: Guest) -> tuple:
+    return tuple(getattr(guest, f) for f in CONFIG_FIELDS)
+
+
+def _digest(config: dict):
+    # Proxmox отдаёт SHA1 конфигурации в поле digest; без него сравниваем целиком
+    return config.get("digest") or config
+
+
+class InventorySync:
+    """Инкрементальная синхронизация конфигураций гостей.
+
+    Список гостей с состоянием — один запрос ``/cluster/resources`` (снимок
+    ``Inventory``), а конфигурация — отдельный запрос на каждого гостя.
+    Конфигурации кэшируются в ``configs`` и перечитываются, только когда
+    гость помечен изменённым:
+
+    * в журнале ``/cluster/tasks`` с прошлого прохода появилась задача над
+      ним (кроме ``STATE_ONLY_TASKS``); ещё идущая задача перепроверяется,
+      когда завершится;
+    * в снимке изменились поля ``CONFIG_FIELDS`` (в том числе нода);
+    * журнал задач прокрутился дальше прошлой позиции — тогда помечаются все.
+
+    Синхронные правки (``PUT /config``) задач не создают, поэтому каждый проход
+    ещё сверяет ``digest`` у ``sweep`` закэшированных гостей по кругу. Стоимость
+    прохода — запрос журнала плюс число изменившихся гостей плюс ``sweep``,
+    а не размер кластера. Изменённая конфигурация поднимает версию инвентаря
+    (и ETag ответов).
+    """
+
+    def __init__(
+        self,
+        inventory: Inventory,
+        interval: float = 10.0,
+        sweep: int = 20,
+        concurrency: int = 8,
+    ):
+        self.inventory = inventory
+        self.interval = interval
+        self.sweep = sweep
+        self.concurrency = concurrency
+        # vmid -> последняя прочитанная конфигурация
+        self.configs: dict[int, dict] = {}
+        # vmid, чья закэшированная конфигурация могла устареть
+        self.dirty: set[int] = set()
+        self._shapes: dict[int, tuple] = {}
+        # Позиция в журнале задач: время старта самой свежей задачи и UPID последнего ответа
+        self._cursor: Optional[int] = None
+        self._seen: set[str] = set()
+        # UPID незавершённых задач -> vmid
+        self._open: dict[str, int] = {}
+        self._sweep_position = 0
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"syncs": 0, "fetches": 0, "changes": 0, "gaps": 0}
+
+    async def _fetch(self, guest: Guest) -> dict:
+        # Снять пометку до запроса: изменение во время запроса пометит гостя снова
+        self.dirty.discard(guest.vmid)
+        self.stats["fetches"] += 1
+        config = await self.inventory.proxmox.get_vm_config(guest.vmid, guest.type, node=guest.node)
+        self.configs[guest.vmid] = config
+        return config
+
+    async def config(self, guest: Guest) -> dict:
+        """Конфигурация гостя: из кэша, если она не помечена изменённой, иначе из Proxmox."""
+        config = self.configs.get(guest.vmid)
+        if config is not None and guest.vmid not in self.dirty:
+            return config
+        return await self._fetch(guest)
+
+    def _observe(self, snapshot: InventorySnapshot):
+        """Сравнить снимок с прошлым: изменённые гости — в ``dirty``, удалённые — из кэша."""
+        shapes = {vmid: _shape(guest) for vmid, guest in snapshot.by_vmid.items()}
+        for vmid, shape in shapes.items():
+            if self._shapes.get(vmid, shape) != shape:
+                self.dirty.add(vmid)
+        for vmid in self._shapes.keys() - shapes.keys():
+            self.configs.pop(vmid, None)
+            self.dirty.discard(vmid)
+        self._shapes = shapes
+
+    def _tail(self, tasks: list[dict]):
+        """Разобрать журнал задач с прошлой позиции."""
+        current = {t["upid"]: t for t in tasks if t.get("upid")}
+
+        # Завершившиеся (или выпавшие из журнала) задачи, которые в прошлый раз ещё шли
+        for upid, vmid in list(self._open.items()):
+            task = current.get(upid)
+            if task is None or task.get("endtime"):
+                self.dirty.add(vmid)
+                del self._open[upid]
+
+        if self._cursor is not None and tasks:
+            oldest = min(t.get("starttime", 0) for t in tasks)
+            if oldest > self._cursor:
+                # Между проходами задач было больше, чем помещается в журнал
+                logger.info("Cluster task log wrapped, rechecking all cached configs")
+                self.stats["gaps"] += 1
+                self.dirty.update(self.configs)
+
+        for upid, task in current.items():
+            if upid in self._seen or (self._cursor is not None and task.get("starttime", 0) < self._cursor):
+                continue
+            if task.get("type") in STATE_ONLY_TASKS or not str(task.get("id", "")).isdigit():
+                continue
+            vmid = int(task["id"])
+            self.dirty.add(vmid)
+            if not task.get("endtime"):
+                self._open[upid] = vmid
+
+        self._seen = set(current)
+        if tasks:
+            self._cursor = max(self._cursor or 0, max(t.get("starttime", 0) for t in tasks))
+
+    def digests(self) -> dict[int, str]:
+        """Digest закэшированных конфигураций (для публикации другим воркерам)."""
+        return {vmid: config["digest"] for vmid, config in self.configs.items() if config.get("digest")}
+
+    def follow(self, snapshot: InventorySnapshot, digests: dict[int, str]):
+        """Принять снимок от ведущего воркера без запросов к Proxmox.
+
+        Журнал задач читает ведущий; здесь помечаются гости, у которых
+        изменились поля снимка или digest конфигурации у ведущего.
+        """
+        self._observe(snapshot)
+        for vmid, config in self.configs.items():
+            digest = digests.get(vmid)
+            if digest is not None and digest != config.get("digest"):
+                self.dirty.add(vmid)
+
+    def state(self) -> dict:
+        """Кэш конфигураций и позиция в журнале задач (для сохранения на диск)."""
+        return {
+            "configs": {str(vmid): config for vmid, config in self.configs.items()},
+            "dirty": sorted(self.dirty),
+            "cursor": self._cursor,
+            "open": self._open,
+        }
+
+    def restore(self, state: dict, snapshot: InventorySnapshot):
+        """Восстановить ``state()`` прошлого процесса поверх восстановленного снимка.
+
+        Журнал задач дочитывается с сохранённой позиции, поэтому изменения,
+        случившиеся пока процесс не работал, пометятся первым же проходом
+        (а если журнал успел прокрутиться — пометятся все конфигурации).
+        """
+        self.configs = {
+            int(vmid): config for vmid, config in state.get("configs", {}).items()
+            if int(vmid) in snapshot.by_vmid
+        }
+        self.dirty = set(state.get("dirty", [])) & self.configs.keys()
+        self._cursor = state.get("cursor")
+        self._open = {upid: int(vmid) for upid, vmid in state.get("open", {}).items()}
+        self._shapes = {}
+        self._observe(snapshot)
+
+    def _sweep_batch(self, snapshot: InventorySnapshot) -> list[int]:
+        """Следующие ``sweep`` закэшированных гостей по кругу."""
+        cached = sorted(vmid for vmid in self.configs if vmid in snapshot.by_vmid)
+        if not cached or self.sweep <= 0:
+            return []
+        start = self._sweep_position % len(cached)
+        batch = (cached[start:] + cached[:start])[: self.sweep]
+        self._sweep_position = start + len(batch)
+        return batch
+
+    async def sync(self) -> int:
+        """Один проход; возвращает число гостей с изменившейся конфигурацией."""
+        snapshot = await self.inventory.snapshot()
+        self._observe(snapshot)
+        self._tail(await self.inventory.proxmox.get_cluster_tasks())
+
+        # Перечитываем только то, что уже в кэше: остальное прочитается при первом обращении
+        recheck = [vmid for vmid in self.dirty if vmid in self.configs and vmid in snapshot.by_vmid]
+        recheck += [vmid for vmid in self._sweep_batch(snapshot) if vmid not in self.dirty]
+        self.dirty.intersection_update(snapshot.by_vmid)
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def check(vmid: int) -> bool:
+            before = self.configs.get(vmid)
+            async with semaphore:
+                try:
+                    after = await self._fetch(snapshot.by_vmid[vmid])
+                except Exception as e:
+                    logger.warning(f"Failed to fetch config of {vmid}: {e}")
+                    self.dirty.add(vmid)
+                    return False
+            return before is None or _digest(before) != _digest(after)
+
+        changed = sum(await asyncio.gather(*(check(vmid) for vmid in recheck)))
+        self.stats["syncs"] += 1
+        if changed:
+            self.stats["changes"] += changed
+            self.inventory.bump()
+        logger.debug(f"Inventory sync: {len(recheck)} configs rechecked, {changed} changed")
+        return changed
+
+    async def _run(self):
+        while True:
+            try:
+                await self.sync()
+            except Exception as e:
+                logger.error(f"Inventory sync failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+inventory_sync = InventorySync(
+    inventory,
+    interval=settings.INVENTORY_SYNC_INTERVAL,
+    sweep=settings.INVENTORY_SYNC_SWEEP,
+    concurrency=settings.INVENTORY_SYNC_CONCURRENCY,
+)
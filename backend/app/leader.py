@@ -0,0 +1,114 @@
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from typing import Optional, Protocol
+
+import redis.asyncio as aioredis
+from redis.exceptions import RedisError
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Продлить аренду, только если она всё ещё наша (как в app/locks.py)
+_RENEW = """
+if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('pexpire', KEYS[1], ARGV[2]) end
+return 0
+"""
+_RELEASE = """
+if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end
+return 0
+"""
+
+
+class Duty(Protocol):
+    async def start(self): ...
+
+    async def stop(self): ...
+
+
+class Leadership:
+    """Выбор ведущего среди воркеров API.
+
+    Фоновые задачи, которые ходят в Proxmox за весь кластер (опрос
+    инвентаря, сбор метрик, тёплый пул), должны работать в одном процессе,
+    иначе каждый воркер умножает нагрузку. Ведущий держит ключ Redis с
+    арендой ``lease`` секунд и продлевает её; остальные раз в ``lease / 3``
+    пробуют ключ занять — если ведущий упал, его место займут после истечения
+    аренды. Ставший ведущим запускает обязанности (``start``), потерявший
+    аренду — останавливает. Без ``url`` процесс ведущий сразу и всегда.
+    """
+
+    def __init__(self, url: Optional[str] = None, lease: float = 15.0, prefix: str = "proxmox-cloud:"):
+        self.url = url
+        self.lease = lease
+        self.key = f"{prefix}leader"
+        self.token = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex}"
+        self.leading = False
+        self._duties: list[Duty] = []
+        self._redis: Optional[aioredis.Redis] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def _try_lead(self) -> bool:
+        px = int(self.lease * 1000)
+        try:
+            if self.leading:
+                return bool(await self._redis.eval(_RENEW, 1, self.key, self.token, px))
+            return bool(await self._redis.set(self.key, self.token, nx=True, px=px))
+        except RedisError as e:
+            # Без Redis не знаем, жив ли ведущий: ведущий остаётся, остальные ждут
+            logger.warning(f"Leader election unavailable: {e}")
+            return self.leading
+
+    async def _become(self, leading: bool):
+        if leading == self.leading:
+            return
+        self.leading = leading
+        if leading:
+            logger.info("This worker is now the leader")
+            for duty in self._duties:
+                await duty.start()
+        else:
+            logger.warning("Leadership lost, stopping background duties")
+            for duty in reversed(self._duties):
+                await duty.stop()
+
+    async def _run(self):
+        while True:
+            await self._become(await self._try_lead())
+            await asyncio.sleep(self.lease / 3)
+
+    async def start(self, duties: list[Duty]):
+        """Участвовать в выборах; ``duties`` работают, пока процесс ведущий."""
+        self._duties = list(duties)
+        if not self.url:
+            await self._become(True)
+            return
+        self._redis = aioredis.from_url(self.url)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self.leading:
+            self.leading = False
+            for duty in reversed(self._duties):
+                await duty.stop()
+        if self._redis is not None:
+            try:
+                # Отдать аренду сразу, а не ждать её истечения
+                await self._redis.eval(_RELEASE, 1, self.key, self.token)
+            except RedisError:
+                pass
+            await self._redis.aclose()
+            self._redis = None
+
+
+leadership = Leadership(
+    settings.REDIS_URL if settings.INVENTORY_SHARED else None,
+    lease=settings.LEADER_LEASE,
+)
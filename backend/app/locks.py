@@ -0,0 +1,199 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import Iterable, Optional
+
+import redis.asyncio as aioredis
+from redis.exceptions import RedisError
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Снять или продлить блокировку, только если она всё ещё наша:
+# аренда могла истечь, и ключ уже принадлежит другому процессу
+_RELEASE = """
+if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end
+return 0
+"""
+_RENEW = """
+if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('pexpire', KEYS[1], ARGV[2]) end
+return 0
+"""
+
+
+class GuestBusy(Exception):
+    """Над гостем идёт другая операция, и она не закончилась за время ожидания."""
+
+    def __init__(self, vmid: int, operation: Optional[str] = None):
+        self.vmid = vmid
+        self.operation = operation
+        super().__init__(f"Guest {vmid} is busy" + (f" ({operation})" if operation else ""))
+
+
+class GuestLocks:
+    """Блокировки операций над гостями, общие для API и бота.
+
+    Операции над одним vmid выполняются по очереди, над разными — параллельно.
+    Внутри процесса очередь держит ``asyncio.Lock``, между процессами — ключ
+    Redis (``SET NX PX``) с арендой на ``lease`` секунд, которую держатель
+    продлевает, пока работает: упавший процесс не оставит гостя запертым.
+    Без ``url`` (или если Redis недоступен) блокировки только внутрипроцессные.
+
+    Так же (``reserve``) резервируются vmid под создание: ``/cluster/nextid``
+    номер не занимает, и без общего резерва воркеры API и бот выдавали бы
+    один и тот же vmid параллельным созданиям.
+    """
+
+    def __init__(
+        self,
+        url: Optional[str] = None,
+        lease: float = 30.0,
+        wait: float = 60.0,
+        prefix: str = "proxmox-cloud:lock:",
+    ):
+        self.url = url
+        self.lease = lease
+        self.wait = wait
+        self.prefix = prefix
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._redis: Optional[aioredis.Redis] = None
+        # vmid -> (блокировка, сколько корутин её держат или ждут)
+        self._local: dict[int, tuple[asyncio.Lock, int]] = {}
+        # vmid -> операция, которая держит блокировку в этом процессе
+        self.operations: dict[int, str] = {}
+        # vmid, зарезервированные этим процессом -> (когда истекает резерв, токен в Redis)
+        self._reserved: dict[int, tuple[float, Optional[str]]] = {}
+
+    def _client(self) -> Optional[aioredis.Redis]:
+        if self._redis is None and self.url:
+            self._redis = aioredis.from_url(self.url)
+        return self._redis
+
+    def _key(self, vmid: int) -> str:
+        return f"{self.prefix}{vmid}"
+
+    def _enter(self, vmid: int) -> asyncio.Lock:
+        lock, users = self._local.get(vmid, (None, 0))
+        lock = lock or asyncio.Lock()
+        self._local[vmid] = (lock, users + 1)
+        return lock
+
+    def _leave(self, vmid: int):
+        lock, users = self._local[vmid]
+        if users > 1:
+            self._local[vmid] = (lock, users - 1)
+        else:
+            del self._local[vmid]
+
+    async def _acquire(self, vmid: int, operation: str, deadline: float) -> Optional[str]:
+        """Взять ключ в Redis; ``None`` — Redis не настроен или недоступен."""
+        client = self._client()
+        if client is None:
+            return None
+        loop = asyncio.get_running_loop()
+        token = f"{self.owner}:{operation}:{uuid.uuid4().hex}"
+        delay = 0.05
+        try:
+            while not await client.set(self._key(vmid), token, nx=True, px=int(self.lease * 1000)):
+                if loop.time() >= deadline:
+                    holder = await client.get(self._key(vmid))
+                    raise GuestBusy(vmid, holder.decode().rsplit(":", 2)[-2] if holder else None)
+                await asyncio.sleep(min(delay, max(0.0, deadline - loop.time())))
+                delay = min(delay * 2, 1.0)
+        except RedisError as e:
+            logger.warning(f"Redis lock for {vmid} unavailable ({e}), using in-process lock only")
+            return None
+        return token
+
+    async def _renew(self, vmid: int, token: str):
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            try:
+                if not await self._client().eval(_RENEW, 1, self._key(vmid), token, int(self.lease * 1000)):
+                    logger.warning(f"Lock lease for guest {vmid} was lost")
+                    return
+            except RedisError as e:
+                logger.warning(f"Failed to renew lock for guest {vmid}: {e}")
+
+    async def _release(self, vmid: int, token: str):
+        try:
+            await self._client().eval(_RELEASE, 1, self._key(vmid), token)
+        except RedisError as e:
+            # Ключ истечёт сам по аренде
+            logger.warning(f"Failed to release lock for guest {vmid}: {e}")
+
+    @asynccontextmanager
+    async def hold(self, vmid: int, operation: str, wait: Optional[float] = None):
+        """Выполнить блок под блокировкой гостя.
+
+        Raises:
+            GuestBusy: блокировку не удалось получить за ``wait`` секунд.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + (self.wait if wait is None else wait)
+        lock = self._enter(vmid)
+        try:
+            try:
+                await asyncio.wait_for(lock.acquire(), timeout=max(0.0, deadline - loop.time()))
+            except asyncio.TimeoutError:
+                raise GuestBusy(vmid, self.operations.get(vmid))
+            try:
+                token = await self._acquire(vmid, operation, deadline)
+                self.operations[vmid] = operation
+                renew = asyncio.create_task(self._renew(vmid, token)) if token else None
+                try:
+                    yield
+                finally:
+                    del self.operations[vmid]
+                    if renew is not None:
+                        renew.cancel()
+                        await asyncio.gather(renew, return_exceptions=True)
+                        await self._release(vmid, token)
+            finally:
+                lock.release()
+        finally:
+            self._leave(vmid)
+
+    async def reserve(self, vmid: int, ttl: float) -> bool:
+        """Зарезервировать vmid под создание на ``ttl`` секунд; False — он уже занят."""
+        now = time.monotonic()
+        self._reserved = {v: r for v, r in self._reserved.items() if r[0] > now}
+        if vmid in self._reserved:
+            return False
+        token = None
+        client = self._client()
+        if client is not None:
+            token = f"{self.owner}:reserve:{uuid.uuid4().hex}"
+            try:
+                if not await client.set(f"{self.prefix}vmid:{vmid}", token, nx=True, px=int(ttl * 1000)):
+                    return False
+            except RedisError as e:
+                logger.warning(f"Redis reservation for {vmid} unavailable ({e}), reserving in-process only")
+                token = None
+        self._reserved[vmid] = (now + ttl, token)
+        return True
+
+    async def release_vmids(self, vmids: Iterable[int]):
+        """Снять резерв ``reserve`` (гость создан или создание отменено)."""
+        for vmid in vmids:
+            _, token = self._reserved.pop(vmid, (None, None))
+            if token is None:
+                continue
+            try:
+                await self._client().eval(_RELEASE, 1, f"{self.prefix}vmid:{vmid}", token)
+            except RedisError as e:
+                # Ключ истечёт сам по ttl
+                logger.warning(f"Failed to release reservation for {vmid}: {e}")
+
+    async def close(self):
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+
+guest_locks = GuestLocks(settings.REDIS_URL, lease=settings.GUEST_LOCK_LEASE, wait=settings.GUEST_LOCK_WAIT)
@@ -2,11 +2,20 @@ import logging
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
-from sqlalchemy import text
 
-from app.routers import vms, lxc, auth
+from app.routers import guests, vms, lxc, auth, inventory, pool, capacity, audit as audit_router
 from app.database import engine
-from app.models import Base
+from app.migrations import migrate
+from app.config import settings
+from app.metrics import metrics
+from app.locks import guest_locks
+from app.audit import audit
+from app.inventory_sync import inventory_sync
+from app.inventory_share import shared_inventory
+from app.inventory_store import inventory_store
+from app.leader import leadership
+from app.warm_pool import warm_pool
+from app.proxmox import close_clients
 
 
 logging.basicConfig(
@@ -19,29 +28,31 @@ logger = logging.getLogger(__name__)
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """События при запуске и остановке приложения."""
-    # При запуске создаём таблицы БД
-    logger.info("Creating database tables...")
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
-    
-    # Добавляем колонку password если нет
-    logger.info("Checking password column...")
-    async with engine.begin() as conn:
-        result = await conn.execute(text("""
-            SELECT column_name 
-            FROM information_schema.columns 
-            WHERE table_name = 'vms' AND column_name = 'password'
-        """))
-        if not result.fetchone():
-            await conn.execute(text("ALTER TABLE vms ADD COLUMN password VARCHAR"))
-            logger.info("✅ Added password column to vms table")
-        else:
-            logger.info("✅ Password column already exists")
-    
-    logger.info("Database tables created successfully")
+    applied = await migrate(engine)
+    logger.info(f"Database schema is up to date ({applied} migrations applied)")
+    # Тёплый старт: снимок инвентаря и кэши прошлого процесса
+    inventory_store.load()
+    await audit.start()
+    # Фоновые задачи за весь кластер — только в ведущем воркере
+    # (без INVENTORY_SHARED процесс ведущий всегда)
+    duties = [warm_pool]
+    if settings.INVENTORY_SHARED:
+        shared_inventory.attach()
+        duties.append(shared_inventory)
+    elif settings.INVENTORY_SYNC_ENABLED:
+        duties.append(inventory_sync)
+    if settings.METRICS_ENABLED:
+        duties.append(metrics)
+    await leadership.start(duties)
     yield
     # При остановке можно добавить очистку ресурсов
     logger.info("Shutting down...")
+    await leadership.stop()
+    inventory_store.save()
+    await shared_inventory.close()
+    await audit.stop()
+    await guest_locks.close()
+    await close_clients()
 
 
 app = FastAPI(title="Proxmox Cloud", lifespan=lifespan)
@@ -56,8 +67,13 @@ app.add_middleware(
 )
 
 app.include_router(auth.router, prefix="/auth", tags=["Auth"])
+app.include_router(guests.router, prefix="/guests", tags=["Guests"])
 app.include_router(vms.router, prefix="/vms", tags=["VMs"])
 app.include_router(lxc.router, prefix="/lxc", tags=["LXC"])
+app.include_router(inventory.router, prefix="/inventory", tags=["Inventory"])
+app.include_router(pool.router, prefix="/pool", tags=["Warm pool"])
+app.include_router(capacity.router, prefix="/capacity", tags=["Capacity"])
+app.include_router(audit_router.router, prefix="/audit", tags=["Audit"])
 
 
 @app.get("/")
@@ -0,0 +1,239 @@
+import asyncio
+import logging
+import math
+import time
+import warnings
+from typing import Optional
+
+import numpy as np
+
+from app.config import settings
+from app.inventory import inventory
+from app.proxmox import ProxmoxAPI
+
+logger = logging.getLogger(__name__)
+
+# Поля RRD, которые храним (порядок = столбцы массивов)
+FIELDS = ("cpu", "mem", "maxmem", "disk", "maxdisk", "netin", "netout", "diskread", "diskwrite")
+# Уровни хранения (шаг, число слотов): 1m — 4 часа, 15m — 4 дня, 1h — 30 дней.
+# На одну серию ~1344 слота по 42 байта — около 55 КБ независимо от времени работы
+TIERS = ((60, 240), (900, 384), (3600, 720))
+# Допустимые значения ?range=
+RANGES = {"1h": 3600, "4h": 14400, "1d": 86400, "4d": 345600, "7d": 604800, "30d": 2592000}
+# Больше точек в ответе не отдаём — усредняем соседние
+MAX_POINTS = 240
+
+
+class RingTier:
+    """Кольцевой буфер одного уровня: время слота и средние значения полей.
+
+    Каждая точка 1m добавляется во все уровни; в крупных уровнях слот
+    накапливает скользящее среднее точек, попавших в его интервал.
+    """
+
+    __slots__ = ("step", "size", "times", "values", "counts", "head", "length")
+
+    def __init__(self, step: int, size: int):
+        self.step = step
+        self.size = size
+        self.times = np.zeros(size, dtype=np.uint32)
+        self.values = np.full((size, len(FIELDS)), np.nan, dtype=np.float32)
+        self.counts = np.zeros(size, dtype=np.uint16)
+        self.head = -1  # Индекс последнего записанного слота
+        self.length = 0
+
+    @property
+    def span(self) -> int:
+        return self.step * self.size
+
+    def add(self, ts: int, row: np.ndarray):
+        bucket = ts - ts % self.step
+        if self.length and self.times[self.head] == bucket:
+            slot = self.values[self.head]
+            n = min(int(self.counts[self.head]) + 1, np.iinfo(np.uint16).max)
+            self.counts[self.head] = n
+            merged = np.where(np.isnan(slot), row, slot + (row - slot) / n)
+            self.values[self.head] = np.where(np.isnan(row), slot, merged)
+            return
+        self.head = (self.head + 1) % self.size
+        self.times[self.head] = bucket
+        self.values[self.head] = row
+        self.counts[self.head] = 1
+        self.length = min(self.length + 1, self.size)
+
+    def window(self, since: int) -> tuple[np.ndarray, np.ndarray]:
+        """Слоты не старше ``since`` в хронологическом порядке."""
+        order = (np.arange(self.length) + self.head + 1 - self.length) % self.size
+        times = self.times[order]
+        mask = times >= since
+        return times[mask], self.values[order][mask]
+
+
+class Series:
+    """История метрик одного гостя или ноды."""
+
+    __slots__ = ("tiers", "last_ts")
+
+    def __init__(self):
+        self.tiers = tuple(RingTier(step, size) for step, size in TIERS)
+        self.last_ts = 0
+
+    def ingest(self, rows: list[dict]) -> int:
+        """Добавить точки RRD; уже виденные (по времени) пропускаются."""
+        added = 0
+        for item in sorted(rows, key=lambda r: r.get("time", 0)):
+            ts = int(item.get("time") or 0)
+            if ts <= self.last_ts:
+                continue
+            row = np.array([_number(item.get(field)) for field in FIELDS], dtype=np.float32)
+            if np.isnan(row).all():
+                continue
+            for tier in self.tiers:
+                tier.add(ts, row)
+            self.last_ts = ts
+            added += 1
+        return added
+
+    def query(self, seconds: int, now: Optional[float] = None) -> dict:
+        """Точки и сводка (avg/max/p95) за последние ``seconds`` секунд."""
+        now = int(now or time.time())
+        tier = next((t for t in self.tiers if t.span >= seconds), self.tiers[-1])
+        times, values = tier.window(now - seconds)
+
+        step = tier.step
+        if len(times) > MAX_POINTS:
+            factor = math.ceil(len(times) / MAX_POINTS)
+            pad = (-len(times)) % factor
+            padded = np.vstack([values, np.full((pad, len(FIELDS)), np.nan, dtype=np.float32)])
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", RuntimeWarning)
+                values = np.nanmean(padded.reshape(-1, factor, len(FIELDS)), axis=1)
+            times = times[::factor]
+            step *= factor
+
+        with warnings.catch_warnings():
+            # Пустые столбцы (например, у LXC нет diskread) дают NaN без предупреждений
+            warnings.simplefilter("ignore", RuntimeWarning)
+            summary = {
+                "avg": np.nanmean(values, axis=0) if len(values) else None,
+                "max": np.nanmax(values, axis=0) if len(values) else None,
+                "p95": np.nanpercentile(values, 95, axis=0) if len(values) else None,
+            }
+
+        return {
+            "step": step,
+            "points": [
+                {"time": int(t), **dict(zip(FIELDS, _clean(row)))}
+                for t, row in zip(times, values)
+            ],
+            "summary": {
+                field: {name: (_clean(agg)[i] if agg is not None else None) for name, agg in summary.items()}
+                for i, field in enumerate(FIELDS)
+            },
+        }
+
+
+def _number(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+def _clean(values: np.ndarray) -> list:
+    """NaN → None для JSON, float32 → округлённый float."""
+    return [None if math.isnan(v) else round(float(v), 4) for v in values]
+
+
+class MetricsCollector:
+    """Периодически забирает RRD-данные всех работающих гостей и нод кластера.
+
+    Гости опрашиваются пачками (не больше ``concurrency`` запросов сразу),
+    история хранится в памяти в ``Series`` с ограниченным размером.
+    """
+
+    def __init__(self, proxmox: ProxmoxAPI, interval: float = 60.0, concurrency: int = 10):
+        self.proxmox = proxmox
+        self.interval = interval
+        self.concurrency = concurrency
+        self.guests: dict[int, Series] = {}
+        self.nodes: dict[str, Series] = {}
+        self.last_run: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def _fetch_guest(self, vmid: int, type_: str, node: Optional[str], limit: asyncio.Semaphore):
+        async with limit:
+            try:
+                rows = await self.proxmox.get_rrddata(vmid, type_, node=node)
+            except Exception as e:
+                logger.debug(f"Failed to get RRD data for {vmid}: {e}")
+                return
+        self.guests.setdefault(vmid, Series()).ingest(rows)
+
+    async def _fetch_node(self, node: str, limit: asyncio.Semaphore):
+        async with limit:
+            try:
+                rows = await self.proxmox.get_node_rrddata(node)
+            except Exception as e:
+                logger.debug(f"Failed to get RRD data for node {node}: {e}")
+                return
+        self.nodes.setdefault(node, Series()).ingest(rows)
+
+    async def collect(self):
+        """Один проход по кластеру."""
+        snapshot = await inventory.snapshot()
+        limit = asyncio.Semaphore(self.concurrency)
+        guests = [g for g in snapshot.guests() if g.running and not g.template]
+        nodes = {g.node for g in snapshot.guests() if g.node}
+        await asyncio.gather(
+            *(self._fetch_guest(g.vmid, g.type, g.node, limit) for g in guests),
+            *(self._fetch_node(node, limit) for node in nodes),
+        )
+        # Удалённые гости больше не занимают память
+        for vmid in set(self.guests) - set(snapshot.by_vmid):
+            del self.guests[vmid]
+        self.last_run = time.time()
+
+    async def guest_metrics(self, vmid: int, type_: str, seconds: int) -> Optional[dict]:
+        """Метрики гостя из памяти; если гость ещё не опрашивался — один запрос RRD.
+
+        Если сборщик не запущен (воркер API не ведущий), история дочитывается
+        по запросу, когда устарела больше чем на ``interval``.
+        """
+        series = self.guests.get(vmid)
+        if series is None or (self._task is None and time.time() - series.last_ts > self.interval):
+            snapshot = await inventory.snapshot()
+            guest = snapshot.get(vmid)
+            if guest is None or guest.type != type_:
+                return None
+            await self._fetch_guest(vmid, type_, guest.node, asyncio.Semaphore(1))
+            series = self.guests.get(vmid)
+            if series is None:
+                return None
+        return series.query(seconds)
+
+    async def _run(self):
+        while True:
+            started = time.monotonic()
+            try:
+                await self.collect()
+            except Exception as e:
+                logger.error(f"Metrics collection failed: {e}")
+            await asyncio.sleep(max(0.0, self.interval - (time.monotonic() - started)))
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+metrics = MetricsCollector(
+    ProxmoxAPI(),
+    interval=settings.METRICS_INTERVAL,
+    concurrency=settings.METRICS_CONCURRENCY,
+)
@@ -0,0 +1,107 @@
+import logging
+from typing import Awaitable, Callable
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+logger = logging.getLogger(__name__)
+
+# Ключ pg_advisory_xact_lock: миграции применяет один процесс, остальные ждут
+_LOCK_KEY = 0x50524F58
+
+
+# Схема версии 1, зафиксированная явно: не зависит от того, как потом
+# меняются модели. IF NOT EXISTS — базы, созданные до появления миграций,
+# уже содержат эти таблицы.
+_BASELINE = (
+    """CREATE TABLE IF NOT EXISTS vms (
+        id SERIAL PRIMARY KEY,
+        vmid INTEGER UNIQUE,
+        name VARCHAR,
+        type VARCHAR,
+        os VARCHAR,
+        ip VARCHAR,
+        status VARCHAR
+    )""",
+    """CREATE TABLE IF NOT EXISTS users (
+        id SERIAL PRIMARY KEY,
+        username VARCHAR NOT NULL UNIQUE,
+        password VARCHAR NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS audit_events (
+        id BIGSERIAL PRIMARY KEY,
+        time TIMESTAMP WITH TIME ZONE NOT NULL,
+        actor VARCHAR NOT NULL,
+        source VARCHAR NOT NULL,
+        action VARCHAR NOT NULL,
+        vmid INTEGER,
+        type VARCHAR,
+        status VARCHAR NOT NULL,
+        detail JSON
+    )""",
+    "CREATE INDEX IF NOT EXISTS ix_audit_events_time ON audit_events (time)",
+    "CREATE INDEX IF NOT EXISTS ix_audit_events_vmid_time ON audit_events (vmid, time)",
+    "CREATE INDEX IF NOT EXISTS ix_audit_events_actor_time ON audit_events (actor, time)",
+)
+
+
+async def _baseline(conn: AsyncConnection):
+    for statement in _BASELINE:
+        await conn.execute(text(statement))
+
+
+async def _vm_password(conn: AsyncConnection):
+    # IF NOT EXISTS — в базах до появления миграций колонка могла уже быть
+    await conn.execute(text("ALTER TABLE vms ADD COLUMN IF NOT EXISTS password VARCHAR"))
+
+
+# Миграции по порядку: номер — позиция в списке, начиная с 1. Новые только
+# добавляются в конец, уже выпущенные не меняются. Каждая вносит только свои
+# изменения поверх предыдущей версии — модели (app/models.py) правятся вместе
+# с новой миграцией, но сами миграции от них не зависят.
+MIGRATIONS: list[tuple[str, Callable[[AsyncConnection], Awaitable[None]]]] = [
+    ("baseline", _baseline),
+    ("vm password column", _vm_password),
+]
+
+
+async def _current(conn: AsyncConnection) -> int:
+    result = await conn.execute(text("SELECT coalesce(max(version), 0) FROM schema_migrations"))
+    return result.scalar_one()
+
+
+async def migrate(engine: AsyncEngine) -> int:
+    """Привести схему БД к последней версии; вернуть число применённых миграций.
+
+    Версия схемы хранится в таблице ``schema_migrations``. Если база уже
+    актуальна, это один запрос при запуске; иначе недостающие миграции
+    применяются в одной транзакции под advisory-блокировкой, чтобы несколько
+    воркеров API не применяли их одновременно.
+    """
+    latest = len(MIGRATIONS)
+    try:
+        async with engine.connect() as conn:
+            if await _current(conn) >= latest:
+                return 0
+    except DBAPIError:
+        # Таблицы версий ещё нет — первая миграция
+        pass
+
+    async with engine.begin() as conn:
+        await conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": _LOCK_KEY})
+        await conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            "version INTEGER PRIMARY KEY, name VARCHAR NOT NULL, "
+            "applied_at TIMESTAMPTZ NOT NULL DEFAULT now())"
+        ))
+        # Пока ждали блокировку, миграции мог применить другой процесс
+        current = await _current(conn)
+        for version, (name, apply) in enumerate(MIGRATIONS[current:], start=current + 1):
+            logger.info(f"Applying migration {version}: {name}")
+            await apply(conn)
+            await conn.execute(
+                text("INSERT INTO schema_migrations (version, name) VALUES (:version, :name)"),
+                {"version": version, "name": name},
+            )
+    return latest - current
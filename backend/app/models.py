@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String
+from sqlalchemy import JSON, BigInteger, Column, DateTime, Index, Integer, String
 from sqlalchemy.orm import declarative_base
 
 Base = declarative_base()
@@ -22,4 +22,25 @@ class User(Base):
 
     id = Column(Integer, primary_key=True)
     username = Column(String, unique=True, nullable=False)
-    password = Column(String, nullable=False)
\ No newline at end of file
+    password = Column(String, nullable=False)
+
+
+class AuditEvent(Base):
+    """Кто и что сделал с гостем (пишется пачками, см. app/audit.py)."""
+
+    __tablename__ = "audit_events"
+    __table_args__ = (
+        # Выборки GET /audit: по гостю или пользователю за период, свежие первыми
+        Index("ix_audit_events_vmid_time", "vmid", "time"),
+        Index("ix_audit_events_actor_time", "actor", "time"),
+    )
+
+    id = Column(BigInteger, primary_key=True)
+    time = Column(DateTime(timezone=True), nullable=False, index=True)
+    actor = Column(String, nullable=False)  # Имя пользователя API или tg:<id>
+    source = Column(String, nullable=False)  # api, bot, idle
+    action = Column(String, nullable=False)  # create, start, stop, shutdown, restart, delete, ...
+    vmid = Column(Integer)
+    type = Column(String)  # qemu или lxc
+    status = Column(String, nullable=False)  # ok или failed
+    detail = Column(JSON)
@@ -0,0 +1,92 @@
+import asyncio
+import logging
+from typing import Optional
+
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.types import InlineKeyboardMarkup, Message
+
+logger = logging.getLogger(__name__)
+
+# Telegram ограничивает частоту сообщений в чат (~1 в секунду) — правки тоже считаются
+PROGRESS_MIN_INTERVAL = 1.0
+
+
+class ProgressMessage:
+    """Одно сообщение о ходе операции, которое редактируется на месте.
+
+    ``update`` можно вызывать сколько угодно часто: правка уходит сразу, если
+    с прошлой прошло ``min_interval`` секунд, иначе откладывается, и из
+    накопившихся показывается только последняя. ``finish`` выводит итог
+    немедленно. Если сообщение нельзя отредактировать (удалено), дальше
+    правится новое.
+    """
+
+    def __init__(self, message: Message, text: str, min_interval: float = PROGRESS_MIN_INTERVAL):
+        self.message = message
+        self.text = text
+        self.min_interval = min_interval
+        self.edits = 0
+        self._loop = asyncio.get_running_loop()
+        self._last = self._loop.time()
+        self._pending: Optional[str] = None
+        self._flush: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+    @classmethod
+    async def send(cls, target: Message, text: str, **kwargs) -> "ProgressMessage":
+        """Отправить первое сообщение в чат ``target``."""
+        message = await target.answer(text, parse_mode="HTML")
+        return cls(message, text, **kwargs)
+
+    async def update(self, text: str):
+        if text == self.text and self._pending is None:
+            return
+        self._pending = text
+        if self._flush is not None and not self._flush.done():
+            return  # Отложенная правка уже запланирована и возьмёт свежий текст
+        wait = self._last + self.min_interval - self._loop.time()
+        if wait <= 0:
+            await self._edit(self._take())
+        else:
+            self._flush = asyncio.create_task(self._delayed(wait))
+
+    async def finish(self, text: str, reply_markup: Optional[InlineKeyboardMarkup] = None):
+        """Итоговый текст (и клавиатура) — без ожидания интервала."""
+        if self._flush is not None:
+            self._flush.cancel()
+            await asyncio.gather(self._flush, return_exceptions=True)
+            self._flush = None
+        self._pending = None
+        await self._edit(text, reply_markup)
+
+    def _take(self) -> Optional[str]:
+        text, self._pending = self._pending, None
+        return text
+
+    async def _delayed(self, wait: float):
+        await asyncio.sleep(wait)
+        text = self._take()
+        if text is not None:
+            await self._edit(text)
+
+    async def _edit(self, text: Optional[str], reply_markup: Optional[InlineKeyboardMarkup] = None):
+        if text is None:
+            return
+        async with self._lock:
+            if text == self.text and reply_markup is None:
+                return
+            for _ in range(3):
+                try:
+                    await self.message.edit_text(text, parse_mode="HTML", reply_markup=reply_markup)
+                    break
+                except TelegramRetryAfter as e:
+                    await asyncio.sleep(e.retry_after)
+                except TelegramBadRequest as e:
+                    if "not modified" in str(e):
+                        break
+                    logger.debug(f"Progress message can't be edited ({e}), sending a new one")
+                    self.message = await self.message.answer(text, parse_mode="HTML", reply_markup=reply_markup)
+                    break
+            self.text = text
+            self._last = self._loop.time()
+            self.edits += 1
@@ -0,0 +1,172 @@
+import asyncio
+import logging
+from typing import AsyncIterator, Callable, Optional
+
+from app.audit import audit
+from app.config import settings
+from app.guest_records import guest_records
+from app.inventory import inventory
+from app.proxmox import ProxmoxAPI
+from app.schemas import VMBatchCreate
+from app.warm_pool import warm_pool
+
+logger = logging.getLogger(__name__)
+
+# Запущенные пакеты: создание продолжается, даже если клиент отключился
+_running: set[asyncio.Task] = set()
+
+
+def render_names(pattern: str, count: int) -> list[str]:
+    """Имена гостей по шаблону: ``{n}`` — номер с 1 (``worker-{n:02d}`` → worker-01, ...)."""
+    if "{n" not in pattern:
+        pattern += "-{n}"
+    try:
+        names = [pattern.format(n=n) for n in range(1, count + 1)]
+    except (KeyError, IndexError, ValueError) as e:
+        raise ValueError(f"Invalid name pattern: {e}")
+    if len(set(names)) != count:
+        raise ValueError("Name pattern must produce unique names")
+    return names
+
+
+async def _remove(proxmox: ProxmoxAPI, vmid: int, type_: str) -> bool:
+    """Удалить гостя, которого не удалось довести до готовности; False — он остался."""
+    try:
+        await proxmox.wait_task(await proxmox.delete_vm(vmid, type_))
+    except Exception as e:
+        logger.error(f"Batch: failed to remove {type_} {vmid} after failure: {e}")
+        return False
+    await guest_records.delete(vmid)
+    return True
+
+
+async def _provision(
+    proxmox: ProxmoxAPI,
+    type_: str,
+    spec: VMBatchCreate,
+    names: list[str],
+    emit: Callable[[dict], None],
+):
+    template = (spec.template or settings.QEMU_TEMPLATE_VMID) if type_ == "qemu" else None
+    limit = asyncio.Semaphore(spec.parallelism or settings.BATCH_CONCURRENCY)
+    vmids = await proxmox.reserve_vmids(len(names))
+    emit({"event": "reserved", "vmids": vmids})
+
+    async def one(name: str, vmid: int) -> bool:
+        async with limit:
+            created = False
+            try:
+                # Готовый гость из тёплого пула — зарезервированный vmid не нужен
+                member = await warm_pool.claim(
+                    type_, name, spec.cpu, spec.memory, spec.disk,
+                    template=template if type_ == "qemu" else spec.os
+                )
+                if member:
+                    await proxmox.release_vmids([vmid])
+                    emit({"event": "ready", "vmid": member.vmid, "name": name, "ip": member.ip,
+                          "password": member.password, "pooled": True})
+                    return True
+
+                password = None
+                if type_ == "lxc":
+                    _, password = await proxmox.create_lxc(
+                        hostname=name, ostemplate=spec.os, cpu=spec.cpu, memory=spec.memory,
+                        disk=spec.disk, vmid=vmid, wait=True
+                    )
+                elif template:
+                    full = settings.QEMU_CLONE_FULL if spec.full_clone is None else spec.full_clone
+                    _, password = await proxmox.create_vm_from_template(
+                        name=name, template_vmid=template, cpu=spec.cpu, memory=spec.memory,
+                        disk=spec.disk, full=full, storage=settings.QEMU_CLONE_STORAGE,
+                        start=False, vmid=vmid
+                    )
+                else:
+                    await proxmox.create_vm(
+                        name=name, os=spec.os, cpu=spec.cpu, memory=spec.memory, disk=spec.disk,
+                        vmid=vmid, wait=True
+                    )
+                created = True
+                await guest_records.save(vmid, name=name, type=type_, os=spec.os, password=password)
+                emit({"event": "created", "vmid": vmid, "name": name})
+
+                if spec.start:
+                    await proxmox.wait_task(await proxmox.start_vm(vmid, type_))
+                    emit({"event": "started", "vmid": vmid, "name": name})
+
+                emit({"event": "ready", "vmid": vmid, "name": name, "ip": None,
+                      "password": password, "pooled": False})
+                return True
+            except Exception as e:
+                logger.error(f"Batch: failed to create {type_} {name} ({vmid}): {e}")
+                event = {"event": "failed", "vmid": vmid, "name": name, "error": str(e)}
+                if created:
+                    # Недостроенный гость (не запустился) не должен остаться в кластере
+                    event["removed"] = await _remove(proxmox, vmid, type_)
+                emit(event)
+                return False
+
+    try:
+        results = await asyncio.gather(*(one(name, vmid) for name, vmid in zip(names, vmids)))
+    finally:
+        await proxmox.release_vmids(vmids)
+        inventory.invalidate()
+    return results
+
+
+def start_batch(
+    proxmox: ProxmoxAPI,
+    type_: str,
+    spec: VMBatchCreate,
+    actor: Optional[str] = None,
+    source: str = "api",
+) -> AsyncIterator[dict]:
+    """Запустить массовое создание и вернуть поток событий по каждому гостю.
+
+    События: ``reserved`` (все vmid), затем на гостя ``created`` → ``started``
+    → ``ready`` (с паролем) или ``failed``; последним идёт ``done`` с итогом.
+    Гость, упавший после ``created``, удаляется; ``removed`` в ``failed``
+    говорит, удалось ли это (False — гость остался в кластере).
+    Если указан ``actor``, итог по каждому гостю пишется в журнал действий.
+
+    Raises:
+        ValueError: некорректный шаблон имени (до начала создания).
+    """
+    names = render_names(spec.name_pattern, spec.count)
+    queue: asyncio.Queue = asyncio.Queue()
+
+    def emit(event: dict):
+        queue.put_nowait(event)
+        if actor and event["event"] in ("ready", "failed"):
+            detail = {"name": event["name"], "batch": True}
+            if event["event"] == "failed":
+                detail["error"] = event["error"]
+            elif event["pooled"]:
+                detail["pooled"] = True
+            audit.emit("create", actor, source, event["vmid"], type_,
+                       status="ok" if event["event"] == "ready" else "failed", **detail)
+
+    async def run():
+        ok = failed = 0
+        try:
+            results = await _provision(proxmox, type_, spec, names, emit)
+            ok = sum(results)
+            failed = len(results) - ok
+        except Exception as e:
+            logger.error(f"Batch of {spec.count} {type_} failed: {e}")
+            queue.put_nowait({"event": "error", "error": str(e)})
+            failed = spec.count
+        finally:
+            queue.put_nowait({"event": "done", "ok": ok, "failed": failed})
+
+    task = asyncio.create_task(run())
+    _running.add(task)
+    task.add_done_callback(_running.discard)
+
+    async def events() -> AsyncIterator[dict]:
+        while True:
+            event = await queue.get()
+            yield event
+            if event["event"] == "done":
+                return
+
+    return events()
@@ -3,11 +3,88 @@ import logging
 import secrets
 import string
 import asyncio
-from typing import Optional
+import time
+import weakref
+from typing import Iterable, Optional
 from app.config import settings
+from app.guest import GB, QEMU_DISK_KEYS, Guest, parse_disk_size
+from app.locks import guest_locks
 
 logger = logging.getLogger(__name__)
 
+# Сколько придерживается vmid одиночного создания: к тому времени гость уже есть в кластере
+VMID_HOLD = 120.0
+_reserve_lock = asyncio.Lock()
+
+# Все клиенты процесса — чтобы закрыть их пулы соединений при остановке
+_clients: "weakref.WeakSet[ProxmoxAPI]" = weakref.WeakSet()
+
+# Ответы pveproxy, означающие, что до Proxmox (или ноды) не достучаться
+UNAVAILABLE_STATUSES = frozenset({502, 503, 504, 595, 596})
+
+
+class ProxmoxUnavailable(Exception):
+    """Proxmox не отвечает: соединение не удалось или запрос не отправлялся (см. ``ProxmoxHealth``)."""
+
+
+class ProxmoxHealth:
+    """Доступность Proxmox, общая для всех клиентов процесса.
+
+    После ``threshold`` неудачных соединений подряд (обрыв, таймаут,
+    ``UNAVAILABLE_STATUSES``) Proxmox считается недоступным: запросы падают
+    сразу с ``ProxmoxUnavailable``, не дожидаясь таймаута, и только раз в
+    ``cooldown`` секунд пропускается пробный запрос. Любой ответ Proxmox
+    возвращает обычный режим.
+    """
+
+    def __init__(self, threshold: int = 3, cooldown: float = 10.0):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        # Когда (time.time()) Proxmox признан недоступным
+        self.down_since: Optional[float] = None
+        self._retry_at = 0.0
+
+    @property
+    def down(self) -> bool:
+        return self.failures >= self.threshold
+
+    def check(self):
+        """Пропустить запрос или сразу отказать, пока Proxmox недоступен."""
+        if not self.down:
+            return
+        now = time.monotonic()
+        if now < self._retry_at:
+            raise ProxmoxUnavailable("Proxmox is unavailable, retrying later")
+        # Пробный запрос; до его результата остальные отказываются сразу
+        self._retry_at = now + self.cooldown
+
+    def success(self):
+        if self.down:
+            logger.info("Proxmox is reachable again")
+        self.failures = 0
+        self.down_since = None
+
+    def failure(self):
+        self.failures += 1
+        if self.failures == self.threshold:
+            logger.warning(f"Proxmox is unavailable, failing fast for {self.cooldown:g}s between probes")
+            self.down_since = time.time()
+        if self.down:
+            self._retry_at = time.monotonic() + self.cooldown
+
+
+proxmox_health = ProxmoxHealth(settings.PROXMOX_FAILURE_THRESHOLD, settings.PROXMOX_RETRY_INTERVAL)
+
+# Откуда берётся поле Guest: /status/current, /config или IP (агент / interfaces).
+# vmid, type и node известны без запросов
+GUEST_FIELD_SOURCES = {
+    "name": "status", "status": "status", "uptime": "status", "cpu": "status", "cpus": "status",
+    "mem": "status", "maxmem": "status", "disk": "status", "maxdisk": "status",
+    "os": "config", "tags": "config", "template": "config",
+    "ip": "ip",
+}
+
 
 def generate_password(length: int = 12) -> str:
     """Генерация случайного пароля."""
@@ -16,10 +93,33 @@ def generate_password(length: int = 12) -> str:
 
 
 class ProxmoxAPI:
-    def __init__(self):
+    def __init__(self, transport: Optional[httpx.AsyncBaseTransport] = None):
         self.base = f"https://{settings.PROXMOX_HOST}:8006/api2/json"
         self.token = f"PVEAPIToken={settings.PROXMOX_TOKEN_ID}={settings.PROXMOX_TOKEN_SECRET}"
         self.headers = {"Authorization": self.token}
+        # Транспорт httpx можно подменить (например, локальной заглушкой Proxmox в bench/)
+        self.transport = transport
+        # HTTP-клиент с пулом соединений создаётся при первом запросе, а не при импорте
+        self._http: Optional[httpx.AsyncClient] = None
+        self._http_loop: Optional[asyncio.AbstractEventLoop] = None
+        _clients.add(self)
+
+    def _client(self) -> httpx.AsyncClient:
+        # Соединения пула привязаны к event loop: в новом loop клиент создаётся заново
+        loop = asyncio.get_running_loop()
+        if self._http is None or self._http_loop is not loop or self._http.is_closed:
+            # Недоступный хост выясняется за connect, а не за полный таймаут ответа
+            self._http = httpx.AsyncClient(
+                verify=False, timeout=httpx.Timeout(30.0, connect=5.0), transport=self.transport
+            )
+            self._http_loop = loop
+        return self._http
+
+    async def aclose(self):
+        """Закрыть пул соединений (следующий запрос откроет новый)."""
+        if self._http is not None and self._http_loop is asyncio.get_running_loop():
+            await self._http.aclose()
+        self._http = None
 
     async def _request(
         self,
@@ -27,32 +127,44 @@ class ProxmoxAPI:
         endpoint: str,
         data: Optional[dict] = None
     ) -> dict:
-        """Универсальный метод для запросов к Proxmox API с обработкой ошибок."""
+        """Универсальный метод для запросов к Proxmox API с обработкой ошибок.
+
+        Raises:
+            ProxmoxUnavailable: Proxmox недоступен (см. ``proxmox_health``).
+        """
         url = f"{self.base}{endpoint}"
+        proxmox_health.check()
         try:
-            async with httpx.AsyncClient(verify=False, timeout=30.0) as client:
-                if method == "GET":
-                    response = await client.get(url, headers=self.headers)
-                elif method == "POST":
-                    response = await client.post(url, headers=self.headers, json=data)
-                elif method == "PUT":
-                    response = await client.put(url, headers=self.headers, json=data)
-                elif method == "DELETE":
-                    response = await client.delete(url, headers=self.headers)
-                else:
-                    raise ValueError(f"Unsupported HTTP method: {method}")
-
-                response.raise_for_status()
-                return response.json().get("data", {})
+            client = self._client()
+            if method == "GET":
+                response = await client.get(url, headers=self.headers)
+            elif method == "POST":
+                response = await client.post(url, headers=self.headers, json=data)
+            elif method == "PUT":
+                response = await client.put(url, headers=self.headers, json=data)
+            elif method == "DELETE":
+                response = await client.delete(url, headers=self.headers)
+            else:
+                raise ValueError(f"Unsupported HTTP method: {method}")
+
+            if response.status_code in UNAVAILABLE_STATUSES:
+                proxmox_health.failure()
+            else:
+                proxmox_health.success()
+            response.raise_for_status()
+            return response.json().get("data", {})
         except httpx.HTTPStatusError as e:
             logger.error(f"HTTP error: {e.response.status_code} - {e.response.text}")
+            if e.response.status_code in UNAVAILABLE_STATUSES:
+                raise ProxmoxUnavailable(f"Proxmox API error: {e.response.status_code}")
             raise Exception(f"Proxmox API error: {e.response.status_code}")
         except httpx.RequestError as e:
             logger.error(f"Request error: {e}")
-            raise Exception(f"Failed to connect to Proxmox: {str(e)}")
+            proxmox_health.failure()
+            raise ProxmoxUnavailable(f"Failed to connect to Proxmox: {str(e)}")
 
-    async def next_vmid(self) -> int:
-        """Получить следующий свободный VMID."""
+    async def _cluster_next_vmid(self) -> int:
+        """Следующий свободный VMID по мнению Proxmox (без учёта резерва)."""
         result = await self._request("GET", "/cluster/nextid")
         # Proxmox возвращает {'data': '105'} (строка!)
         if isinstance(result, int):
@@ -62,17 +174,54 @@ class ProxmoxAPI:
             return int(val) if val else 100
         return int(result)
 
+    async def next_vmid(self) -> int:
+        """Получить следующий свободный VMID (придерживается на ``VMID_HOLD`` секунд)."""
+        vmid = await self._cluster_next_vmid()
+        if not await guest_locks.reserve(vmid, VMID_HOLD):
+            # Номер уже обещан другому созданию (в любом воркере) — берём первый свободный после резерва
+            async with _reserve_lock:
+                vmid = (await self._reserve_free(1, VMID_HOLD))[0]
+        return vmid
+
+    async def _reserve_free(self, count: int, ttl: float) -> list[int]:
+        used = {
+            int(item["vmid"]) for item in await self.get_cluster_resources("vm")
+            if item.get("vmid") is not None
+        }
+        vmid = await self._cluster_next_vmid()
+        result = []
+        while len(result) < count:
+            if vmid not in used and await guest_locks.reserve(vmid, ttl):
+                result.append(vmid)
+            vmid += 1
+        return result
+
+    async def reserve_vmids(self, count: int) -> list[int]:
+        """Зарезервировать ``count`` свободных VMID для массового создания.
+
+        ``/cluster/nextid`` не резервирует номер, поэтому параллельные создания
+        получали бы один и тот же VMID. Резерв общий для процессов (через
+        ``guest_locks``) и снимается ``release_vmids``.
+        """
+        async with _reserve_lock:
+            return await self._reserve_free(count, settings.VMID_RESERVATION_TTL)
+
+    async def release_vmids(self, vmids):
+        await guest_locks.release_vmids(vmids)
+
     async def create_vm(
         self,
         name: str,
         os: str = "ubuntu-22.04",
         cpu: int = 1,
         memory: int = 2048,
-        disk: int = 10
+        disk: int = 10,
+        vmid: Optional[int] = None,
+        wait: bool = False  # Дождаться окончания задачи создания
     ) -> int:
         """Создать новую VM (QEMU)."""
-        vmid = await self.next_vmid()
-        await self._request("POST", f"/nodes/{settings.PROXMOX_NODE}/qemu", {
+        vmid = vmid or await self.next_vmid()
+        upid = await self._request("POST", f"/nodes/{settings.PROXMOX_NODE}/qemu", {
             "vmid": vmid,
             "name": name,
             "cores": cpu,
@@ -83,6 +232,8 @@ class ProxmoxAPI:
             "ostype": "l26",
             "bios": "seabios",
         })
+        if wait:
+            await self.wait_task(upid)
         return vmid
 
     async def create_vm_with_iso(
@@ -92,7 +243,8 @@ class ProxmoxAPI:
         cpu: int = 1,
         memory: int = 2048,
         disk: int = 10,
-        enable_cloud_init: bool = True
+        enable_cloud_init: bool = True,
+        wait: bool = False  # Дождаться окончания задачи создания
     ) -> tuple[int, str]:
         """Создать VM с подключенным ISO образом и cloud-init.
         
@@ -131,7 +283,9 @@ class ProxmoxAPI:
             # Включаем DHCP для сети (правильный формат для Proxmox)
             params["net0"] = "virtio,bridge=vmbr0"
         
-        await self._request("POST", f"/nodes/{settings.PROXMOX_NODE}/qemu", params)
+        upid = await self._request("POST", f"/nodes/{settings.PROXMOX_NODE}/qemu", params)
+        if wait:
+            await self.wait_task(upid)
         return vmid, password
 
     async def set_cloud_init(self, vmid: int, 
@@ -147,6 +301,141 @@ class ProxmoxAPI:
             "net0": "virtio,bridge=vmbr0",
         })
 
+    async def wait_task(self, upid: str, timeout: float = 300.0, interval: float = 0.5) -> dict:
+        """Дождаться завершения задачи Proxmox по её UPID.
+
+        Raises:
+            Exception: задача завершилась с ошибкой или не успела за ``timeout``.
+        """
+        # UPID:<node>:... — задача живёт на той ноде, где её запустили
+        node = upid.split(":")[1] if upid.startswith("UPID:") else settings.PROXMOX_NODE
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            task = await self._request("GET", f"/nodes/{node}/tasks/{upid}/status")
+            if task.get("status") == "stopped":
+                if task.get("exitstatus") != "OK":
+                    raise Exception(f"Proxmox task failed: {task.get('exitstatus')}")
+                return task
+            if loop.time() >= deadline:
+                raise Exception(f"Proxmox task timed out: {upid}")
+            await asyncio.sleep(interval)
+
+    async def get_vm_templates(self) -> list[Guest]:
+        """Шаблоны VM (template=1) во всём кластере."""
+        resources = await self.get_cluster_resources("vm")
+        return sorted(
+            (
+                Guest.from_resource(item)
+                for item in resources
+                if item.get("type") == "qemu" and item.get("template")
+            ),
+            key=lambda guest: guest.vmid,
+        )
+
+    async def clone_vm(
+        self,
+        template_vmid: int,
+        name: str,
+        full: bool = False,
+        storage: Optional[str] = None,
+        node: Optional[str] = None,
+        vmid: Optional[int] = None
+    ) -> tuple[int, str]:
+        """Клонировать шаблон VM.
+
+        Связанный клон (``full=False``) создаётся за секунды поверх диска
+        шаблона, полный копирует диск целиком.
+
+        Returns:
+            tuple: (vmid клона, UPID задачи клонирования)
+        """
+        # nextid не резервирует номер: параллельное создание может занять его раньше.
+        # Заранее зарезервированный vmid повторять незачем
+        attempts = 1 if vmid else 3
+        for attempt in range(attempts):
+            newid = vmid or await self.next_vmid()
+            params = {"newid": newid, "name": name, "full": int(full)}
+            if full and storage:
+                params["storage"] = storage
+            try:
+                upid = await self._request(
+                    "POST", f"/nodes/{node or settings.PROXMOX_NODE}/qemu/{template_vmid}/clone", params
+                )
+                return newid, upid
+            except Exception:
+                if attempt == attempts - 1:
+                    raise
+                logger.warning(f"Clone to VMID {newid} failed, retrying with a new VMID")
+
+    async def resize_disk(self, vmid: int, disk: str, size_gb: int, node: Optional[str] = None):
+        """Увеличить диск VM до ``size_gb`` ГБ (уменьшение Proxmox не поддерживает)."""
+        return await self._request("PUT", f"/nodes/{node or settings.PROXMOX_NODE}/qemu/{vmid}/resize", {
+            "disk": disk,
+            "size": f"{size_gb}G",
+        })
+
+    async def create_vm_from_template(
+        self,
+        name: str,
+        template_vmid: int,
+        cpu: int = 1,
+        memory: int = 2048,
+        disk: int = 10,
+        full: bool = False,
+        storage: Optional[str] = None,
+        start: bool = True,
+        tags: Optional[str] = None,
+        vmid: Optional[int] = None
+    ) -> tuple[int, str]:
+        """Создать VM клонированием cloud-init шаблона.
+
+        Клон → ядра, память и cloud-init → увеличение диска → запуск.
+        ОС уже установлена в шаблоне, поэтому VM доступна по SSH сразу
+        после загрузки.
+
+        Returns:
+            tuple: (vmid, сгенерированный пароль)
+        """
+        vmid, upid = await self.clone_vm(template_vmid, name, full=full, storage=storage, vmid=vmid)
+        try:
+            await self.wait_task(upid)
+
+            password = generate_password(16)
+            config = await self.get_vm_config(vmid, "qemu")
+            params = {
+                "cores": cpu,
+                "memory": memory,
+                "agent": 1,
+                "onboot": 1,
+                "ciuser": "root",
+                "cipassword": password,
+                "nameserver": "8.8.8.8",
+                "searchdomain": "local",
+                "ipconfig0": "ip=dhcp",
+            }
+            if tags:
+                params["tags"] = tags
+            # Шаблон без cloud-init диска — добавляем свой
+            if not any("cloudinit" in str(value) for value in config.values()):
+                params["ide0"] = "local-lvm:cloudinit"
+            await self._request("PUT", f"/nodes/{settings.PROXMOX_NODE}/qemu/{vmid}/config", params)
+
+            disk_key = next((key for key in QEMU_DISK_KEYS if parse_disk_size(config.get(key))), None)
+            if disk_key and disk * GB > parse_disk_size(config[disk_key]):
+                await self.resize_disk(vmid, disk_key, disk)
+
+            if start:
+                await self.wait_task(await self.start_vm(vmid, "qemu"))
+        except Exception:
+            logger.error(f"Provisioning of VM {vmid} from template {template_vmid} failed, removing clone")
+            try:
+                await self.delete_vm(vmid, "qemu")
+            except Exception:
+                pass
+            raise
+        return vmid, password
+
     async def create_lxc(
         self,
         hostname: str,
@@ -154,14 +443,17 @@ class ProxmoxAPI:
         cpu: int = 1,
         memory: int = 512,
         disk: int = 4,
-        ip: str = "dhcp"  # "dhcp" или статический IP в формате "192.168.1.100/24"
+        ip: str = "dhcp",  # "dhcp" или статический IP в формате "192.168.1.100/24"
+        tags: Optional[str] = None,
+        wait: bool = False,  # Дождаться окончания задачи создания
+        vmid: Optional[int] = None
     ) -> tuple[int, str]:
         """Создать новый LXC контейнер.
         
         Returns:
             tuple: (vmid, сгенерированный пароль)
         """
-        vmid = await self.next_vmid()
+        vmid = vmid or await self.next_vmid()
         
         # Генерируем случайный пароль
         password = generate_password(16)
@@ -178,7 +470,7 @@ class ProxmoxAPI:
         else:
             net_config = f"name=eth0,bridge=vmbr0,ip={ip}"
         
-        await self._request("POST", f"/nodes/{settings.PROXMOX_NODE}/lxc", {
+        params = {
             "vmid": vmid,
             "hostname": hostname,
             "ostemplate": template_path,
@@ -189,9 +481,18 @@ class ProxmoxAPI:
             "password": password,  # Случайный пароль
             "onboot": 1,
             "unprivileged": 1,  # Unprivileged контейнер для безопасности
-        })
+        }
+        if tags:
+            params["tags"] = tags
+        upid = await self._request("POST", f"/nodes/{settings.PROXMOX_NODE}/lxc", params)
+        if wait:
+            await self.wait_task(upid)
         return vmid, password
 
+    async def update_config(self, vmid: int, type_: str, params: dict, node: Optional[str] = None):
+        """Изменить конфигурацию VM или LXC (ключ ``delete`` удаляет параметры)."""
+        return await self._request("PUT", f"/nodes/{node or settings.PROXMOX_NODE}/{type_}/{vmid}/config", params)
+
     async def start_vm(self, vmid: int, type_: str = "qemu") -> dict:
         """Запустить VM или LXC."""
         return await self._request("POST", f"/nodes/{settings.PROXMOX_NODE}/{type_}/{vmid}/status/start")
@@ -204,50 +505,96 @@ class ProxmoxAPI:
         """Удалить VM или LXC."""
         return await self._request("DELETE", f"/nodes/{settings.PROXMOX_NODE}/{type_}/{vmid}")
 
-    async def get_vm_status(self, vmid: int, type_: str = "qemu") -> dict:
+    async def get_vm_status(self, vmid: int, type_: str = "qemu", node: Optional[str] = None) -> dict:
         """Получить статус VM или LXC."""
-        return await self._request("GET", f"/nodes/{settings.PROXMOX_NODE}/{type_}/{vmid}/status/current")
+        return await self._request("GET", f"/nodes/{node or settings.PROXMOX_NODE}/{type_}/{vmid}/status/current")
 
-    async def get_vm_config(self, vmid: int, type_: str = "qemu") -> dict:
+    async def get_vm_config(self, vmid: int, type_: str = "qemu", node: Optional[str] = None) -> dict:
         """Получить конфигурацию VM или LXC."""
-        return await self._request("GET", f"/nodes/{settings.PROXMOX_NODE}/{type_}/{vmid}/config")
+        return await self._request("GET", f"/nodes/{node or settings.PROXMOX_NODE}/{type_}/{vmid}/config")
+
+    async def get_cluster_resources(self, type_: Optional[str] = "vm") -> list:
+        """Получить ресурсы всего кластера одним запросом (гости, ноды, хранилища)."""
+        endpoint = "/cluster/resources"
+        if type_:
+            endpoint += f"?type={type_}"
+        result = await self._request("GET", endpoint)
+        return result if isinstance(result, list) else []
 
-    async def list_vms(self, type_: str = "qemu") -> list:
+    async def get_cluster_tasks(self) -> list:
+        """Последние задачи кластера (Proxmox отдаёт свежие первыми)."""
+        result = await self._request("GET", "/cluster/tasks")
+        return result if isinstance(result, list) else []
+
+    async def get_rrddata(
+        self,
+        vmid: int,
+        type_: str = "qemu",
+        timeframe: str = "hour",
+        node: Optional[str] = None
+    ) -> list:
+        """RRD-история гостя (за час — точки раз в минуту): cpu, mem, disk, сеть, IO."""
+        result = await self._request(
+            "GET", f"/nodes/{node or settings.PROXMOX_NODE}/{type_}/{vmid}/rrddata?timeframe={timeframe}&cf=AVERAGE"
+        )
+        return result if isinstance(result, list) else []
+
+    async def get_node_rrddata(self, node: Optional[str] = None, timeframe: str = "hour") -> list:
+        """RRD-история ноды."""
+        result = await self._request(
+            "GET", f"/nodes/{node or settings.PROXMOX_NODE}/rrddata?timeframe={timeframe}&cf=AVERAGE"
+        )
+        return result if isinstance(result, list) else []
+
+    async def list_vms(self, type_: str = "qemu") -> list[Guest]:
         """Получить список всех VM или LXC."""
         result = await self._request("GET", f"/nodes/{settings.PROXMOX_NODE}/{type_}")
         if not isinstance(result, list):
             return []
+
+        guests = [Guest.from_resource(item, type_) for item in result]
+        for guest in guests:
+            guest.node = settings.PROXMOX_NODE
         
         # Для LXC дополнительно получаем IP из interfaces
         if type_ == "lxc":
-            for lxc in result:
-                vmid = lxc.get("vmid")
+            for guest in guests:
                 try:
-                    iface_result = await self._request("GET", f"/nodes/{settings.PROXMOX_NODE}/lxc/{vmid}/interfaces")
+                    iface_result = await self._request("GET", f"/nodes/{settings.PROXMOX_NODE}/lxc/{guest.vmid}/interfaces")
                     if isinstance(iface_result, list):
                         for iface in iface_result:
                             if iface.get("name") == "eth0":
                                 inet = iface.get("inet", "")
                                 if inet and not inet.startswith("127."):
-                                    lxc["ip"] = inet.split("/")[0]
+                                    guest.ip = inet.split("/")[0]
                                     break
                 except Exception:
                     pass
         
-        return result
+        return guests
 
-    async def get_vm_ip(self, vmid: int, type_: str = "qemu", timeout: int = 10) -> Optional[str]:
+    async def get_vm_ip(
+        self,
+        vmid: int,
+        type_: str = "qemu",
+        timeout: int = 10,
+        node: Optional[str] = None,
+        interval: float = 1.0
+    ) -> Optional[str]:
         """Получить IP адрес VM или LXC.
         
         Args:
             vmid: ID виртуальной машины или контейнера
             type_: Тип (qemu или lxc)
             timeout: Максимальное время ожидания в секундах
+            node: Нода, на которой находится гость (по умолчанию PROXMOX_NODE)
+            interval: Пауза между попытками опроса агента, секунды
         """
+        node = node or settings.PROXMOX_NODE
         if type_ == "lxc":
             # Для LXC получаем IP из interfaces
             try:
-                result = await self._request("GET", f"/nodes/{settings.PROXMOX_NODE}/lxc/{vmid}/interfaces")
+                result = await self._request("GET", f"/nodes/{node}/lxc/{vmid}/interfaces")
                 if isinstance(result, list):
                     for iface in result:
                         if iface.get("name") == "eth0":
@@ -260,9 +607,10 @@ class ProxmoxAPI:
             return None
         
         # Для VM используем qemu-guest-agent
-        for _ in range(timeout):
+        attempts = max(1, int(timeout / interval))
+        for attempt in range(attempts):
             try:
-                interfaces = await self._request("GET", f"/nodes/{settings.PROXMOX_NODE}/{type_}/{vmid}/agent/network-get-interfaces")
+                interfaces = await self._request("GET", f"/nodes/{node}/{type_}/{vmid}/agent/network-get-interfaces")
                 result = interfaces.get("result", [])
                 if result:
                     for iface in result:
@@ -275,7 +623,9 @@ class ProxmoxAPI:
                                         return ip
             except Exception:
                 pass
-            await asyncio.sleep(1)
+            # После последней попытки не ждём
+            if attempt < attempts - 1:
+                await asyncio.sleep(interval)
         return None
 
     async def get_iso_images(self, storage: str = "local") -> list:
@@ -324,55 +674,87 @@ class ProxmoxAPI:
         """Корректно завершить работу VM (требуется qemu-guest-agent)."""
         return await self._request("POST", f"/nodes/{settings.PROXMOX_NODE}/{type_}/{vmid}/status/shutdown")
 
-    async def get_vm_full_info(self, vmid: int, type_: str = "qemu") -> dict:
-        """Получить полную информацию о VM."""
+    async def agent_ping(self, vmid: int, node: Optional[str] = None) -> bool:
+        """Отвечает ли qemu-guest-agent VM."""
         try:
-            config = await self.get_vm_config(vmid, type_)
-            status = await self.get_vm_status(vmid, type_)
-            
-            # Получаем IP только если VM запущена
-            ip = None
-            if status.get("status") == "running":
+            await self._request("POST", f"/nodes/{node or settings.PROXMOX_NODE}/qemu/{vmid}/agent/ping")
+            return True
+        except Exception:
+            return False
+
+    async def fetch_guest(
+        self,
+        vmid: int,
+        type_: str = "qemu",
+        fields: Optional[Iterable[str]] = None,
+        node: Optional[str] = None,
+        timeout: Optional[float] = None,
+        ip_timeout: int = 10,
+    ) -> Guest:
+        """Получить гостя, запросив только то, из чего берутся нужные поля.
+
+        ``fields`` — поля ``Guest`` (по умолчанию все). Нужные запросы
+        (``/config``, ``/status/current``, IP) идут параллельно; IP
+        спрашивается вместе со статусом и отбрасывается, если гость не
+        запущен. Незапрошенные поля остаются по умолчанию.
+
+        ``timeout`` ограничивает только запросы конфигурации и статуса.
+        IP ждётся не дольше ``ip_timeout`` секунд и остаётся None, если
+        агент не ответил: молчащий агент — не сбой Proxmox.
+
+        Raises:
+            ValueError: неизвестное поле.
+            asyncio.TimeoutError: конфигурация или статус не получены за ``timeout``.
+            Exception: ошибка запроса конфигурации или статуса.
+        """
+        if fields is None:
+            sources = set(GUEST_FIELD_SOURCES.values())
+        else:
+            unknown = [f for f in fields if f not in GUEST_FIELD_SOURCES and f not in ("vmid", "type", "node")]
+            if unknown:
+                raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+            sources = {GUEST_FIELD_SOURCES[f] for f in fields if f in GUEST_FIELD_SOURCES}
+        if "ip" in sources:
+            # IP имеет смысл только у работающего гостя
+            sources.add("status")
+
+        node = node or settings.PROXMOX_NODE
+        guest = Guest(vmid=vmid, type=type_, node=node)
+        ip_task = (
+            asyncio.create_task(self.get_vm_ip(vmid, type_, timeout=ip_timeout, node=node))
+            if "ip" in sources else None
+        )
+        try:
+            requests = {}
+            if "config" in sources:
+                requests["config"] = self.get_vm_config(vmid, type_, node=node)
+            if "status" in sources:
+                requests["status"] = self.get_vm_status(vmid, type_, node=node)
+            results = dict(zip(requests, await asyncio.wait_for(asyncio.gather(*requests.values()), timeout)))
+            guest.apply_config(results.get("config")).apply_status(results.get("status"))
+
+            if ip_task is not None and guest.running:
                 try:
-                    ip = await self.get_vm_ip(vmid, type_)
+                    # Один зависший запрос к агенту не должен держать ответ дольше ip_timeout
+                    guest.ip = await asyncio.wait_for(ip_task, ip_timeout)
                 except Exception:
                     pass
+        finally:
+            if ip_task is not None and not ip_task.done():
+                ip_task.cancel()
+        return guest
 
-            # Парсим диск — может быть строкой или числом
-            scsi0 = str(config.get("scsi0", config.get("ide0", "local-lvm:10")))
-            disk_size = scsi0.split(":")[-1] if ":" in scsi0 else "10"
-            disk_size = disk_size.replace("G", "").replace("g", "")
-            try:
-                disk_size = float(disk_size)
-            except ValueError:
-                disk_size = 10.0
-
-            # Конвертируем значения в числа
-            def to_float(val, default=0):
-                if val is None:
-                    return default
-                try:
-                    return float(val)
-                except (ValueError, TypeError):
-                    return default
-
-            return {
-                "vmid": vmid,
-                "name": config.get("name", f"vm-{vmid}"),
-                "status": status.get("status", "unknown"),
-                "cpu": config.get("cores", 1),
-                "memory": to_float(config.get("memory"), 512),
-                "disk": disk_size,
-                "os": config.get("ostype", "unknown"),
-                "ip": ip,
-                "uptime": to_float(status.get("uptime"), 0),
-                "cpus": to_float(status.get("cpus"), 1),
-                "maxcpu": config.get("cores", 1),
-                "maxmem": to_float(config.get("memory"), 512),
-                "maxdisk": to_float(status.get("maxdisk"), 10 * 1024 * 1024 * 1024),
-                "disk_used": to_float(status.get("disk"), 0),
-                "mem_used": to_float(status.get("mem"), 0),
-            }
+    async def get_vm_full_info(
+        self, vmid: int, type_: str = "qemu", fields: Optional[Iterable[str]] = None
+    ) -> Optional[Guest]:
+        """Получить информацию о VM (по умолчанию конфигурация, статус и IP), см. ``fetch_guest``."""
+        try:
+            return await self.fetch_guest(vmid, type_, fields)
         except Exception as e:
             logger.error(f"Failed to get VM full info: {e}")
-            return {}
+            return None
+
+
+async def close_clients():
+    """Закрыть пулы соединений всех клиентов Proxmox (при остановке процесса)."""
+    await asyncio.gather(*(client.aclose() for client in list(_clients)), return_exceptions=True)
@@ -0,0 +1,82 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import select, tuple_
+
+from app.auth import get_current_user
+from app.database import SessionLocal
+from app.models import AuditEvent, User
+from app.schemas import AuditEventResponse, AuditPage
+
+router = APIRouter()
+
+
+def encode_cursor(time: datetime, id_: int) -> str:
+    raw = json.dumps([time.isoformat(), id_], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        time, id_ = json.loads(raw)
+        return datetime.fromisoformat(time), int(id_)
+    except (binascii.Error, ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+
+
+@router.get("/", response_model=AuditPage)
+async def list_audit_events(
+    vmid: Optional[int] = None,
+    actor: Optional[str] = Query(None, description="Имя пользователя API или tg:<id>"),
+    action: Optional[str] = Query(None, description="create, start, stop, shutdown, restart, delete, ..."),
+    source: Optional[str] = Query(None, description="api, bot, idle"),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """Журнал действий с гостями, свежие первыми.
+
+    События пишутся в фоне пачками, поэтому появляются здесь с задержкой
+    около секунды.
+    """
+    query = select(AuditEvent)
+    if vmid is not None:
+        query = query.where(AuditEvent.vmid == vmid)
+    if actor:
+        query = query.where(AuditEvent.actor == actor)
+    if action:
+        query = query.where(AuditEvent.action == action)
+    if source:
+        query = query.where(AuditEvent.source == source)
+    if since:
+        query = query.where(AuditEvent.time >= since)
+    if until:
+        query = query.where(AuditEvent.time < until)
+    if cursor:
+        try:
+            time, id_ = decode_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        query = query.where(tuple_(AuditEvent.time, AuditEvent.id) < tuple_(time, id_))
+    # Лишняя строка показывает, есть ли следующая страница
+    query = query.order_by(AuditEvent.time.desc(), AuditEvent.id.desc()).limit(limit + 1)
+
+    try:
+        async with SessionLocal() as db:
+            events = (await db.execute(query)).scalars().all()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    more = len(events) > limit
+    events = events[:limit]
+    return AuditPage(
+        items=[AuditEventResponse.model_validate(e, from_attributes=True) for e in events],
+        next_cursor=encode_cursor(events[-1].time, events[-1].id) if more else None,
+    )
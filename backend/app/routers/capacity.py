@@ -0,0 +1,20 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from app.capacity import TOP_CONSUMERS, capacity_report
+from app.inventory import inventory
+from app.auth import get_current_user
+from app.models import User
+
+router = APIRouter()
+
+
+@router.get("/")
+async def get_capacity(
+    top: int = Query(TOP_CONSUMERS, ge=1, le=50, description="Сколько крупнейших потребителей показать"),
+    current_user: User = Depends(get_current_user)
+):
+    """Ёмкость кластера: выделено и занято по CPU, памяти и диску по нодам и хранилищам."""
+    try:
+        snapshot = await inventory.snapshot()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return capacity_report(snapshot, top)
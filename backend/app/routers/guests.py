@@ -0,0 +1,119 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from typing import Optional
+from app.schemas import VMResponse, VMPage
+from app.guest_service import guest_service
+from app.locks import GuestBusy
+from app.proxmox import ProxmoxUnavailable
+from app.metrics import RANGES, metrics
+from app.auth import get_current_user
+from app.models import User
+
+router = APIRouter()
+
+
+@router.get("/", response_model=VMPage)
+async def list_guests(
+    request: Request,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    type: Optional[str] = Query(None, description="qemu или lxc; по умолчанию оба"),
+    status: Optional[str] = Query(None, description="running, stopped, ..."),
+    name: Optional[str] = Query(None, description="Подстрока имени"),
+    node: Optional[str] = None,
+    tag: Optional[str] = None,
+    sort: str = Query("vmid", description="Поле сортировки, '-' в начале — по убыванию"),
+    current_user: User = Depends(get_current_user)
+):
+    """Получить VM и LXC одним списком (постранично, с фильтрами и сортировкой).
+
+    Тип гостя — в поле ``type`` каждой записи. Вся страница строится по одному
+    снимку кластера, гости обоих типов дополняются параллельно.
+    """
+    try:
+        return await guest_service.page(
+            request, type, status=status, name=name, node=node, tag=tag,
+            sort=sort, limit=limit, cursor=cursor
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ProxmoxUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/{vmid}", response_model=VMResponse)
+async def get_guest(
+    vmid: int,
+    request: Request,
+    fields: Optional[str] = Query(None, description="Поля ответа через запятую, например status,ip"),
+    current_user: User = Depends(get_current_user)
+):
+    """Получить информацию о госте любого типа (тип — по инвентарю кластера)."""
+    try:
+        return await guest_service.detail(request, vmid, fields=fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ProxmoxUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/{vmid}/metrics")
+async def get_guest_metrics(
+    vmid: int,
+    range: str = Query("1h", description=", ".join(RANGES)),
+    current_user: User = Depends(get_current_user)
+):
+    """История нагрузки гостя (CPU, память, диск, сеть) из памяти сборщика."""
+    if range not in RANGES:
+        raise HTTPException(status_code=400, detail=f"Unknown range, expected one of: {', '.join(RANGES)}")
+    try:
+        data = await metrics.guest_metrics(vmid, await guest_service.resolve(vmid), RANGES[range])
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if data is None:
+        raise HTTPException(status_code=404, detail="No metrics for this guest")
+    return {"vmid": vmid, "range": range, **data}
+
+
+async def _power(vmid: int, action: str, current_user: User) -> dict:
+    try:
+        return await guest_service.power(vmid, await guest_service.resolve(vmid), action, current_user.username)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except GuestBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ProxmoxUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/{vmid}/start")
+async def start_guest(vmid: int, current_user: User = Depends(get_current_user)):
+    """Запустить гостя."""
+    return await _power(vmid, "start", current_user)
+
+
+@router.post("/{vmid}/stop")
+async def stop_guest(vmid: int, current_user: User = Depends(get_current_user)):
+    """Остановить гостя."""
+    return await _power(vmid, "stop", current_user)
+
+
+@router.post("/{vmid}/shutdown")
+async def shutdown_guest(vmid: int, current_user: User = Depends(get_current_user)):
+    """Корректно завершить работу гостя."""
+    return await _power(vmid, "shutdown", current_user)
+
+
+@router.delete("/{vmid}")
+async def delete_guest(vmid: int, current_user: User = Depends(get_current_user)):
+    """Удалить гостя."""
+    return await _power(vmid, "delete", current_user)
@@ -0,0 +1,129 @@
+import asyncio
+import csv
+import io
+import logging
+from dataclasses import asdict, replace
+from typing import AsyncIterator, Iterable, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+
+from app.config import settings
+from app.guest import Guest
+from app.inventory import inventory
+from app.inventory_sync import inventory_sync
+from app.http_cache import ndjson_stream
+from app.auth import get_current_user
+from app.models import User
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# Колонки CSV: плоские поля записи гостя, без конфигурации
+CSV_FIELDS = (
+    "vmid", "type", "name", "status", "node", "tags", "template", "os", "ip",
+    "cpus", "maxmem", "maxdisk", "mem", "disk", "cpu", "uptime",
+)
+
+
+async def _fetch(guest: Guest, with_ip: bool) -> dict:
+    """Запись гостя с конфигурацией; ошибка одного гостя не прерывает выгрузку."""
+    guest = replace(guest)
+    config = None
+    error = None
+    try:
+        config = await inventory_sync.config(guest)
+        guest.apply_config(config)
+        if with_ip and guest.running and guest.ip is None:
+            guest.ip = await inventory.proxmox.get_vm_ip(guest.vmid, guest.type, timeout=1, node=guest.node)
+    except Exception as e:
+        error = str(e)
+    record = asdict(guest)
+    record["config"] = config
+    if error:
+        record["error"] = error
+    return record
+
+
+async def stream_records(
+    guests: Iterable[Guest],
+    concurrency: int,
+    with_ip: bool = False,
+) -> AsyncIterator[dict]:
+    """Отдавать записи по мере готовности, держа в работе не больше ``concurrency`` гостей.
+
+    Воркеры берут гостей из общего итератора, а очередь ограничена, поэтому
+    память не зависит от размера кластера, а первая запись уходит сразу
+    после первого ответа Proxmox.
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency)
+    pending = iter(guests)
+    done = object()
+
+    async def worker():
+        # _fetch не бросает исключений, кроме отмены
+        for guest in pending:
+            await queue.put(await _fetch(guest, with_ip))
+        await queue.put(done)
+
+    workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+    try:
+        remaining = len(workers)
+        while remaining:
+            item = await queue.get()
+            if item is done:
+                remaining -= 1
+            else:
+                yield item
+    finally:
+        # Клиент мог оборвать соединение — не оставляем запросы в фоне
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+
+async def _csv(records: AsyncIterator[dict]) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=CSV_FIELDS, extrasaction="ignore")
+
+    def flush() -> bytes:
+        data = buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+        return data
+
+    try:
+        writer.writeheader()
+        yield flush()
+        async for record in records:
+            writer.writerow({**record, "tags": ";".join(record["tags"])})
+            yield flush()
+    finally:
+        await records.aclose()
+
+
+@router.get("/export")
+async def export_inventory(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    type: Optional[str] = Query(None, pattern="^(qemu|lxc)$"),
+    ip: bool = Query(False, description="Запрашивать IP работающих гостей (медленнее)"),
+    concurrency: Optional[int] = Query(None, ge=1, le=64),
+    current_user: User = Depends(get_current_user)
+):
+    """Потоковая выгрузка всего инвентаря с конфигурациями (NDJSON или CSV)."""
+    try:
+        snapshot = await inventory.snapshot()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    guests = snapshot.guests(type)
+    records = stream_records(guests, concurrency or settings.EXPORT_CONCURRENCY, with_ip=ip)
+    headers = {
+        "X-Inventory-Version": str(snapshot.version),
+        "X-Total-Count": str(len(guests)),
+    }
+    if format == "csv":
+        headers["Content-Disposition"] = 'attachment; filename="inventory.csv"'
+        return StreamingResponse(_csv(records), media_type="text/csv", headers=headers)
+    return StreamingResponse(ndjson_stream(records), media_type="application/x-ndjson", headers=headers)
@@ -1,94 +1,158 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from typing import List
-from app.schemas import VMCreate, VMResponse
-from app.proxmox import ProxmoxAPI
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from typing import Optional
+from app.schemas import VMCreate, VMBatchCreate, VMResponse, VMPage
+from app.inventory import inventory
+from app.guest_records import guest_records
+from app.guest_service import guest_service
+from app.locks import GuestBusy
+from app.proxmox import ProxmoxUnavailable
+from app.audit import audit
+from app.warm_pool import warm_pool
+from app.provisioning import start_batch
+from app.metrics import RANGES, metrics
+from app.http_cache import ndjson_stream
 from app.auth import get_current_user
 from app.models import User
 
 router = APIRouter()
-proxmox = ProxmoxAPI()
+# Один клиент (и пул соединений) с чтением гостей
+proxmox = guest_service.proxmox
 
 
-@router.get("/", response_model=List[VMResponse])
-async def list_lxc(current_user: User = Depends(get_current_user)):
-    """Получить список всех LXC контейнеров."""
+@router.get("/", response_model=VMPage)
+async def list_lxc(
+    request: Request,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    status: Optional[str] = Query(None, description="running, stopped, ..."),
+    name: Optional[str] = Query(None, description="Подстрока имени"),
+    node: Optional[str] = None,
+    tag: Optional[str] = None,
+    sort: str = Query("vmid", description="Поле сортировки, '-' в начале — по убыванию"),
+    current_user: User = Depends(get_current_user)
+):
+    """Получить список всех LXC контейнеров (постранично, с фильтрами и сортировкой)."""
     try:
-        vms_data = await proxmox.list_vms("lxc")
-        result = []
-        for vm in vms_data:
-            vmid = vm.get("vmid")
-            config = await proxmox.get_vm_config(vmid, "lxc")
-            ip = await proxmox.get_vm_ip(vmid, "lxc")
-            result.append(VMResponse(
-                vmid=vmid,
-                name=config.get("hostname", f"lxc-{vmid}"),
-                type="lxc",
-                os=config.get("ostemplate", "unknown").split("/")[-1].replace(".tar.gz", ""),
-                cpu=config.get("cores", 1),
-                memory=config.get("memory", 512),
-                disk=4,  # Нужно парсить из rootfs
-                ip=ip,
-                status=vm.get("status", "unknown")
-            ))
-        return result
+        return await guest_service.page(
+            request, "lxc", status=status, name=name, node=node, tag=tag,
+            sort=sort, limit=limit, cursor=cursor
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ProxmoxUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.post("/", response_model=VMResponse)
 async def create_lxc(vm: VMCreate, current_user: User = Depends(get_current_user)):
-    """Создать новый LXC контейнер."""
+    """Создать новый LXC контейнер (или выдать готовый из тёплого пула)."""
     try:
-        vmid = await proxmox.create_lxc(
-            hostname=vm.name,
-            ostemplate=vm.os,
-            cpu=vm.cpu,
-            memory=vm.memory,
-            disk=vm.disk
-        )
-        return VMResponse(
-            vmid=vmid,
-            name=vm.name,
-            type="lxc",
-            os=vm.os,
-            cpu=vm.cpu,
-            memory=vm.memory,
-            disk=vm.disk,
-            ip=None,
-            status="created"
-        )
+        async with audit.track("create", current_user.username, "api", type_="lxc", name=vm.name) as event:
+            member = await warm_pool.claim("lxc", vm.name, vm.cpu, vm.memory, vm.disk, template=vm.os)
+            if member:
+                event.vmid = member.vmid
+                event.detail["pooled"] = True
+                return VMResponse(
+                    vmid=member.vmid,
+                    name=vm.name,
+                    type="lxc",
+                    os=vm.os,
+                    cpu=vm.cpu,
+                    memory=vm.memory,
+                    disk=vm.disk,
+                    ip=member.ip,
+                    status="running",
+                    password=member.password
+                )
+
+            vmid, password = await proxmox.create_lxc(
+                hostname=vm.name,
+                ostemplate=vm.os,
+                cpu=vm.cpu,
+                memory=vm.memory,
+                disk=vm.disk
+            )
+            event.vmid = vmid
+            await guest_records.save(vmid, name=vm.name, type="lxc", os=vm.os, password=password)
+            inventory.invalidate()
+            return VMResponse(
+                vmid=vmid,
+                name=vm.name,
+                type="lxc",
+                os=vm.os,
+                cpu=vm.cpu,
+                memory=vm.memory,
+                disk=vm.disk,
+                ip=None,
+                status="created",
+                password=password
+            )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/batch")
+async def create_lxc_batch(spec: VMBatchCreate, current_user: User = Depends(get_current_user)):
+    """Создать ``count`` одинаковых LXC контейнеров; прогресс по каждому — потоком NDJSON."""
+    try:
+        events = start_batch(proxmox, "lxc", spec, actor=current_user.username)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return StreamingResponse(ndjson_stream(events), media_type="application/x-ndjson")
+
+
 @router.get("/{vmid}", response_model=VMResponse)
-async def get_lxc(vmid: int, current_user: User = Depends(get_current_user)):
-    """Получить информацию о LXC контейнере."""
+async def get_lxc(
+    vmid: int,
+    request: Request,
+    fields: Optional[str] = Query(None, description="Поля ответа через запятую, например status,ip"),
+    current_user: User = Depends(get_current_user)
+):
+    """Получить информацию о LXC контейнере.
+
+    С ``fields`` в Proxmox запрашивается только нужное: ``status`` — один
+    запрос статуса, ``os`` — конфигурация, ``ip`` — статус и IP параллельно.
+    """
     try:
-        config = await proxmox.get_vm_config(vmid, "lxc")
-        status_data = await proxmox.get_vm_status(vmid, "lxc")
-        ip = await proxmox.get_vm_ip(vmid, "lxc")
-        return VMResponse(
-            vmid=vmid,
-            name=config.get("hostname", f"lxc-{vmid}"),
-            type="lxc",
-            os=config.get("ostemplate", "unknown").split("/")[-1].replace(".tar.gz", ""),
-            cpu=config.get("cores", 1),
-            memory=config.get("memory", 512),
-            disk=4,
-            ip=ip,
-            status=status_data.get("status", "unknown")
-        )
+        return await guest_service.detail(request, vmid, "lxc", fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ProxmoxUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/{vmid}/metrics")
+async def get_lxc_metrics(
+    vmid: int,
+    range: str = Query("1h", description=", ".join(RANGES)),
+    current_user: User = Depends(get_current_user)
+):
+    """История нагрузки LXC контейнера (CPU, память, диск, сеть) из памяти сборщика."""
+    if range not in RANGES:
+        raise HTTPException(status_code=400, detail=f"Unknown range, expected one of: {', '.join(RANGES)}")
+    try:
+        data = await metrics.guest_metrics(vmid, "lxc", RANGES[range])
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    if data is None:
+        raise HTTPException(status_code=404, detail="No metrics for this guest")
+    return {"vmid": vmid, "range": range, **data}
 
 
 @router.post("/{vmid}/start")
 async def start_lxc(vmid: int, current_user: User = Depends(get_current_user)):
     """Запустить LXC контейнер."""
     try:
-        await proxmox.start_vm(vmid, "lxc")
-        return {"status": "started", "vmid": vmid}
+        return await guest_service.power(vmid, "lxc", "start", current_user.username)
+    except GuestBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ProxmoxUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -97,8 +161,11 @@ async def start_lxc(vmid: int, current_user: User = Depends(get_current_user)):
 async def stop_lxc(vmid: int, current_user: User = Depends(get_current_user)):
     """Остановить LXC контейнер."""
     try:
-        await proxmox.stop_vm(vmid, "lxc")
-        return {"status": "stopped", "vmid": vmid}
+        return await guest_service.power(vmid, "lxc", "stop", current_user.username)
+    except GuestBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ProxmoxUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -107,8 +174,11 @@ async def stop_lxc(vmid: int, current_user: User = Depends(get_current_user)):
 async def shutdown_lxc(vmid: int, current_user: User = Depends(get_current_user)):
     """Корректно завершить работу LXC контейнера."""
     try:
-        await proxmox._request("POST", f"/nodes/{proxmox.PROXMOX_NODE}/lxc/{vmid}/status/shutdown")
-        return {"status": "shutting_down", "vmid": vmid}
+        return await guest_service.power(vmid, "lxc", "shutdown", current_user.username)
+    except GuestBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ProxmoxUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -117,7 +187,10 @@ async def shutdown_lxc(vmid: int, current_user: User = Depends(get_current_user)
 async def delete_lxc(vmid: int, current_user: User = Depends(get_current_user)):
     """Удалить LXC контейнер."""
     try:
-        await proxmox.delete_vm(vmid, "lxc")
-        return {"status": "deleted", "vmid": vmid}
+        return await guest_service.power(vmid, "lxc", "delete", current_user.username)
+    except GuestBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ProxmoxUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
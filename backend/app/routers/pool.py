@@ -0,0 +1,19 @@
+from fastapi import APIRouter, Depends
+from app.warm_pool import warm_pool
+from app.auth import get_current_user
+from app.models import User
+
+router = APIRouter()
+
+
+@router.get("/")
+async def get_pool(current_user: User = Depends(get_current_user)):
+    """Состояние тёплого пула: готовые гости и попадания/промахи по профилям."""
+    return {"unmatched": warm_pool.unmatched, "profiles": warm_pool.status()}
+
+
+@router.post("/refill")
+async def refill_pool(current_user: User = Depends(get_current_user)):
+    """Пополнить пул сейчас, не дожидаясь интервала."""
+    warm_pool.wake()
+    return {"status": "scheduled"}
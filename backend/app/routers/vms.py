@@ -1,94 +1,192 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from typing import List
-from app.schemas import VMCreate, VMResponse
-from app.proxmox import ProxmoxAPI
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from typing import Optional
+from app.config import settings
+from app.schemas import VMCreate, VMBatchCreate, VMResponse, VMPage
+from app.inventory import inventory
+from app.guest_records import guest_records
+from app.guest_service import guest_service
+from app.locks import GuestBusy
+from app.proxmox import ProxmoxUnavailable
+from app.audit import audit
+from app.warm_pool import warm_pool
+from app.provisioning import start_batch
+from app.metrics import RANGES, metrics
+from app.http_cache import ndjson_stream
 from app.auth import get_current_user
 from app.models import User
 
 router = APIRouter()
-proxmox = ProxmoxAPI()
+# Один клиент (и пул соединений) с чтением гостей
+proxmox = guest_service.proxmox
 
 
-@router.get("/", response_model=List[VMResponse])
-async def list_vms(current_user: User = Depends(get_current_user)):
-    """Получить список всех VM."""
+@router.get("/", response_model=VMPage)
+async def list_vms(
+    request: Request,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    status: Optional[str] = Query(None, description="running, stopped, ..."),
+    name: Optional[str] = Query(None, description="Подстрока имени"),
+    node: Optional[str] = None,
+    tag: Optional[str] = None,
+    sort: str = Query("vmid", description="Поле сортировки, '-' в начале — по убыванию"),
+    current_user: User = Depends(get_current_user)
+):
+    """Получить список всех VM (постранично, с фильтрами и сортировкой)."""
     try:
-        vms_data = await proxmox.list_vms("qemu")
-        result = []
-        for vm in vms_data:
-            vmid = vm.get("vmid")
-            config = await proxmox.get_vm_config(vmid, "qemu")
-            ip = await proxmox.get_vm_ip(vmid, "qemu")
-            result.append(VMResponse(
-                vmid=vmid,
-                name=config.get("name", f"vm-{vmid}"),
-                type="qemu",
-                os=config.get("ostype", "unknown"),
-                cpu=config.get("cores", 1),
-                memory=config.get("memory", 512),
-                disk=10,  # Нужно парсить из scsi0/ide0
-                ip=ip,
-                status=vm.get("status", "unknown")
-            ))
-        return result
+        return await guest_service.page(
+            request, "qemu", status=status, name=name, node=node, tag=tag,
+            sort=sort, limit=limit, cursor=cursor
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ProxmoxUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.post("/", response_model=VMResponse)
 async def create_vm(vm: VMCreate, current_user: User = Depends(get_current_user)):
-    """Создать новую VM."""
+    """Создать новую VM.
+
+    Сначала пробуем выдать VM из тёплого пула. Если указан ``template``
+    (или задан QEMU_TEMPLATE_VMID), VM клонируется из cloud-init шаблона
+    и сразу запускается.
+    """
+    template = vm.template or settings.QEMU_TEMPLATE_VMID
     try:
-        vmid = await proxmox.create_vm(
-            name=vm.name,
-            os=vm.os,
-            cpu=vm.cpu,
-            memory=vm.memory,
-            disk=vm.disk
-        )
-        return VMResponse(
-            vmid=vmid,
-            name=vm.name,
-            type="qemu",
-            os=vm.os,
-            cpu=vm.cpu,
-            memory=vm.memory,
-            disk=vm.disk,
-            ip=None,
-            status="created"
-        )
+        async with audit.track("create", current_user.username, "api", type_="qemu", name=vm.name) as event:
+            # Готовая VM из тёплого пула — без клонирования и загрузки
+            member = await warm_pool.claim("qemu", vm.name, vm.cpu, vm.memory, vm.disk, template=template)
+            if member:
+                event.vmid = member.vmid
+                event.detail["pooled"] = True
+                return VMResponse(
+                    vmid=member.vmid,
+                    name=vm.name,
+                    type="qemu",
+                    os=vm.os,
+                    cpu=vm.cpu,
+                    memory=vm.memory,
+                    disk=vm.disk,
+                    ip=member.ip,
+                    status="running",
+                    password=member.password
+                )
+
+            if template:
+                full = settings.QEMU_CLONE_FULL if vm.full_clone is None else vm.full_clone
+                vmid, password = await proxmox.create_vm_from_template(
+                    name=vm.name,
+                    template_vmid=template,
+                    cpu=vm.cpu,
+                    memory=vm.memory,
+                    disk=vm.disk,
+                    full=full,
+                    storage=settings.QEMU_CLONE_STORAGE
+                )
+                event.vmid = vmid
+                await guest_records.save(vmid, name=vm.name, type="qemu", os=vm.os, password=password)
+                inventory.invalidate()
+                return VMResponse(
+                    vmid=vmid,
+                    name=vm.name,
+                    type="qemu",
+                    os=vm.os,
+                    cpu=vm.cpu,
+                    memory=vm.memory,
+                    disk=vm.disk,
+                    ip=None,
+                    status="running",
+                    password=password
+                )
+
+            vmid = await proxmox.create_vm(
+                name=vm.name,
+                os=vm.os,
+                cpu=vm.cpu,
+                memory=vm.memory,
+                disk=vm.disk
+            )
+            event.vmid = vmid
+            await guest_records.save(vmid, name=vm.name, type="qemu", os=vm.os)
+            inventory.invalidate()
+            return VMResponse(
+                vmid=vmid,
+                name=vm.name,
+                type="qemu",
+                os=vm.os,
+                cpu=vm.cpu,
+                memory=vm.memory,
+                disk=vm.disk,
+                ip=None,
+                status="created"
+            )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/batch")
+async def create_vms_batch(spec: VMBatchCreate, current_user: User = Depends(get_current_user)):
+    """Создать ``count`` одинаковых VM; прогресс по каждому — потоком NDJSON."""
+    try:
+        events = start_batch(proxmox, "qemu", spec, actor=current_user.username)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return StreamingResponse(ndjson_stream(events), media_type="application/x-ndjson")
+
+
 @router.get("/{vmid}", response_model=VMResponse)
-async def get_vm(vmid: int, current_user: User = Depends(get_current_user)):
-    """Получить информацию о VM."""
+async def get_vm(
+    vmid: int,
+    request: Request,
+    fields: Optional[str] = Query(None, description="Поля ответа через запятую, например status,ip"),
+    current_user: User = Depends(get_current_user)
+):
+    """Получить информацию о VM.
+
+    С ``fields`` в Proxmox запрашивается только нужное: ``status`` — один
+    запрос статуса, ``os`` — конфигурация, ``ip`` — статус и IP параллельно.
+    """
     try:
-        config = await proxmox.get_vm_config(vmid, "qemu")
-        status_data = await proxmox.get_vm_status(vmid, "qemu")
-        ip = await proxmox.get_vm_ip(vmid, "qemu")
-        return VMResponse(
-            vmid=vmid,
-            name=config.get("name", f"vm-{vmid}"),
-            type="qemu",
-            os=config.get("ostype", "unknown"),
-            cpu=config.get("cores", 1),
-            memory=config.get("memory", 512),
-            disk=10,
-            ip=ip,
-            status=status_data.get("status", "unknown")
-        )
+        return await guest_service.detail(request, vmid, "qemu", fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ProxmoxUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/{vmid}/metrics")
+async def get_vm_metrics(
+    vmid: int,
+    range: str = Query("1h", description=", ".join(RANGES)),
+    current_user: User = Depends(get_current_user)
+):
+    """История нагрузки VM (CPU, память, диск, сеть) из памяти сборщика."""
+    if range not in RANGES:
+        raise HTTPException(status_code=400, detail=f"Unknown range, expected one of: {', '.join(RANGES)}")
+    try:
+        data = await metrics.guest_metrics(vmid, "qemu", RANGES[range])
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    if data is None:
+        raise HTTPException(status_code=404, detail="No metrics for this guest")
+    return {"vmid": vmid, "range": range, **data}
 
 
 @router.post("/{vmid}/start")
 async def start_vm(vmid: int, current_user: User = Depends(get_current_user)):
     """Запустить VM."""
     try:
-        await proxmox.start_vm(vmid, "qemu")
-        return {"status": "started", "vmid": vmid}
+        return await guest_service.power(vmid, "qemu", "start", current_user.username)
+    except GuestBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ProxmoxUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -97,8 +195,11 @@ async def start_vm(vmid: int, current_user: User = Depends(get_current_user)):
 async def stop_vm(vmid: int, current_user: User = Depends(get_current_user)):
     """Остановить VM."""
     try:
-        await proxmox.stop_vm(vmid, "qemu")
-        return {"status": "stopped", "vmid": vmid}
+        return await guest_service.power(vmid, "qemu", "stop", current_user.username)
+    except GuestBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ProxmoxUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -107,8 +208,11 @@ async def stop_vm(vmid: int, current_user: User = Depends(get_current_user)):
 async def shutdown_vm(vmid: int, current_user: User = Depends(get_current_user)):
     """Корректно завершить работу VM (требуется qemu-guest-agent)."""
     try:
-        await proxmox._request("POST", f"/nodes/{proxmox.PROXMOX_NODE}/qemu/{vmid}/status/shutdown")
-        return {"status": "shutting_down", "vmid": vmid}
+        return await guest_service.power(vmid, "qemu", "shutdown", current_user.username)
+    except GuestBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ProxmoxUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -117,7 +221,10 @@ async def shutdown_vm(vmid: int, current_user: User = Depends(get_current_user))
 async def delete_vm(vmid: int, current_user: User = Depends(get_current_user)):
     """Удалить VM."""
     try:
-        await proxmox.delete_vm(vmid, "qemu")
-        return {"status": "deleted", "vmid": vmid}
+        return await guest_service.power(vmid, "qemu", "delete", current_user.username)
+    except GuestBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ProxmoxUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1,5 +1,7 @@
-from pydantic import BaseModel
-from typing import Optional
+from datetime import datetime
+from pydantic import BaseModel, Field
+from typing import List, Optional
+from app.guest import Guest
 
 # VM схемы
 class VMCreate(BaseModel):
@@ -9,6 +11,20 @@ class VMCreate(BaseModel):
     memory: Optional[int] = 2048
     disk: Optional[int] = 10
     type: Optional[str] = "qemu"  # qemu или lxc
+    template: Optional[int] = None  # vmid cloud-init шаблона: создать клонированием
+    full_clone: Optional[bool] = None  # Полный клон вместо связанного
+
+class VMBatchCreate(BaseModel):
+    count: int = Field(..., ge=1, le=100)
+    name_pattern: str = "guest-{n}"  # {n} — номер гостя с 1, можно {n:02d}
+    os: Optional[str] = "ubuntu-22.04"
+    cpu: Optional[int] = 1
+    memory: Optional[int] = 2048
+    disk: Optional[int] = 10
+    template: Optional[int] = None  # vmid cloud-init шаблона (для VM)
+    full_clone: Optional[bool] = None
+    start: bool = True
+    parallelism: Optional[int] = Field(None, ge=1, le=20)  # По умолчанию BATCH_CONCURRENCY
 
 class VMResponse(BaseModel):
     vmid: int
@@ -22,6 +38,72 @@ class VMResponse(BaseModel):
     status: Optional[str]
     password: Optional[str] = None  # Пароль
 
+    @classmethod
+    def from_guest(cls, guest: Guest, **overrides) -> "VMResponse":
+        data = dict(
+            vmid=guest.vmid,
+            name=guest.name,
+            type=guest.type,
+            os=guest.os or "unknown",
+            cpu=guest.cpus,
+            memory=guest.memory_mb,
+            disk=guest.disk_gb,
+            ip=guest.ip,
+            status=guest.status,
+        )
+        data.update(overrides)
+        return cls(**data)
+
+# Поля ответа о госте -> поля Guest, из которых они берутся (для ?fields=)
+RESPONSE_FIELDS = {
+    "vmid": (), "type": (),
+    "name": ("name",), "os": ("os",), "cpu": ("cpus",), "memory": ("maxmem",),
+    "disk": ("maxdisk",), "ip": ("ip",), "status": ("status",),
+}
+
+
+def parse_fields(value: Optional[str]) -> Optional[set[str]]:
+    """Разобрать ``fields=status,ip``; None — все поля.
+
+    Raises:
+        ValueError: неизвестное поле.
+    """
+    if not value:
+        return None
+    selected = {f.strip() for f in value.split(",") if f.strip()}
+    unknown = selected - RESPONSE_FIELDS.keys()
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}; expected: {', '.join(RESPONSE_FIELDS)}")
+    return selected | {"vmid"}
+
+
+def guest_fields(selected: Optional[set[str]]) -> Optional[set[str]]:
+    """Поля Guest для выбранных полей ответа."""
+    if selected is None:
+        return None
+    return {f for name in selected for f in RESPONSE_FIELDS[name]}
+
+class VMPage(BaseModel):
+    items: List[VMResponse]
+    total: int  # Всего гостей, подходящих под фильтры
+    next_cursor: Optional[str] = None  # Курсор следующей страницы
+
+# Журнал действий
+class AuditEventResponse(BaseModel):
+    id: int
+    time: datetime
+    actor: str
+    source: str
+    action: str
+    vmid: Optional[int] = None
+    type: Optional[str] = None
+    status: str
+    detail: Optional[dict] = None
+
+class AuditPage(BaseModel):
+    items: List[AuditEventResponse]
+    next_cursor: Optional[str] = None  # Курсор следующей (более старой) страницы
+
 # Пользователь схемы
 class UserCreate(BaseModel):
     username: str
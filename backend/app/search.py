@@ -0,0 +1,166 @@
+import re
+from bisect import bisect_left, insort
+from dataclasses import dataclass
+from typing import Optional
+
+from app.inventory import InventorySnapshot
+
+_SPLIT_RE = re.compile(r"[\s\-_.:/]+")
+
+
+@dataclass
+class SearchDoc:
+    vmid: int
+    type: str
+    name: str
+    node: Optional[str] = None
+    status: str = "unknown"
+    tags: tuple[str, ...] = ()
+    ip: Optional[str] = None
+
+    def tokens(self) -> set[str]:
+        """Токены для префиксного поиска: vmid, имя целиком и по частям, теги, IP."""
+        name = self.name.lower()
+        tokens = {str(self.vmid), name, *(t for t in _SPLIT_RE.split(name) if t)}
+        tokens.update(tag.lower() for tag in self.tags)
+        if self.ip:
+            tokens.add(self.ip)
+        return tokens
+
+
+def _trigrams(text: str) -> set[str]:
+    padded = f"  {text.lower()} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class GuestSearchIndex:
+    """Индекс гостей для inline-поиска в боте.
+
+    Префиксный поиск — бинарный поиск по отсортированному списку токенов,
+    нечёткий — по триграммам имени. Индекс обновляется инкрементально:
+    ``sync()`` применяет только отличия нового снимка инвентаря.
+    """
+
+    def __init__(self):
+        self.docs: dict[int, SearchDoc] = {}
+        self.version: Optional[int] = None
+        self._tokens: list[tuple[str, int]] = []
+        self._trigrams: dict[str, set[int]] = {}
+
+    def get(self, vmid: int) -> Optional[SearchDoc]:
+        return self.docs.get(vmid)
+
+    # === Обновление ===
+    def _add(self, doc: SearchDoc):
+        self.docs[doc.vmid] = doc
+        for token in doc.tokens():
+            insort(self._tokens, (token, doc.vmid))
+        for tri in _trigrams(doc.name):
+            self._trigrams.setdefault(tri, set()).add(doc.vmid)
+
+    def _remove(self, vmid: int) -> Optional[SearchDoc]:
+        doc = self.docs.pop(vmid, None)
+        if doc is None:
+            return None
+        for token in doc.tokens():
+            i = bisect_left(self._tokens, (token, vmid))
+            if i < len(self._tokens) and self._tokens[i] == (token, vmid):
+                del self._tokens[i]
+        for tri in _trigrams(doc.name):
+            vmids = self._trigrams.get(tri)
+            if vmids is not None:
+                vmids.discard(vmid)
+                if not vmids:
+                    del self._trigrams[tri]
+        return doc
+
+    def sync(self, snapshot: InventorySnapshot) -> list[int]:
+        """Применить снимок инвентаря. Возвращает vmid, чей IP надо перечитать."""
+        if snapshot.version == self.version:
+            return []
+
+        stale_ips = []
+        # Первое заполнение — одной сортировкой вместо вставок по одному
+        bulk = not self.docs
+        for vmid in set(self.docs) - set(snapshot.by_vmid):
+            self._remove(vmid)
+
+        for vmid, guest in snapshot.by_vmid.items():
+            old = self.docs.get(vmid)
+            if old and (old.name, old.status, old.tags, old.node) == (guest.name, guest.status, guest.tags, guest.node):
+                continue
+
+            doc = SearchDoc(
+                vmid=vmid,
+                type=guest.type,
+                name=guest.name,
+                node=guest.node,
+                status=guest.status,
+                tags=guest.tags,
+                # IP известен только пока гость работает
+                ip=old.ip if old and guest.running else None,
+            )
+            if old:
+                self._remove(vmid)
+            if bulk:
+                self.docs[vmid] = doc
+                self._tokens.extend((token, vmid) for token in doc.tokens())
+                for tri in _trigrams(doc.name):
+                    self._trigrams.setdefault(tri, set()).add(vmid)
+            else:
+                self._add(doc)
+            if guest.running and (old is None or old.status != "running"):
+                stale_ips.append(vmid)
+
+        if bulk:
+            self._tokens.sort()
+        self.version = snapshot.version
+        return stale_ips
+
+    def set_ip(self, vmid: int, ip: Optional[str]):
+        doc = self.docs.get(vmid)
+        if doc is None or doc.ip == ip:
+            return
+        self._remove(vmid)
+        doc.ip = ip
+        self._add(doc)
+
+    # === Поиск ===
+    def search(self, query: str, limit: int = 20) -> list[SearchDoc]:
+        """Найти гостей: точное совпадение > префикс > подстрока > похожее имя."""
+        query = query.strip().lower()
+        if not query:
+            return sorted(self.docs.values(), key=lambda d: d.vmid)[:limit]
+
+        scores: dict[int, float] = {}
+
+        def score(vmid: int, value: float):
+            if value > scores.get(vmid, 0):
+                scores[vmid] = value
+
+        i = bisect_left(self._tokens, (query, -1))
+        while i < len(self._tokens) and self._tokens[i][0].startswith(query):
+            token, vmid = self._tokens[i]
+            score(vmid, 100 if token == query else 80 - min(len(token) - len(query), 20))
+            i += 1
+
+        # Подстрока в имени, если префиксов мало
+        if len(scores) < limit:
+            for vmid, doc in self.docs.items():
+                if vmid not in scores and query in doc.name.lower():
+                    score(vmid, 50)
+
+        # Нечёткое совпадение по триграммам (опечатки, пропущенные символы)
+        if len(scores) < limit and len(query) >= 3:
+            query_tris = _trigrams(query)
+            hits: dict[int, int] = {}
+            for tri in query_tris:
+                for vmid in self._trigrams.get(tri, ()):
+                    hits[vmid] = hits.get(vmid, 0) + 1
+            for vmid, count in hits.items():
+                similarity = count / max(len(query_tris), len(_trigrams(self.docs[vmid].name)))
+                if similarity >= 0.3:
+                    score(vmid, 40 * similarity)
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return [self.docs[vmid] for vmid, _ in ranked[:limit]]
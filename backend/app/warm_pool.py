@@ -0,0 +1,389 @@
+import asyncio
+import itertools
+import logging
+import re
+import time
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from typing import Optional, Union
+
+from app.config import settings
+from app.guest_records import guest_records
+from app.inventory import inventory
+from app.proxmox import ProxmoxAPI
+
+logger = logging.getLogger(__name__)
+
+# Статус строки в таблице vms, пока гость ждёт в пуле
+POOL_STATUS = "pooled"
+# ...и пока его выдаёт один из воркеров
+CLAIM_STATUS = "claiming"
+TAG_PREFIX = "warmpool-"
+
+
+@dataclass(frozen=True)
+class PoolProfile:
+    """Профиль пула: каких гостей и сколько держать наготове.
+
+    ``template`` — vmid cloud-init шаблона для qemu или ostemplate для lxc.
+    ``booted`` — держать гостей запущенными (выдача без ожидания загрузки).
+    """
+
+    name: str
+    type: str = "qemu"
+    template: Union[int, str, None] = None
+    cpu: int = 1
+    memory: int = 2048
+    disk: int = 10
+    size: int = 1
+    ttl: float = 86400.0
+    booted: bool = False
+
+    @property
+    def slug(self) -> str:
+        return re.sub(r"[^a-z0-9-]+", "-", self.name.lower()).strip("-")
+
+    @property
+    def tag(self) -> str:
+        """Тег Proxmox, по которому гости пула находятся после перезапуска."""
+        return TAG_PREFIX + self.slug
+
+    def matches(self, type_: str, template, cpu: int, memory: int, disk: int) -> bool:
+        return (self.type, str(self.template), self.cpu, self.memory, self.disk) == (
+            type_, str(template), cpu, memory, disk
+        )
+
+
+@dataclass
+class PoolMember:
+    vmid: int
+    name: str
+    password: str
+    created_at: float = field(default_factory=time.time)
+    ip: Optional[str] = None
+
+
+@dataclass
+class PoolStats:
+    hits: int = 0
+    misses: int = 0
+    created: int = 0
+    expired: int = 0
+    failed: int = 0
+
+
+def load_profiles(raw: list[dict]) -> list[PoolProfile]:
+    """Разобрать профили из настроек, пропуская некорректные."""
+    profiles = []
+    for item in raw:
+        try:
+            profile = PoolProfile(**item)
+        except TypeError as e:
+            logger.error(f"Invalid warm pool profile {item}: {e}")
+            continue
+        if profile.type == "qemu" and profile.template is None:
+            logger.error(f"Warm pool profile {profile.name}: qemu profile needs a template vmid")
+            continue
+        profiles.append(profile)
+    return profiles
+
+
+class WarmPool:
+    """Пул заранее созданных гостей для мгновенной выдачи на ``POST /vms`` и ``POST /lxc``.
+
+    Гость из пула переименовывается, теряет тег пула и (если хранился
+    остановленным) запускается; пул пополняется в фоне. Гости старше ``ttl``
+    пересоздаются, чтобы не выдавать устаревший образ.
+
+    Пополняет пул и держит готовых гостей в памяти только ведущий воркер
+    (``start``/``stop`` вызывает app/leader.py); остальные выдают гостей,
+    найденных по тегу в снимке инвентаря. Чтобы один гость не достался двоим,
+    выдача сначала переводит его запись в БД из ``pooled`` в ``claiming``.
+    Гость выдаётся как есть: профиль должен совпасть с запросом точно, размер
+    гостя под запрос не меняется.
+    """
+
+    def __init__(
+        self,
+        proxmox: ProxmoxAPI,
+        profiles: list[PoolProfile],
+        concurrency: int = 2,
+        interval: float = 30.0,
+    ):
+        self.proxmox = proxmox
+        self.profiles = {profile.name: profile for profile in profiles}
+        self.members: dict[str, deque[PoolMember]] = {name: deque() for name in self.profiles}
+        self.stats: dict[str, PoolStats] = {name: PoolStats() for name in self.profiles}
+        # Запросы, под параметры которых нет ни одного профиля
+        self.unmatched = 0
+        self.interval = interval
+        self._limit = asyncio.Semaphore(concurrency)
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._background: set[asyncio.Task] = set()
+        self._seq = itertools.count(1)
+
+    def find_profile(self, type_: str, template, cpu: int, memory: int, disk: int) -> Optional[PoolProfile]:
+        for profile in self.profiles.values():
+            if profile.matches(type_, template, cpu, memory, disk):
+                return profile
+        return None
+
+    def wake(self):
+        """Попросить фоновую задачу пополнить пул сейчас, не дожидаясь интервала."""
+        self._wakeup.set()
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    # === Выдача ===
+    async def claim(
+        self,
+        type_: str,
+        name: str,
+        cpu: int,
+        memory: int,
+        disk: int,
+        template=None,
+    ) -> Optional[PoolMember]:
+        """Выдать готового гостя под новым именем.
+
+        Подходит только профиль с теми же ``type``, ``template``, ``cpu``,
+        ``memory`` и ``disk``. None — такого профиля нет, пул пуст или гостя
+        не удалось перенастроить; тогда вызывающий создаёт гостя обычным путём.
+        """
+        profile = self.find_profile(type_, template, cpu, memory, disk)
+        if profile is None:
+            self.unmatched += 1
+            return None
+
+        stats = self.stats[profile.name]
+        members = self.members[profile.name]
+        now = time.time()
+        member = None
+        while members and member is None:
+            candidate = members.popleft()
+            if now - candidate.created_at >= profile.ttl:
+                stats.expired += 1
+                self._spawn(self._destroy(profile.type, candidate.vmid))
+            elif await self._take(candidate):
+                member = candidate
+        if member is None and self._task is None:
+            # Не ведущий: своих гостей в памяти нет, берём общих
+            for candidate in await self._shared_members(profile):
+                if await self._take(candidate):
+                    member = candidate
+                    break
+        self.wake()
+        if member is None:
+            stats.misses += 1
+            return None
+
+        try:
+            name_key = "hostname" if profile.type == "lxc" else "name"
+            await self.proxmox.update_config(member.vmid, profile.type, {name_key: name, "delete": "tags"})
+            if profile.booted:
+                member.ip = await self.proxmox.get_vm_ip(member.vmid, profile.type, timeout=1)
+            else:
+                await self.proxmox.wait_task(await self.proxmox.start_vm(member.vmid, profile.type))
+        except Exception as e:
+            logger.error(f"Failed to hand out pooled guest {member.vmid}: {e}")
+            stats.failed += 1
+            stats.misses += 1
+            self._spawn(self._destroy(profile.type, member.vmid, CLAIM_STATUS))
+            return None
+
+        stats.hits += 1
+        member.name = name
+        await self._save(profile, member, "running")
+        inventory.invalidate()
+        logger.info(f"Warm pool {profile.name}: handed out {profile.type} {member.vmid} as {name}")
+        return member
+
+    async def _take(self, member: PoolMember) -> bool:
+        """Забрать гостя из пула в БД; False — его уже забрал другой воркер."""
+        try:
+            return await guest_records.take(member.vmid, POOL_STATUS, CLAIM_STATUS) is not None
+        except Exception as e:
+            logger.error(f"Warm pool: failed to claim guest {member.vmid}: {e}")
+            return False
+
+    async def _shared_members(self, profile: PoolProfile) -> list[PoolMember]:
+        """Готовые гости профиля по тегу в снимке инвентаря и паролям в БД.
+
+        Возраст гостя тут неизвестен: просроченных убирает ведущий при пополнении.
+        """
+        try:
+            snapshot = await inventory.snapshot()
+            rows = await guest_records.with_status(POOL_STATUS)
+        except Exception as e:
+            logger.error(f"Warm pool {profile.name}: failed to list pooled guests: {e}")
+            return []
+        return [
+            PoolMember(vmid=guest.vmid, name=guest.name, password=rows[guest.vmid].password)
+            for guest in snapshot.guests(profile.type)
+            if profile.tag in guest.tags and guest.vmid in rows and rows[guest.vmid].password
+        ]
+
+    # === Пополнение ===
+    async def _create(self, profile: PoolProfile):
+        name = f"pool-{profile.slug}-{next(self._seq)}"
+        async with self._limit:
+            try:
+                if profile.type == "qemu":
+                    vmid, password = await self.proxmox.create_vm_from_template(
+                        name=name,
+                        template_vmid=int(profile.template),
+                        cpu=profile.cpu,
+                        memory=profile.memory,
+                        disk=profile.disk,
+                        full=settings.QEMU_CLONE_FULL,
+                        storage=settings.QEMU_CLONE_STORAGE,
+                        start=profile.booted,
+                        tags=profile.tag
+                    )
+                else:
+                    vmid, password = await self.proxmox.create_lxc(
+                        hostname=name,
+                        ostemplate=str(profile.template or "ubuntu-22.04"),
+                        cpu=profile.cpu,
+                        memory=profile.memory,
+                        disk=profile.disk,
+                        tags=profile.tag,
+                        wait=True
+                    )
+                    if profile.booted:
+                        await self.proxmox.wait_task(await self.proxmox.start_vm(vmid, "lxc"))
+            except Exception as e:
+                logger.error(f"Warm pool {profile.name}: failed to create guest: {e}")
+                self.stats[profile.name].failed += 1
+                return
+
+        member = PoolMember(vmid=vmid, name=name, password=password)
+        if not await self._save(profile, member, POOL_STATUS):
+            # Без записи в БД гостя не выдать: выдача идёт через её статус
+            self.stats[profile.name].failed += 1
+            await self._destroy(profile.type, vmid)
+            return
+        self.members[profile.name].append(member)
+        self.stats[profile.name].created += 1
+        inventory.invalidate()
+
+    async def _destroy(self, type_: str, vmid: int, status: str = POOL_STATUS):
+        try:
+            status = await self.proxmox.get_vm_status(vmid, type_)
+            if status.get("status") == "running":
+                await self.proxmox.wait_task(await self.proxmox.stop_vm(vmid, type_))
+            await self.proxmox.delete_vm(vmid, type_)
+        except Exception as e:
+            logger.error(f"Warm pool: failed to remove guest {vmid}: {e}")
+        await self._forget(vmid, status)
+        inventory.invalidate()
+
+    async def refill(self):
+        """Один проход: убрать просроченных гостей и досоздать недостающих."""
+        jobs = []
+        now = time.time()
+        try:
+            pooled = await guest_records.with_status(POOL_STATUS)
+        except Exception as e:
+            logger.error(f"Warm pool: failed to load pooled guests: {e}")
+            pooled = None
+        for name, profile in self.profiles.items():
+            members = self.members[name]
+            if pooled is not None:
+                # Гостей, выданных другими воркерами, в пуле больше нет
+                for member in [m for m in members if m.vmid not in pooled]:
+                    members.remove(member)
+            for member in [m for m in members if now - m.created_at >= profile.ttl]:
+                members.remove(member)
+                self.stats[name].expired += 1
+                jobs.append(self._destroy(profile.type, member.vmid))
+            jobs.extend(self._create(profile) for _ in range(profile.size - len(members)))
+        if jobs:
+            await asyncio.gather(*jobs)
+
+    async def reconcile(self):
+        """Восстановить пул после перезапуска по тегам гостей и паролям в БД."""
+        try:
+            snapshot = await inventory.snapshot()
+            rows = await guest_records.with_status(POOL_STATUS)
+        except Exception as e:
+            logger.error(f"Warm pool: failed to reconcile: {e}")
+            return
+
+        for name, profile in self.profiles.items():
+            for guest in snapshot.guests(profile.type):
+                if profile.tag not in guest.tags:
+                    continue
+                row = rows.pop(guest.vmid, None)
+                if row is None or not row.password:
+                    # Пароль неизвестен — выдать такого гостя нельзя
+                    self._spawn(self._destroy(profile.type, guest.vmid))
+                    continue
+                self.members[name].append(PoolMember(vmid=guest.vmid, name=guest.name, password=row.password))
+        for vmid in rows:
+            await self._forget(vmid)
+
+    async def _run(self):
+        await self.reconcile()
+        while True:
+            try:
+                await self.refill()
+            except Exception as e:
+                logger.error(f"Warm pool refill failed: {e}")
+            # asyncio.timeout, а не wait_for: тот может проглотить отмену,
+            # если событие сработало одновременно с ней
+            try:
+                async with asyncio.timeout(self.interval):
+                    await self._wakeup.wait()
+            except TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def start(self):
+        if self.profiles and self._task is None:
+            logger.info(f"Starting warm pool: {', '.join(self.profiles)}")
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        tasks = [t for t in (self._task, *self._background) if t is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+
+    # === БД ===
+    async def _save(self, profile: PoolProfile, member: PoolMember, status: str) -> bool:
+        return await guest_records.save(
+            member.vmid, name=member.name, type=profile.type, os=str(profile.template),
+            ip=member.ip, status=status, password=member.password,
+        )
+
+    async def _forget(self, vmid: int, status: str = POOL_STATUS):
+        await guest_records.delete(vmid, status=status)
+
+    # === Метрики ===
+    def status(self) -> list[dict]:
+        result = []
+        for name, profile in self.profiles.items():
+            stats = self.stats[name]
+            requests = stats.hits + stats.misses
+            result.append({
+                "profile": asdict(profile),
+                "ready": len(self.members[name]),
+                "ready_vmids": [m.vmid for m in self.members[name]],
+                **asdict(stats),
+                "hit_rate": round(stats.hits / requests, 3) if requests else None,
+            })
+        return result
+
+
+warm_pool = WarmPool(
+    ProxmoxAPI(),
+    load_profiles(settings.WARM_POOL_PROFILES),
+    concurrency=settings.WARM_POOL_CONCURRENCY,
+    interval=settings.WARM_POOL_INTERVAL,
+)
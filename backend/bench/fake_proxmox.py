@@ -0,0 +1,394 @@
+"""Локальная заглушка Proxmox VE API для нагрузочных тестов и бенчмарков.
+
+Подключается к ``ProxmoxAPI`` как транспорт httpx и отвечает на те же
+эндпоинты, что использует приложение, храня состояние кластера в памяти.
+"""
+import asyncio
+import contextvars
+import hashlib
+import json
+import random
+import re
+import time
+from collections import Counter
+from typing import Optional
+
+import httpx
+
+# Метка текущего взаимодействия — по ней считаются вызовы Proxmox
+current_interaction: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar(
+    "current_interaction", default=None
+)
+
+_GUEST_RE = re.compile(r"^/nodes/(?P<node>[^/]+)/(?P<type>qemu|lxc)/(?P<vmid>\d+)(?P<rest>/.*)?$")
+_LIST_RE = re.compile(r"^/nodes/(?P<node>[^/]+)/(?P<type>qemu|lxc)$")
+_STORAGE_RE = re.compile(r"^/nodes/(?P<node>[^/]+)/storage/(?P<storage>[^/]+)/content$")
+_TASK_RE = re.compile(r"^/nodes/(?P<node>[^/]+)/tasks/(?P<upid>[^/]+)/status$")
+_NODE_RRD_RE = re.compile(r"^/nodes/(?P<node>[^/]+)/rrddata$")
+# Сколько последних задач отдаёт /cluster/tasks
+TASK_LOG_SIZE = 200
+
+
+class FakeProxmox(httpx.AsyncBaseTransport):
+    """In-memory кластер Proxmox с имитацией сетевой задержки."""
+
+    def __init__(
+        self,
+        qemu: int = 50,
+        lxc: int = 50,
+        nodes: tuple[str, ...] = ("pve",),
+        latency: float = 0.005,
+        seed: int = 42,
+        templates: int = 0,
+        clone_delay: float = 0.0,
+        full_clone_delay_per_gb: float = 0.0,
+        boot_delay: float = 0.0,
+    ):
+        self.latency = latency
+        self.nodes = nodes
+        # Длительность задач: связанный клон, полный клон (на ГБ), загрузка ОС до ответа агента
+        self.clone_delay = clone_delay
+        self.full_clone_delay_per_gb = full_clone_delay_per_gb
+        self.boot_delay = boot_delay
+        self.guests: dict[int, dict] = {}
+        # UPID -> (время завершения, exitstatus)
+        self.tasks: dict[str, tuple[float, str]] = {}
+        self.calls: Counter = Counter()
+        self.calls_by_interaction: Counter = Counter()
+        self._rng = random.Random(seed)
+        self._upid = 0
+
+        vmid = 100
+        for type_, count in (("qemu", qemu), ("lxc", lxc)):
+            for i in range(count):
+                self._add_guest(vmid, type_, name=f"{'vm' if type_ == 'qemu' else 'ct'}-{i:04d}")
+                vmid += 1
+        # Cloud-init шаблоны — с vmid 9000, как принято в Proxmox
+        for i in range(templates):
+            self._add_guest(
+                9000 + i, "qemu", name=f"tmpl-cloud-{i}", status="stopped", started=None,
+                template=1, cloudinit=True, disk=3, tags="",
+            )
+
+    # === Состояние кластера ===
+    def _add_guest(self, vmid: int, type_: str, name: str, **overrides) -> dict:
+        running = self._rng.random() < 0.7
+        guest = {
+            "vmid": vmid,
+            "type": type_,
+            "name": name,
+            "node": self.nodes[vmid % len(self.nodes)],
+            "status": "running" if running else "stopped",
+            "cores": self._rng.choice((1, 2, 4)),
+            "memory": self._rng.choice((512, 1024, 2048, 4096)),
+            "disk": self._rng.choice((4, 10, 20)),
+            "tags": self._rng.choice(("", "web", "db", "web;prod")),
+            "ip": f"10.0.{vmid // 250}.{vmid % 250 + 1}",
+            "template": 0,
+            "started": time.time() - self._rng.randint(60, 86400 * 7) if running else None,
+            "booted": 0.0,
+            "cloudinit": False,
+        }
+        guest.update(overrides)
+        self.guests[vmid] = guest
+        return guest
+
+    def _next_upid(self, action: str, vmid: int, duration: float = 0.0) -> str:
+        self._upid += 1
+        upid = f"UPID:pve:{self._upid:08X}:00000000:{int(time.time()):08X}:{action}:{vmid}:root@pam!bot:"
+        self.tasks[upid] = (time.time() + duration, "OK")
+        return upid
+
+    def _uptime(self, guest: dict) -> int:
+        return int(time.time() - guest["started"]) if guest["status"] == "running" else 0
+
+    # === Транспорт ===
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.calls[request.method] += 1
+        self.calls_by_interaction[current_interaction.get()] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        path = request.url.path.split("/api2/json", 1)[-1]
+        body = json.loads(request.content) if request.content else {}
+        try:
+            status, data = self._route(request.method, path, dict(request.url.params), body)
+        except KeyError:
+            status, data = 500, None
+        return httpx.Response(status, json={"data": data}, request=request)
+
+    def _route(self, method: str, path: str, params: dict, body: dict) -> tuple[int, object]:
+        if path == "/cluster/nextid":
+            # Как и Proxmox — наименьший свободный vmid
+            vmid = 100
+            while vmid in self.guests:
+                vmid += 1
+            return 200, str(vmid)
+
+        if path == "/cluster/tasks":
+            # Как и Proxmox — последние задачи кластера, свежие первыми
+            return 200, [self._task_item(upid) for upid in reversed(list(self.tasks)[-TASK_LOG_SIZE:])]
+
+        if path == "/cluster/resources":
+            guests = [self._resource(g) for g in self.guests.values()]
+            if params.get("type") == "vm":
+                return 200, guests
+            return 200, guests + self._node_resources()
+
+        m = _LIST_RE.match(path)
+        if m:
+            if method == "POST":
+                return self._create(m["type"], body)
+            return 200, [
+                self._list_item(g) for g in self.guests.values()
+                if g["type"] == m["type"] and g["node"] == m["node"]
+            ]
+
+        m = _STORAGE_RE.match(path)
+        if m:
+            storage = m["storage"]
+            return 200, [
+                {"volid": f"{storage}:iso/ubuntu-22.04-live-server-amd64.iso", "content": "iso", "size": 2 << 30},
+                {"volid": f"{storage}:iso/debian-12.5.0-amd64-netinst.iso", "content": "iso", "size": 600 << 20},
+                {"volid": f"{storage}:vztmpl/ubuntu-22.04-standard_22.04-1_amd64.tar.zst", "content": "vztmpl", "size": 130 << 20},
+                {"volid": f"{storage}:vztmpl/debian-12-standard_12.2-1_amd64.tar.zst", "content": "vztmpl", "size": 120 << 20},
+            ]
+
+        m = _TASK_RE.match(path)
+        if m:
+            finish, exitstatus = self.tasks[m["upid"]]
+            if time.time() < finish:
+                return 200, {"upid": m["upid"], "status": "running"}
+            return 200, {"upid": m["upid"], "status": "stopped", "exitstatus": exitstatus}
+
+        m = _NODE_RRD_RE.match(path)
+        if m:
+            return 200, self._rrddata(None)
+
+        m = _GUEST_RE.match(path)
+        if m:
+            return self._guest(method, m["type"], int(m["vmid"]), m["rest"] or "", body)
+
+        return 501, None
+
+    def _create(self, type_: str, body: dict) -> tuple[int, object]:
+        vmid = int(body["vmid"])
+        if vmid in self.guests:
+            return 500, None
+        name = body.get("name") or body.get("hostname") or f"guest-{vmid}"
+        self._add_guest(
+            vmid, type_, name=name,
+            status="stopped", started=None,
+            cores=int(body.get("cores", 1)), memory=int(body.get("memory", 512)), tags=body.get("tags", ""),
+        )
+        return 200, self._next_upid(f"{type_}create", vmid)
+
+    def _guest(self, method: str, type_: str, vmid: int, rest: str, body: dict) -> tuple[int, object]:
+        guest = self.guests.get(vmid)
+        if guest is None or guest["type"] != type_:
+            return 500, None
+
+        if method == "DELETE" and not rest:
+            del self.guests[vmid]
+            return 200, self._next_upid(f"{type_}destroy", vmid)
+
+        if rest == "/config":
+            if method == "PUT":
+                guest["cores"] = int(body.get("cores", guest["cores"]))
+                guest["memory"] = int(body.get("memory", guest["memory"]))
+                guest["name"] = body.get("name") or body.get("hostname") or guest["name"]
+                guest["tags"] = body.get("tags", guest["tags"])
+                if "tags" in str(body.get("delete", "")).split(","):
+                    guest["tags"] = ""
+                guest["cloudinit"] = guest["cloudinit"] or "cloudinit" in str(body.get("ide0", ""))
+                return 200, None
+            return 200, self._config(guest)
+
+        if rest == "/clone" and method == "POST":
+            newid = int(body["newid"])
+            if newid in self.guests:
+                return 500, None
+            self._add_guest(
+                newid, "qemu", name=body.get("name") or f"clone-{newid}",
+                status="stopped", started=None, tags="",
+                cores=guest["cores"], memory=guest["memory"], disk=guest["disk"],
+                cloudinit=guest["cloudinit"],
+            )
+            duration = (
+                self.full_clone_delay_per_gb * guest["disk"] if int(body.get("full", 0)) else self.clone_delay
+            )
+            return 200, self._next_upid("qmclone", vmid, duration)
+
+        if rest == "/resize" and method == "PUT":
+            guest["disk"] = max(guest["disk"], int(str(body["size"]).rstrip("G")))
+            return 200, self._next_upid("resize", vmid)
+
+        if rest == "/status/current":
+            return 200, {
+                "vmid": vmid,
+                "name": guest["name"],
+                "status": guest["status"],
+                "uptime": self._uptime(guest),
+                "cpus": guest["cores"],
+                "cpu": self._rng.random() * 0.3 if guest["status"] == "running" else 0,
+                "maxmem": guest["memory"] << 20,
+                "mem": int((guest["memory"] << 20) * 0.4) if guest["status"] == "running" else 0,
+                "maxdisk": guest["disk"] << 30,
+                "disk": int((guest["disk"] << 30) * 0.3),
+            }
+
+        if rest.startswith("/status/") and method == "POST":
+            action = rest.rsplit("/", 1)[-1]
+            if action in ("start", "reboot"):
+                guest["status"] = "running"
+                guest["started"] = time.time()
+                guest["booted"] = time.time() + self.boot_delay
+            elif action in ("stop", "shutdown"):
+                guest["status"] = "stopped"
+                guest["started"] = None
+            return 200, self._next_upid(f"{type_}{action}", vmid)
+
+        if rest == "/interfaces":
+            if guest["status"] != "running":
+                return 200, [{"name": "lo", "inet": "127.0.0.1/8"}]
+            return 200, [
+                {"name": "lo", "inet": "127.0.0.1/8"},
+                {"name": "eth0", "inet": f"{guest['ip']}/24"},
+            ]
+
+        if rest == "/agent/network-get-interfaces":
+            # Агент отвечает только после загрузки ОС
+            if guest["status"] != "running" or time.time() < guest["booted"]:
+                return 500, None
+            return 200, {"result": [
+                {"name": "lo", "ip-addresses": [{"ip-address-type": "ipv4", "ip-address": "127.0.0.1"}]},
+                {"name": "eth0", "ip-addresses": [{"ip-address-type": "ipv4", "ip-address": guest["ip"]}]},
+            ]}
+
+        if rest == "/agent/ping" and method == "POST":
+            if guest["status"] != "running" or time.time() < guest["booted"]:
+                return 500, None
+            return 200, None
+
+        if rest == "/rrddata":
+            return 200, self._rrddata(guest)
+
+        return 501, None
+
+    # === Представления ===
+    def _rrddata(self, guest: Optional[dict], points: int = 70) -> list:
+        """Последний час RRD с шагом 60 с (как ``timeframe=hour``)."""
+        now = int(time.time()) // 60 * 60
+        maxmem = (guest["memory"] << 20) if guest else 64 << 30
+        maxdisk = (guest["disk"] << 30) if guest else 1 << 40
+        running = guest is None or guest["status"] == "running"
+        rows = []
+        for i in range(points):
+            row = {"time": now - (points - 1 - i) * 60, "maxmem": maxmem, "maxdisk": maxdisk}
+            if running:
+                row.update({
+                    "cpu": self._rng.random() * 0.3,
+                    "mem": maxmem * (0.3 + self._rng.random() * 0.2),
+                    "disk": maxdisk * 0.3,
+                    "netin": self._rng.random() * 1e5,
+                    "netout": self._rng.random() * 5e4,
+                    "diskread": self._rng.random() * 1e6,
+                    "diskwrite": self._rng.random() * 5e5,
+                })
+            rows.append(row)
+        return rows
+
+    def _task_item(self, upid: str) -> dict:
+        _, node, _, _, start, type_, id_, user, _ = upid.split(":")
+        finish, exitstatus = self.tasks[upid]
+        item = {"upid": upid, "node": node, "type": type_, "id": id_, "user": user, "starttime": int(start, 16)}
+        if time.time() >= finish:
+            item.update(endtime=int(finish), status=exitstatus)
+        return item
+
+    def _config(self, guest: dict) -> dict:
+        config = self._config_fields(guest)
+        # Как и Proxmox — SHA1 содержимого конфигурации
+        config["digest"] = hashlib.sha1(json.dumps(config, sort_keys=True).encode()).hexdigest()
+        return config
+
+    def _config_fields(self, guest: dict) -> dict:
+        if guest["type"] == "lxc":
+            return {
+                "hostname": guest["name"],
+                "ostemplate": "local:vztmpl/ubuntu-22.04-standard_22.04-1_amd64.tar.zst",
+                "cores": guest["cores"],
+                "memory": guest["memory"],
+                "rootfs": f"local-lvm:vm-{guest['vmid']}-disk-0,size={guest['disk']}G",
+                "net0": "name=eth0,bridge=vmbr0,ip=dhcp",
+                "tags": guest["tags"],
+            }
+        return {
+            "name": guest["name"],
+            "ostype": "l26",
+            "cores": guest["cores"],
+            "memory": str(guest["memory"]),
+            "scsi0": f"local-lvm:vm-{guest['vmid']}-disk-0,size={guest['disk']}G",
+            "net0": "virtio=BC:24:11:00:00:01,bridge=vmbr0",
+            "agent": "1",
+            "tags": guest["tags"],
+            **({"ide2": f"local-lvm:vm-{guest['vmid']}-cloudinit,media=cdrom"} if guest["cloudinit"] else {}),
+        }
+
+    def _list_item(self, guest: dict) -> dict:
+        item = {
+            "vmid": guest["vmid"],
+            "name": guest["name"],
+            "status": guest["status"],
+            "uptime": self._uptime(guest),
+            "cpus": guest["cores"],
+            "maxmem": guest["memory"] << 20,
+            "maxdisk": guest["disk"] << 30,
+            "tags": guest["tags"],
+        }
+        if guest["type"] == "lxc":
+            item["type"] = "lxc"
+        return item
+
+    def _node_resources(self) -> list[dict]:
+        """Ноды и хранилища: у каждой ноды local (ISO, шаблоны) и local-lvm (диски гостей)."""
+        items = []
+        for node in self.nodes:
+            running = [g for g in self.guests.values() if g["node"] == node and g["status"] == "running"]
+            items.append({
+                "id": f"node/{node}", "type": "node", "node": node, "status": "online",
+                "maxcpu": 32, "cpu": min(1.0, 0.05 * sum(g["cores"] for g in running) / 32),
+                "maxmem": 128 << 30, "mem": min(128 << 30, sum(int((g["memory"] << 20) * 0.4) for g in running)),
+                "maxdisk": 100 << 30, "disk": 20 << 30, "uptime": 86400,
+            })
+            used = sum(int((g["disk"] << 30) * 0.3) for g in self.guests.values() if g["node"] == node)
+            items.append({
+                "id": f"storage/{node}/local", "type": "storage", "node": node, "storage": "local",
+                "status": "available", "content": "iso,vztmpl,backup", "shared": 0,
+                "maxdisk": 100 << 30, "disk": 30 << 30,
+            })
+            items.append({
+                "id": f"storage/{node}/local-lvm", "type": "storage", "node": node, "storage": "local-lvm",
+                "status": "available", "content": "images,rootdir", "shared": 0,
+                "maxdisk": 4 << 40, "disk": used,
+            })
+        return items
+
+    def _resource(self, guest: dict) -> dict:
+        return {
+            "id": f"{guest['type']}/{guest['vmid']}",
+            "type": guest["type"],
+            "vmid": guest["vmid"],
+            "name": guest["name"],
+            "node": guest["node"],
+            "status": guest["status"],
+            "template": guest["template"],
+            "tags": guest["tags"],
+            "uptime": self._uptime(guest),
+            "maxcpu": guest["cores"],
+            "maxmem": guest["memory"] << 20,
+            "maxdisk": guest["disk"] << 30,
+            "mem": int((guest["memory"] << 20) * 0.4) if guest["status"] == "running" else 0,
+            "disk": int((guest["disk"] << 30) * 0.3),
+            "cpu": 0.05 if guest["status"] == "running" else 0,
+        }
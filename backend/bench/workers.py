@@ -0,0 +1,171 @@
+"""Бенчмарк пропускной способности API в зависимости от числа воркеров uvicorn.
+
+Для каждого числа воркеров поднимает ``uvicorn bench.api_app:app`` на
+заглушке Proxmox, ``--clients`` клиентов ``--duration`` секунд читают
+страницы ``/guests`` (разные фильтры и сортировки) и карточки
+``/guests/{vmid}?fields=status``. Печатает запросы в секунду, задержки и
+сколько запросов к Proxmox сделали все воркеры вместе (``cluster`` — из них
+опросы всего кластера: ``/cluster/resources`` и журнал задач).
+
+С ``--redis`` воркеры работают в общем режиме (``INVENTORY_SHARED``): кластер
+опрашивает один ведущий, и опросы кластера не растут с числом
+воркеров. Без него каждый воркер опрашивает кластер сам — для сравнения.
+Клиенты работают в этом же процессе: на машине с малым числом ядер они
+конкурируют с воркерами за CPU, поэтому масштабирование видно, когда ядер
+больше, чем воркеров.
+
+Запуск из каталога backend::
+
+    python -m bench.workers --workers 1 2 4 --redis redis://localhost:6379/15
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from bench.bot_load import _percentile
+
+SORTS = ("vmid", "-vmid", "name", "-memory", "status", "node")
+STATUSES = (None, "running", "stopped")
+TYPES = (None, "qemu", "lxc")
+
+
+async def _wait_ready(client: httpx.AsyncClient, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get("/health")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("API не запустился")
+
+
+async def _load(base: str, args: argparse.Namespace, vmids: list[int]) -> tuple[int, int, list[float]]:
+    """Прогнать нагрузку; вернуть (успешных, ошибок, задержки в мс)."""
+    rng = random.Random(args.seed)
+    latencies: list[float] = []
+    errors = 0
+    deadline = time.monotonic() + args.duration
+    limits = httpx.Limits(max_connections=args.clients, max_keepalive_connections=args.clients)
+
+    async with httpx.AsyncClient(base_url=base, limits=limits, timeout=30) as client:
+        async def one_client():
+            nonlocal errors
+            while time.monotonic() < deadline:
+                if rng.random() < args.detail_share:
+                    url, params = f"/guests/{rng.choice(vmids)}", {"fields": "status"}
+                else:
+                    params = {"limit": 50, "sort": rng.choice(SORTS)}
+                    for key, values in (("status", STATUSES), ("type", TYPES)):
+                        value = rng.choice(values)
+                        if value:
+                            params[key] = value
+                    url = "/guests/"
+                started = time.perf_counter()
+                try:
+                    response = await client.get(url, params=params)
+                    response.raise_for_status()
+                    latencies.append((time.perf_counter() - started) * 1000)
+                except httpx.HTTPError:
+                    errors += 1
+
+        await asyncio.gather(*(one_client() for _ in range(args.clients)))
+    return len(latencies), errors, latencies
+
+
+async def _reset_redis(url: str):
+    import redis.asyncio as aioredis
+
+    client = aioredis.from_url(url)
+    try:
+        keys = [k async for k in client.scan_iter("proxmox-cloud:*")]
+        if keys:
+            await client.delete(*keys)
+    finally:
+        await client.aclose()
+
+
+def _run_workers(workers: int, args: argparse.Namespace) -> dict:
+    stats_dir = tempfile.mkdtemp(prefix="bench-workers-")
+    env = dict(
+        os.environ,
+        BENCH_QEMU=str(args.qemu), BENCH_LXC=str(args.lxc), BENCH_LATENCY=str(args.latency),
+        BENCH_STATS_DIR=stats_dir, METRICS_ENABLED="false",
+        INVENTORY_TTL=str(args.ttl),
+        INVENTORY_SHARED="true" if args.redis else "false",
+    )
+    if args.redis:
+        env["REDIS_URL"] = args.redis
+        asyncio.run(_reset_redis(args.redis))
+    base = f"http://127.0.0.1:{args.port}"
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "bench.api_app:app", "--port", str(args.port),
+         "--workers", str(workers), "--log-level", "warning"],
+        env=env,
+    )
+    try:
+        async def measure():
+            async with httpx.AsyncClient(base_url=base) as client:
+                await _wait_ready(client)
+            # Прогрев: ведущий выбран, снимок опубликован, кэши ответов заполнены
+            await _load(base, argparse.Namespace(**{**vars(args), "duration": args.warmup}), vmids)
+            started = time.perf_counter()
+            result = await _load(base, args, vmids)
+            return result, time.perf_counter() - started
+
+        vmids = list(range(100, 100 + args.qemu + args.lxc))
+        (ok, errors, latencies), elapsed = asyncio.run(measure())
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+    reports = [json.load(open(path)) for path in glob.glob(os.path.join(stats_dir, "*.json"))]
+    return {
+        "workers": workers,
+        "rps": ok / elapsed,
+        "errors": errors,
+        "p50": _percentile(latencies, 50),
+        "p95": _percentile(latencies, 95),
+        "proxmox": sum(r["proxmox_calls"] for r in reports),
+        "cluster": sum(r["cluster_calls"] for r in reports),
+        "leaders": sum(1 for r in reports if r["leader"]),
+        "reported": len(reports),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="числа воркеров для прогонов")
+    parser.add_argument("--redis", default=None, help="Redis для общего режима (без него — воркеры независимы)")
+    parser.add_argument("--clients", type=int, default=32, help="одновременных клиентов")
+    parser.add_argument("--duration", type=float, default=10.0, help="длительность замера, с")
+    parser.add_argument("--warmup", type=float, default=3.0, help="прогрев перед замером, с")
+    parser.add_argument("--detail-share", type=float, default=0.2, help="доля запросов карточки гостя")
+    parser.add_argument("--qemu", type=int, default=500, help="число VM в заглушке")
+    parser.add_argument("--lxc", type=int, default=500, help="число LXC в заглушке")
+    parser.add_argument("--latency", type=float, default=5.0, help="задержка ответа Proxmox, мс")
+    parser.add_argument("--ttl", type=float, default=10.0, help="INVENTORY_TTL воркеров, с")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"{'mode':>8} {'workers':>7} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'errors':>6} "
+          f"{'proxmox':>8} {'cluster':>8} {'leaders':>7}")
+    for workers in args.workers:
+        r = _run_workers(workers, args)
+        print(f"{'shared' if args.redis else 'separate':>8} {r['workers']:>7} {r['rps']:>9.0f} {r['p50']:>8.1f} "
+              f"{r['p95']:>8.1f} {r['errors']:>6} {r['proxmox']:>8} {r['cluster']:>8} {r['leaders']:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,9 +2,15 @@ import { useState, useEffect } from "react";
 import { api, removeToken } from "../api";
 import { useNavigate } from "react-router-dom";
 
+const PAGE_SIZE = 50;
+
 export default function Dashboard() {
   const [vms, setVMs] = useState([]);
+  const [cursor, setCursor] = useState(null);
+  const [total, setTotal] = useState(0);
   const [loading, setLoading] = useState(true);
+  // Возраст данных в секундах, если Proxmox не ответил и список из последнего снимка
+  const [staleAge, setStaleAge] = useState(null);
   const [name, setName] = useState("");
   const [vmType, setVmType] = useState("qemu");
   const [os, setOs] = useState("ubuntu-22.04");
@@ -16,11 +22,13 @@ export default function Dashboard() {
   const fetchVMs = async () => {
     try {
       setLoading(true);
-      const [resQEMU, resLXC] = await Promise.all([
-        api.get("/vms/"),
-        api.get("/lxc/"),
-      ]);
-      setVMs([...(resQEMU.data || []), ...(resLXC.data || [])]);
+      // VM и LXC одним запросом
+      const res = await api.get("/guests/", { params: { limit: PAGE_SIZE } });
+      setVMs(res.data?.items || []);
+      setCursor(res.data?.next_cursor);
+      setTotal(res.data?.total || 0);
+      const stale = res.headers["x-inventory-stale"];
+      setStaleAge(stale === undefined ? null : parseInt(stale));
     } catch (err) {
       console.error("Failed to fetch VMs:", err);
     } finally {
@@ -28,6 +36,16 @@ export default function Dashboard() {
     }
   };
 
+  const loadMore = async () => {
+    try {
+      const res = await api.get("/guests/", { params: { limit: PAGE_SIZE, cursor } });
+      setVMs((prev) => [...prev, ...(res.data?.items || [])]);
+      setCursor(res.data?.next_cursor);
+    } catch (err) {
+      console.error("Failed to load more VMs:", err);
+    }
+  };
+
   const createVM = async (e) => {
     e.preventDefault();
     try {
@@ -47,21 +65,19 @@ export default function Dashboard() {
     }
   };
 
-  const deleteVM = async (vmid, type) => {
+  const deleteVM = async (vmid) => {
     if (!confirm(`Are you sure you want to delete VM ${vmid}?`)) return;
     try {
-      const endpoint = type === "qemu" ? `/vms/${vmid}` : `/lxc/${vmid}`;
-      await api.delete(endpoint);
+      await api.delete(`/guests/${vmid}`);
       fetchVMs();
     } catch (err) {
       alert(`Failed to delete: ${err.response?.data?.detail || err.message}`);
     }
   };
 
-  const toggleVM = async (vmid, type, action) => {
+  const toggleVM = async (vmid, action) => {
     try {
-      const endpoint = type === "qemu" ? `/vms/${vmid}/${action}` : `/lxc/${vmid}/${action}`;
-      await api.post(endpoint);
+      await api.post(`/guests/${vmid}/${action}`);
       fetchVMs();
     } catch (err) {
       alert(`Failed to ${action}: ${err.response?.data?.detail || err.message}`);
@@ -142,6 +158,12 @@ export default function Dashboard() {
         </div>
       </form>
 
+      {staleAge !== null && (
+        <p style={{ padding: "8px 12px", backgroundColor: "#fff3cd", border: "1px solid #ffe69c", borderRadius: "4px" }}>
+          ⚠️ Proxmox is not responding: showing data from {staleAge}s ago, refreshing in the background.
+        </p>
+      )}
+
       {loading ? (
         <p>Loading...</p>
       ) : (
@@ -189,15 +211,15 @@ export default function Dashboard() {
                   </td>
                   <td>
                     {vm.status !== "running" ? (
-                      <button onClick={() => toggleVM(vm.vmid, vm.type, "start")} style={{ marginRight: "5px", padding: "4px 8px", backgroundColor: "#28a745", color: "white", border: "none", borderRadius: "4px", cursor: "pointer" }}>
+                      <button onClick={() => toggleVM(vm.vmid, "start")} style={{ marginRight: "5px", padding: "4px 8px", backgroundColor: "#28a745", color: "white", border: "none", borderRadius: "4px", cursor: "pointer" }}>
                         Start
                       </button>
                     ) : (
-                      <button onClick={() => toggleVM(vm.vmid, vm.type, "stop")} style={{ marginRight: "5px", padding: "4px 8px", backgroundColor: "#dc3545", color: "white", border: "none", borderRadius: "4px", cursor: "pointer" }}>
+                      <button onClick={() => toggleVM(vm.vmid, "stop")} style={{ marginRight: "5px", padding: "4px 8px", backgroundColor: "#dc3545", color: "white", border: "none", borderRadius: "4px", cursor: "pointer" }}>
                         Stop
                       </button>
                     )}
-                    <button onClick={() => deleteVM(vm.vmid, vm.type)} style={{ padding: "4px 8px", backgroundColor: "#6c757d", color: "white", border: "none", borderRadius: "4px", cursor: "pointer" }}>
+                    <button onClick={() => deleteVM(vm.vmid)} style={{ padding: "4px 8px", backgroundColor: "#6c757d", color: "white", border: "none", borderRadius: "4px", cursor: "pointer" }}>
                       Delete
                     </button>
                   </td>
@@ -207,6 +229,17 @@ export default function Dashboard() {
           </tbody>
         </table>
       )}
+
+      {!loading && (
+        <div style={{ marginTop: "10px", display: "flex", justifyContent: "space-between", alignItems: "center" }}>
+          <span>Shown {vms.length} of {total}</span>
+          {cursor && (
+            <button onClick={loadMore} style={{ padding: "8px 16px", backgroundColor: "#007bff", color: "white", border: "none", borderRadius: "4px", cursor: "pointer" }}>
+              Load more
+            </button>
+          )}
+        </div>
+      )}
     </div>
   );
 }